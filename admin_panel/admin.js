@@ -0,0 +1,47 @@
+// Админ-панель: выгрузки через API
+const tg = window.Telegram && window.Telegram.WebApp;
+
+// Скачивание выгрузки: одноразовый токен по заголовку initData, затем ссылка с токеном
+// (initData в адрес не кладем - он попадет в журналы и историю браузера)
+async function downloadExport(dataset, format) {
+    if (!tg || !tg.initData) {
+        alert('Откройте панель из Telegram');
+        return;
+    }
+
+    try {
+        const response = await fetch(`/api/admin/export/${dataset}/token?format=${encodeURIComponent(format)}`, {
+            method: 'POST',
+            headers: {
+                'X-Telegram-Init-Data': tg.initData
+            }
+        });
+        if (!response.ok) {
+            const error = await response.json().catch(() => ({}));
+            throw new Error(error.detail || `HTTP ${response.status}`);
+        }
+        const { token } = await response.json();
+
+        const url = `/api/admin/export/${dataset}?format=${encodeURIComponent(format)}&token=${encodeURIComponent(token)}`;
+        if (tg.downloadFile) {
+            // Клиенты Telegram с Bot API 8.0+ скачивают файл сами
+            const extension = format === 'csv' ? 'csv' : format === 'columnar' ? 'columnar.jsonl' : 'ndjson';
+            tg.downloadFile({ url: new URL(url, window.location.origin).href, file_name: `${dataset}.${extension}` });
+        } else {
+            window.location.href = url;
+        }
+    } catch (error) {
+        console.error(`Ошибка выгрузки ${dataset}:`, error);
+        alert(`Не удалось выгрузить ${dataset}: ${error.message}`);
+    }
+}
+
+function exportOrders() {
+    return downloadExport('orders', 'csv');
+}
+
+async function exportData() {
+    for (const dataset of ['menu', 'orders', 'loyalty']) {
+        await downloadExport(dataset, 'ndjson');
+    }
+}
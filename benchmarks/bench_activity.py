@@ -0,0 +1,79 @@
+"""Бенчмарк: запись активности на /start - register_user на каждый вызов против ActivityTracker
+
+Пользователи в основном уже зарегистрированы (повторные /start), доля
+новых задается --new-share. Печатаются задержки, число коммитов и
+проверяется, что после сброса last_active совпадает у обоих способов.
+
+Запуск: python -m benchmarks.bench_activity --calls 20000 --users 2000 --concurrency 32
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from datetime import datetime
+
+from benchmarks.common import FakeUser, report, temp_db_path
+from bot.activity import ActivityTracker
+from bot.database import Database
+
+
+async def run(db: Database, touch, people, calls: int, concurrency: int, new_share: float, fresh_ids):
+    rng = random.Random(6)
+    latencies = []
+    touched = set()
+    remaining = iter(range(calls))
+
+    async def worker():
+        for _ in remaining:
+            user = FakeUser(next(fresh_ids)) if rng.random() < new_share else rng.choice(people)
+            started = time.perf_counter()
+            await touch(user)
+            latencies.append(time.perf_counter() - started)
+            touched.add(user.id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - started, latencies, touched
+
+
+async def main(calls: int, users: int, concurrency: int, new_share: float, interval: float):
+    temp_db_path("activity.db")
+    db = Database()
+    await db.open()
+    try:
+        people = [FakeUser(900000 + i) for i in range(users)]
+        for user in people:
+            await db.register_user(user)
+        fresh_ids = itertools.count(5_000_000)
+
+        commits = db.pool.commits
+        elapsed, latencies, _ = await run(db, db.register_user, people, calls, concurrency, new_share, fresh_ids)
+        report("register_user на каждый /start", calls, elapsed, latencies)
+        print(f"    коммитов: {db.pool.commits - commits}")
+
+        tracker = ActivityTracker(db, interval=interval)
+        tracker.start()
+        commits = db.pool.commits
+        before = datetime.now()
+        elapsed, latencies, touched = await run(db, tracker.touch, people, calls, concurrency, new_share, fresh_ids)
+        await tracker.stop()
+        report("ActivityTracker.touch", calls, elapsed, latencies)
+        print(f"    коммитов: {db.pool.commits - commits}, {tracker.stats()}")
+
+        async with db.connect() as conn:
+            cursor = await conn.execute("SELECT COUNT(*) FROM users WHERE last_active >= ?", (before,))
+            print(f"    last_active обновлен у {(await cursor.fetchone())[0]} из {len(touched)} пользователей")
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--new-share", type=float, default=0.02, help="доля новых пользователей")
+    parser.add_argument("--interval", type=float, default=1.0, help="интервал сброса, с")
+    args = parser.parse_args()
+    asyncio.run(main(args.calls, args.users, args.concurrency, args.new_share, args.interval))
@@ -0,0 +1,160 @@
+"""Бенчмарк статистики админа: запросы по orders/users за день против дневного свода
+
+База заполняется benchmarks.seed (или берется готовая через --db).
+Сравниваются задержки прежнего get_admin_stats (воспроизведен как есть)
+и нового, читающего daily_stats. Затем идет смешанная нагрузка
+(регистрации, заказы, смена статусов, в том числе у заказов прошлых
+дней) и проверяется, что инкрементально обновленный свод совпадает с
+пересчетом по истории, а сегодняшние цифры - с прежними запросами.
+
+Запуск: python -m benchmarks.bench_admin_stats --seed-users 200000 --calls 200
+"""
+import argparse
+import asyncio
+import itertools
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from benchmarks.common import FakeUser, make_order, place_order, report, temp_db_path
+from benchmarks.seed import seed
+from bot.daily_stats import STATUS_BUCKETS
+from bot.database import Database
+from config.settings import settings
+
+
+async def legacy_stats(db: Database):
+    async with db.connect() as conn:
+        today = datetime.now().date()
+        tomorrow = today + timedelta(days=1)
+        cursor = await conn.execute('''
+                                    SELECT COUNT(*)                                                          as total_orders,
+                                           SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END)               as new_orders,
+                                           SUM(CASE
+                                                   WHEN status IN ('confirmed', 'preparing', 'on_delivery') THEN 1
+                                                   ELSE 0 END)                                               as processing_orders,
+                                           SUM(CASE WHEN status IN ('delivered', 'ready') THEN 1 ELSE 0 END) as completed_orders,
+                                           COALESCE(SUM(total_amount), 0)                                    as revenue,
+                                           COALESCE(AVG(total_amount), 0)                                    as avg_order
+                                    FROM orders
+                                    WHERE created_at >= ?
+                                      AND created_at < ?
+                                    ''', (today.isoformat(), tomorrow.isoformat()))
+        stats = dict(await cursor.fetchone())
+        cursor = await conn.execute('''
+                                    SELECT COUNT(*) as new_users
+                                    FROM users
+                                    WHERE created_at >= ?
+                                      AND created_at < ?
+                                    ''', (today.isoformat(), tomorrow.isoformat()))
+        stats.update(dict(await cursor.fetchone()))
+        # Окно в календарных днях, как у свода: сегодня и 6 предыдущих
+        cursor = await conn.execute('''
+                                    SELECT COUNT(DISTINCT user_id) as active_users
+                                    FROM orders
+                                    WHERE created_at >= ?
+                                    ''', ((today - timedelta(days=6)).isoformat(),))
+        stats.update(dict(await cursor.fetchone()))
+        return stats
+
+
+async def timed(title: str, call, calls: int):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(calls):
+        call_started = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - call_started)
+    report(title, calls, time.perf_counter() - started, latencies)
+
+
+async def daily_rows(db: Database):
+    async with db.connect() as conn:
+        cursor = await conn.execute("SELECT * FROM daily_stats ORDER BY day")
+        return [tuple(row) for row in await cursor.fetchall()]
+
+
+def same(left, right) -> bool:
+    if isinstance(left, float) or isinstance(right, float):
+        return math.isclose(left or 0, right or 0, rel_tol=1e-9, abs_tol=1e-6)
+    return (left or 0) == (right or 0)
+
+
+async def load(db: Database, rng: random.Random, operations: int):
+    """Регистрации, заказы и смена статусов вперемешку"""
+    fresh_ids = itertools.count(50_000_000)
+    items = await db.get_all_menu_items()
+    customers = []
+    async with db.connect() as conn:
+        cursor = await conn.execute("SELECT telegram_id FROM users ORDER BY RANDOM() LIMIT 500")
+        customers = [row[0] for row in await cursor.fetchall()]
+        cursor = await conn.execute("SELECT MAX(id) FROM orders")
+        max_order = (await cursor.fetchone())[0] or 0
+    statuses = list(STATUS_BUCKETS) + ['unknown']
+    created = []
+
+    for _ in range(operations):
+        roll = rng.random()
+        if roll < 0.15:
+            user = FakeUser(next(fresh_ids))
+            await db.register_user(user)
+            customers.append(user.id)
+        elif roll < 0.25:
+            users = [FakeUser(next(fresh_ids)) for _ in range(3)] + [FakeUser(rng.choice(customers))]
+            await db.touch_users([(user.id, user.username, user.first_name, user.last_name, datetime.now())
+                                  for user in users])
+        elif roll < 0.65:
+            created.append(await place_order(db, rng.choice(customers), make_order(rng, items)))
+        elif created and roll < 0.85:
+            await db.update_order_status(rng.choice(created), rng.choice(statuses))
+        elif max_order:
+            # Заказ одного из прошлых дней
+            await db.update_order_status(rng.randint(1, max_order), rng.choice(statuses))
+
+
+async def main(path: Optional[str], seed_users: int, calls: int, operations: int):
+    if path is None:
+        path = temp_db_path("admin_stats.db")
+        seed(path, seed_users)
+    settings.DATABASE_PATH = path
+
+    db = Database()
+    await db.open()
+    try:
+        await timed("прежний get_admin_stats", lambda: legacy_stats(db), calls)
+        await timed("get_admin_stats (свод)", db.get_admin_stats, calls)
+
+        await load(db, random.Random(25), operations)
+
+        incremental = await daily_rows(db)
+        stats = await db.get_admin_stats()
+        expected = await legacy_stats(db)
+        await db.rebuild_daily_stats()
+        rebuilt = await daily_rows(db)
+    finally:
+        await db.close()
+
+    mismatched = [
+        (left, right) for left, right in itertools.zip_longest(incremental, rebuilt)
+        if left is None or right is None or not all(same(a, b) for a, b in zip(left, right))
+    ]
+    for left, right in mismatched[:5]:
+        print(f"    свод {left} != пересчет {right}")
+    differs = {key: (stats[key], value) for key, value in expected.items() if not same(stats[key], value)}
+    print(f"после {operations} операций: дней в своде {len(incremental)}, расхождений с пересчетом "
+          f"{len(mismatched)}, с прежними запросами {differs or 0}")
+    print(f"    {stats}")
+    if mismatched or differs:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="готовая база из benchmarks.seed (по умолчанию - временная)")
+    parser.add_argument("--seed-users", type=int, default=200000, help="пользователей во временной базе")
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--operations", type=int, default=3000, help="операций смешанной нагрузки")
+    args = parser.parse_args()
+    asyncio.run(main(args.db, args.seed_users, args.calls, args.operations))
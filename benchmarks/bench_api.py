@@ -0,0 +1,94 @@
+"""Нагрузочный тест API Mini App: запросов в секунду по каждому эндпоинту
+
+Приложение вызывается в процессе через ASGI-транспорт httpx, без сети.
+
+Запуск: python -m benchmarks.bench_api --requests 3000 --concurrency 32
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from benchmarks.common import FakeUser, make_order, place_order, report, signed_init_data, temp_db_path
+from bot.api import create_app
+from bot.database import Database
+from bot.loyalty import LoyaltySystem
+from config.settings import settings
+
+
+async def hammer(client: httpx.AsyncClient, path: str, requests: int, concurrency: int, headers_for, body=None):
+    latencies = []
+    statuses = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            if body is None:
+                response = await client.get(path, headers=headers_for(i))
+            else:
+                response = await client.post(path, headers=headers_for(i), json=body)
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return time.perf_counter() - started, latencies, statuses
+
+
+async def main(requests: int, concurrency: int, users: int):
+    temp_db_path("api.db")
+    db = Database()
+    loyalty = LoyaltySystem(db)
+    await db.open()
+    try:
+        rng = random.Random(5)
+        people = [FakeUser(400000 + i) for i in range(users)]
+        items = await db.get_all_menu_items()
+        for user in people:
+            await db.register_user(user)
+            for _ in range(3):
+                await place_order(db, user.id, make_order(rng, items))
+
+        init_data = [signed_init_data(user.id, settings.BOT_TOKEN) for user in people]
+        app = create_app(db, loyalty)
+        transport = httpx.ASGITransport(app=app)
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            etag = (await client.get("/api/menu")).headers["etag"]
+
+            signed = lambda i: {"X-Telegram-Init-Data": init_data[i % users]}
+            cart = {
+                "items": [{"id": item["id"], "quantity": 2} for item in items[:4]],
+                "delivery_type": "delivery",
+                "points_to_use": 100
+            }
+
+            scenarios = [
+                ("/api/menu", lambda i: {}, None),
+                ("/api/menu (If-None-Match)", lambda i: {"If-None-Match": etag}, None),
+                ("/api/menu/categories", lambda i: {}, None),
+                ("/api/user/profile", signed, None),
+                ("/api/user/loyalty", signed, None),
+                ("/api/user/orders", signed, None),
+                ("/api/cart/quote", signed, cart),
+            ]
+            for title, headers_for, body in scenarios:
+                path = title.split(" ")[0]
+                elapsed, latencies, statuses = await hammer(client, path, requests, concurrency, headers_for, body)
+                report(title, requests, elapsed, latencies)
+                print(f"    statuses: {statuses}")
+            print(f"initData cache: {app.state.verifier.stats()}")
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.users))
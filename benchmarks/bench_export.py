@@ -0,0 +1,86 @@
+"""Бенчмарк выгрузок: export_stream по страницам против fetchall всей таблицы
+
+База заполняется benchmarks.seed (или берется готовая через --db). Для
+каждого набора и формата строки выгружаются в /dev/null потоково,
+печатаются скорость и пик анонимной памяти процесса (RssAnon, замер на
+каждой странице). В нее входит и страничный кэш SQLite читателей
+(DB_CACHE_SIZE на соединение), он ограничен настройкой, а не таблицей.
+Затем для сравнения первый набор читается одним fetchall и
+сериализуется целиком, как прежний export_menu_to_json.
+
+Запуск: python -m benchmarks.seed --db /tmp/coffee_load.db --users 1000000
+        python -m benchmarks.bench_export --db /tmp/coffee_load.db
+"""
+import argparse
+import asyncio
+import json
+import os
+from typing import List, Optional, Tuple
+
+from benchmarks.common import Timer, temp_db_path
+from benchmarks.seed import seed
+from bot.database import Database
+from bot.export import DATASETS, FORMATS, export_stream
+from config.settings import settings
+
+
+def anon_rss_mb() -> float:
+    """Анонимная память процесса (Linux): без файла базы, отображенного через mmap"""
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('RssAnon:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def legacy_export(db: Database, dataset: str) -> Tuple[int, float]:
+    columns = DATASETS[dataset].columns
+    query = DATASETS[dataset].query.replace("LIMIT ?", "")
+    async with db.connect() as conn:
+        cursor = await conn.execute(query, (0,))
+        rows = [dict(zip(columns, row)) for row in await cursor.fetchall()]
+    body = json.dumps(rows, ensure_ascii=False).encode()
+    with open(os.devnull, 'wb') as file:
+        file.write(body)
+    return len(rows), anon_rss_mb()
+
+
+async def main(path: Optional[str], seed_users: int, datasets: List[str], page_size: int):
+    if path is None:
+        path = temp_db_path("export.db")
+        seed(path, seed_users)
+    settings.DATABASE_PATH = path
+
+    db = Database()
+    await db.open()
+    try:
+        print(f"анонимная память до выгрузок: {anon_rss_mb():.0f} MiB")
+        for dataset in datasets:
+            for fmt in FORMATS:
+                written = 0
+                peak = 0.0
+                with Timer() as timer, open(os.devnull, 'wb') as file:
+                    async for chunk in export_stream(db, dataset, fmt, page_size):
+                        written += len(chunk)
+                        file.write(chunk)
+                        peak = max(peak, anon_rss_mb())
+                print(f"{dataset:<8} {fmt:<9} {written / 2 ** 20:9.1f} MiB  {timer.elapsed:7.2f}s  "
+                      f"{written / 2 ** 20 / timer.elapsed:7.1f} MiB/s  пик памяти {peak:.0f} MiB")
+
+        with Timer() as timer:
+            rows, peak = await legacy_export(db, datasets[0])
+        print(f"{datasets[0]:<8} fetchall  {rows:>9} строк  {timer.elapsed:7.2f}s  "
+              f"{rows / timer.elapsed:9.0f} строк/s  пик памяти {peak:.0f} MiB")
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="готовая база из benchmarks.seed (по умолчанию - временная)")
+    parser.add_argument("--seed-users", type=int, default=200000, help="пользователей во временной базе")
+    parser.add_argument("--datasets", default="orders,loyalty")
+    parser.add_argument("--page-size", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.db, args.seed_users, [name for name in args.datasets.split(",") if name],
+                     args.page_size))
@@ -0,0 +1,115 @@
+"""Бенчмарк: статистика лояльности на синтетическом леджере
+
+Сравнивает старый запрос распределения по уровням (коррелированный SUM на
+пользователя) с однопроходной агрегацией по леджеру и по балансам.
+В конце проверяет, что изменение loyalty_levels в обход бота (ручным
+SQL из другого соединения) подхватывается get_levels().
+
+Запуск: python -m benchmarks.bench_loyalty_stats --ledger 1000000 --users 50000
+"""
+import argparse
+import asyncio
+import random
+import sqlite3
+from datetime import datetime, timedelta
+
+from benchmarks.common import Timer, temp_db_path
+from bot.analytics import LoyaltyAnalytics
+from bot.database import Database
+from bot.loyalty import LoyaltySystem
+
+LEGACY_LEVELS_SQL = '''
+    SELECT ll.name,
+           COUNT(DISTINCT u.id) as users_count
+    FROM users u
+             LEFT JOIN loyalty_levels ll ON (SELECT COALESCE(SUM(points), 0)
+                                             FROM loyalty_points lp
+                                             WHERE lp.user_id = u.id) >= ll.min_points
+    GROUP BY ll.name
+    ORDER BY ll.min_points
+'''
+
+
+def seed_ledger(path: str, users: int, ledger: int, seed: int = 11):
+    """Быстрое заполнение users и loyalty_points напрямую через sqlite3"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO users (telegram_id, first_name, created_at) VALUES (?, ?, ?)",
+        ((10_000_000 + i, f"User {i}", start.isoformat(" ")) for i in range(users))
+    )
+
+    def rows():
+        for i in range(ledger):
+            user_id = rng.randint(1, users)
+            points = rng.randint(1, 60) if rng.random() < 0.85 else -rng.randint(1, 40)
+            created = start + timedelta(seconds=i * 30)
+            yield user_id, points, "Заказ", created.isoformat(" ")
+
+    conn.executemany(
+        "INSERT INTO loyalty_points (user_id, points, reason, created_at) VALUES (?, ?, ?, ?)",
+        rows()
+    )
+    conn.commit()
+    conn.close()
+
+
+async def check_level_change(path: str, loyalty: LoyaltySystem) -> bool:
+    """Меняет скидку верхнего уровня через отдельное соединение и ждет ее в get_levels()"""
+    before = await loyalty.get_levels()
+    top = before.names[-1]
+    discount = before.discounts[-1] + 1
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE loyalty_levels SET discount = ? WHERE name = ?", (discount, top))
+
+    cached = await loyalty.get_levels()
+    await asyncio.sleep(loyalty.levels_check_interval)
+    after = await loyalty.get_levels()
+    picked_up = after.discounts[-1] == discount
+    print(f"level change: {top} discount {before.discounts[-1]} -> {discount}, "
+          f"cached {cached.discounts[-1]}, after {loyalty.levels_check_interval}s "
+          f"{after.discounts[-1]} ({'ok' if picked_up else 'FAIL'})")
+    return picked_up
+
+
+async def main(users: int, ledger: int, legacy: bool):
+    path = temp_db_path("loyalty_stats.db")
+    db = Database()
+    with Timer() as timer:
+        seed_ledger(path, users, ledger)
+    print(f"seed: {users} users, {ledger} ledger rows in {timer.elapsed:.1f}s")
+
+    await db.open()
+    loyalty = LoyaltySystem(db, levels_check_interval=0.2)
+    try:
+        with Timer() as timer:
+            result = await loyalty.reconcile_balances()
+        print(f"rebuild balances: {timer.elapsed:.3f}s (drift rows: {len(result['drift'])})")
+
+        if legacy:
+            async with db.connect() as conn:
+                with Timer() as timer:
+                    cursor = await conn.execute(LEGACY_LEVELS_SQL)
+                    await cursor.fetchall()
+            print(f"{'legacy correlated query':<28} {timer.elapsed:8.3f}s")
+
+        for source in LoyaltyAnalytics.SOURCES:
+            with Timer() as timer:
+                stats = await loyalty.get_loyalty_stats(source)
+            print(f"{'single pass, ' + source:<28} {timer.elapsed:8.3f}s  "
+                  f"outstanding={stats['points_outstanding']} users={sum(l['users'] for l in stats['levels'])}")
+
+        if not await check_level_change(path, loyalty):
+            raise SystemExit(1)
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--ledger", type=int, default=1000000)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.users, args.ledger, not args.skip_legacy))
@@ -0,0 +1,55 @@
+"""Бенчмарк: задержка callback category_* с кэшем меню и без него
+
+Запуск: python -m benchmarks.bench_menu_cache --calls 20000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.common import report, temp_db_path
+from bot.database import Database
+
+
+async def category_callback(db: Database, category: str) -> str:
+    """То же, что делает show_category_items до отправки сообщения"""
+    items = await db.get_menu_items_by_category(category)
+    text = f"*{category.capitalize()}*\n\n"
+    for item in items[:5]:
+        text += f"• *{item['name']}* - {item['price']}₽\n"
+    return text
+
+
+async def run(db: Database, calls: int):
+    rng = random.Random(3)
+    categories = list(await db.get_menu_categories())
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(calls):
+        call_started = time.perf_counter()
+        await db.get_menu_categories()
+        await category_callback(db, rng.choice(categories))
+        latencies.append(time.perf_counter() - call_started)
+    return time.perf_counter() - started, latencies
+
+
+async def main(calls: int):
+    temp_db_path("menu_cache.db")
+    db = Database()
+    await db.open()
+    try:
+        for enabled in (False, True):
+            db.menu_cache.enabled = enabled
+            db.menu_cache.hits = db.menu_cache.misses = 0
+            elapsed, latencies = await run(db, calls)
+            report(f"callback, cache {'on' if enabled else 'off'}", calls, elapsed, latencies)
+            print(f"    {db.menu_cache.stats()}")
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(main(args.calls))
@@ -0,0 +1,121 @@
+"""Бенчмарк большой выгрузки меню: response.json() целиком против потокового разбора
+
+Локальный aiohttp-сервер отдает сгенерированную выгрузку (--items позиций
+с модификаторами и картинками) кусками, как большой внешний API.
+Буферный вариант читает ответ в память и вызывает sync_menu_from_external,
+потоковый - MenuSyncWorker.sync_once. Для каждого печатаются время и
+пик памяти Python (tracemalloc) на первой загрузке и на повторе без
+изменений; количество позиций в базе сверяется с выгрузкой.
+
+Запуск: python -m benchmarks.bench_menu_feed --items 100000
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+import tracemalloc
+from contextlib import closing
+
+from aiohttp import web
+
+from benchmarks.common import Timer, temp_db_path
+from bot.database import Database
+from bot.http_client import HttpClient
+from bot.menu_sync import MenuSyncWorker
+
+CATEGORIES = ("coffee", "tea", "desserts", "sandwiches", "seasonal")
+
+
+def feed_item(index: int) -> dict:
+    return {
+        "external_id": f"feed-{index}",
+        "name": f"Позиция {index}",
+        "description": f"Описание позиции {index} из большой выгрузки поставщика",
+        "price": 100 + index % 400,
+        "available": index % 50 != 0,
+        "category": CATEGORIES[index % len(CATEGORIES)],
+        "image": f"https://cdn.example.com/menu/{index}.jpg",
+        "modifiers": [{"name": f"Добавка {m}", "price": 20 + m * 10} for m in range(index % 4)]
+    }
+
+
+async def serve_feed(request: web.Request) -> web.StreamResponse:
+    items = request.app['items']
+    response = web.StreamResponse(headers={'Content-Type': 'application/json'})
+    await response.prepare(request)
+    chunk = ['[']
+    for index in range(items):
+        if index:
+            chunk.append(',')
+        chunk.append(json.dumps(feed_item(index), ensure_ascii=False))
+        if len(chunk) >= 500:
+            await response.write(''.join(chunk).encode())
+            chunk = []
+    chunk.append(']')
+    await response.write(''.join(chunk).encode())
+    await response.write_eof()
+    return response
+
+
+async def buffered_sync(db: Database, http: HttpClient, url: str):
+    async with http.session.get(url) as response:
+        menu_data = await response.json()
+    return await db.sync_menu_from_external(menu_data)
+
+
+def menu_counts(path: str):
+    with closing(sqlite3.connect(path)) as conn:
+        return conn.execute("SELECT COUNT(*), SUM(available) FROM menu_items WHERE external_id IS NOT NULL").fetchone()
+
+
+async def main(items: int, batch: int, port: int):
+    app = web.Application()
+    app['items'] = items
+    app.router.add_get('/menu', serve_feed)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    url = f"http://127.0.0.1:{port}/menu"
+    expected = (items, sum(1 for index in range(items) if index % 50 != 0))
+
+    http = HttpClient(timeout=300)
+    try:
+        for title, make_sync in (
+                ("response.json()", lambda db: lambda: buffered_sync(db, http, url)),
+                ("потоковый разбор", lambda db: MenuSyncWorker(db, http, url, batch_size=batch).sync_once)):
+            print(f"-- {title}")
+            # Время и память меряются на разных базах: tracemalloc замедляет в разы
+            for traced in (False, True):
+                path = temp_db_path(f"menu_feed_{len(title)}_{int(traced)}.db")
+                db = Database()
+                await db.open()
+                try:
+                    sync = make_sync(db)
+                    for run in ("первая загрузка", "повтор без изменений"):
+                        if traced:
+                            tracemalloc.start()
+                        with Timer() as timer:
+                            result = await sync()
+                        if traced:
+                            _, peak = tracemalloc.get_traced_memory()
+                            tracemalloc.stop()
+                            print(f"{run:<24} пик памяти {peak / 2 ** 20:7.1f} MiB")
+                        else:
+                            print(f"{run:<24} {timer.elapsed * 1000:9.1f} ms  {result}")
+                finally:
+                    await db.close()
+
+                counts = menu_counts(path)
+                assert counts == expected, f"{title}: в базе {counts}, ожидалось {expected}"
+    finally:
+        await http.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=500, help="позиций на транзакцию")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    asyncio.run(main(args.items, args.batch, args.port))
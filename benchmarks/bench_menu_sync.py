@@ -0,0 +1,113 @@
+"""Бенчмарк синхронизации меню: построчный вариант против сравнения по хешу
+
+Старый вариант (SELECT и UPDATE/INSERT на каждую позицию) воспроизведен
+как есть. Прогоны: первая загрузка, повтор без изменений и выгрузка,
+где часть позиций изменилась, а часть пропала. Отдельно проверяется, что
+некорректные позиции выгрузки пропускаются, но не выключаются.
+
+Запуск: python -m benchmarks.bench_menu_sync --items 5000 --changed 0.02 --removed 0.01
+"""
+import argparse
+import asyncio
+import random
+from datetime import datetime
+
+from benchmarks.common import Timer, temp_db_path
+from bot.database import Database
+
+
+async def legacy_sync(db: Database, menu_data):
+    async with db.transaction() as conn:
+        for item in menu_data:
+            if not item.get('external_id'):
+                continue
+            cursor = await conn.execute("SELECT id FROM menu_items WHERE external_id = ?", (item['external_id'],))
+            if await cursor.fetchone():
+                await conn.execute(
+                    "UPDATE menu_items SET name = ?, description = ?, price = ?, available = ?, updated_at = ? "
+                    "WHERE external_id = ?",
+                    (item['name'], item.get('description', ''), item['price'], item.get('available', 1),
+                     datetime.now(), item['external_id'])
+                )
+            else:
+                category_id = await db.get_or_create_category(conn, item.get('category', 'other'))
+                await conn.execute(
+                    "INSERT INTO menu_items (category_id, name, description, price, available, external_id, "
+                    "sync_enabled) VALUES (?, ?, ?, ?, ?, ?, 1)",
+                    (category_id, item['name'], item.get('description', ''), item['price'],
+                     item.get('available', 1), item['external_id'])
+                )
+    db.invalidate_menu()
+
+
+def make_feed(items: int):
+    categories = ['coffee', 'tea', 'bakery', 'dessert', 'food', 'seasonal']
+    return [
+        {'external_id': f"ext-{i}", 'name': f"Позиция {i}", 'description': f"Описание {i}",
+         'price': 100 + i % 400, 'available': 1, 'category': categories[i % len(categories)]}
+        for i in range(items)
+    ]
+
+
+def mutate(feed, changed: float, removed: float, seed: int = 9):
+    rng = random.Random(seed)
+    result = []
+    for item in feed:
+        roll = rng.random()
+        if roll < removed:
+            continue
+        if roll < removed + changed:
+            item = dict(item, price=item['price'] + 10)
+        result.append(item)
+    return result
+
+
+async def run(title: str, sync, db: Database, feed):
+    commits = db.pool.commits
+    with Timer() as timer:
+        result = await sync(db, feed)
+    line = f"{title:<34} {timer.elapsed * 1000:9.1f} ms"
+    if result:
+        line += f"  {result}"
+    print(line + f"  menu v{db.menu_cache.version}, коммитов {db.pool.commits - commits}")
+
+
+async def main(items: int, changed: float, removed: float):
+    feed = make_feed(items)
+    updated = mutate(feed, changed, removed)
+
+    for title, sync in (("построчно", legacy_sync),
+                        ("по хешу", lambda db, data: db.sync_menu_from_external(data))):
+        temp_db_path(f"menu_sync_{len(title)}.db")
+        db = Database()
+        await db.open()
+        try:
+            print(f"-- {title}")
+            await run("первая загрузка", sync, db, feed)
+            await run("повтор без изменений", sync, db, feed)
+            await run(f"изменено {changed:.0%}, пропало {removed:.0%}", sync, db, updated)
+        finally:
+            await db.close()
+
+    # Некорректные позиции пропускаются, но не выключаются как пропавшие
+    temp_db_path("menu_sync_invalid.db")
+    db = Database()
+    await db.open()
+    try:
+        await db.sync_menu_from_external(feed)
+        broken = [dict(item, price='n/a') if i % 100 == 0 else item for i, item in enumerate(feed)]
+        result = await db.sync_menu_from_external(broken)
+        print(f"-- с некорректными позициями: {result}")
+        if result['removed'] or result['skipped'] != len(range(0, len(feed), 100)):
+            raise SystemExit(1)
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--changed", type=float, default=0.02)
+    parser.add_argument("--removed", type=float, default=0.01)
+    args = parser.parse_args()
+    asyncio.run(main(args.items, args.changed, args.removed))
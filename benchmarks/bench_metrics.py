@@ -0,0 +1,88 @@
+"""Бенчмарк: накладные расходы замеров и стоимость сборки /metrics
+
+Сравнивается пустая корутина и чтения из базы без обертки и с оберткой
+MetricsRegistry.timed; затем весь Database оборачивается instrument()
+и замеряется выдача /metrics через ASGI (с токеном METRICS_TOKEN;
+без него и с неверным токеном ожидается 401).
+
+Запуск: python -m benchmarks.bench_metrics --calls 100000
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.common import report, temp_db_path
+from bot.api import create_app
+from bot.database import Database
+from bot.loyalty import LoyaltySystem
+from bot.metrics import MetricsRegistry
+from config.settings import settings
+
+
+async def noop():
+    return None
+
+
+async def per_call(title: str, call, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        await call()
+    elapsed = time.perf_counter() - started
+    print(f"{title:<36} {elapsed / calls * 1e6:8.3f} us/call")
+    return elapsed / calls
+
+
+async def main(calls: int, scrapes: int):
+    temp_db_path("metrics.db")
+    db = Database()
+    await db.open()
+    try:
+        registry = MetricsRegistry()
+
+        raw = await per_call("noop", noop, calls)
+        timed = await per_call("noop (timed)", registry.timed(registry.handlers, 'handler', 'noop')(noop), calls)
+        print(f"    накладные расходы: {(timed - raw) * 1e6:.3f} us/call")
+
+        raw = await per_call("db.get_menu", db.get_menu, calls)
+        wrapped = registry.instrument(db, registry.db, 'db')
+        timed = await per_call("db.get_menu (instrumented)", db.get_menu, calls)
+        print(f"    накладные расходы: {(timed - raw) * 1e6:.3f} us/call, обернуто методов: {wrapped}")
+
+        # Наполняем метрики разными методами базы
+        for telegram_id in range(1000):
+            await db.get_user_id(telegram_id)
+        await db.get_menu_categories()
+        registry.collector('menu_cache', db.menu_cache.stats)
+        registry.collector('pool', db.pool.stats)
+
+        settings.METRICS_TOKEN = "bench-metrics"
+        app = create_app(db, LoyaltySystem(db), metrics=registry)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            anonymous = await client.get("/metrics")
+            wrong = await client.get("/metrics", headers={"Authorization": "Bearer wrong"})
+            print(f"GET /metrics без токена: {anonymous.status_code}, с неверным: {wrong.status_code}")
+            if anonymous.status_code != 401 or wrong.status_code != 401:
+                raise SystemExit(1)
+
+            client.headers["Authorization"] = f"Bearer {settings.METRICS_TOKEN}"
+            latencies = []
+            started = time.perf_counter()
+            for _ in range(scrapes):
+                t = time.perf_counter()
+                response = await client.get("/metrics")
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - t)
+            report("GET /metrics", scrapes, time.perf_counter() - started, latencies)
+            print(f"    {len(response.content)} байт, {response.text.count(chr(10))} строк")
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--scrapes", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.calls, args.scrapes))
@@ -0,0 +1,163 @@
+"""Проверка NotificationDispatcher на фейковом боте, который записывает время каждой отправки
+
+Фейковый бот отвечает с задержкой --latency и по сценарию бросает
+RetryAfter, NetworkError, BadRequest или посторонние исключения. Проверяется:
+- отправки в разные чаты идут параллельно;
+- соблюдаются лимиты на чат и на бота;
+- RetryAfter повторяется через указанное время, NetworkError - с экспоненциальной задержкой;
+- BadRequest и посторонние исключения не повторяются и не выходят из задач submit().
+Для сравнения печатается последовательная отправка тех же сообщений.
+
+Запуск: python -m benchmarks.bench_notifications --chats 50 --latency 0.05
+"""
+import argparse
+import asyncio
+import sys
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from bot.notifications import NotificationDispatcher
+
+# Допуск на точность таймеров event loop
+EPSILON = 0.005
+
+
+class RecordingBot:
+    """send_message с задержкой; attempts - время каждой попытки по чатам, delivered - успешных"""
+
+    def __init__(self, latency: float, failures: Optional[Dict[int, List[Callable[[], Exception]]]] = None):
+        self.latency = latency
+        self.failures = failures or {}
+        self.attempts: Dict[int, List[float]] = defaultdict(list)
+        self.delivered: Dict[int, List[float]] = defaultdict(list)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        now = time.monotonic()
+        self.attempts[chat_id].append(now)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            scripted = self.failures.get(chat_id)
+            if scripted:
+                raise scripted.pop(0)()
+            self.delivered[chat_id].append(now)
+        finally:
+            self.in_flight -= 1
+
+
+def gaps(times: List[float]) -> List[float]:
+    times = sorted(times)
+    return [later - earlier for earlier, later in zip(times, times[1:])]
+
+
+class Checks:
+    def __init__(self):
+        self.failed = 0
+
+    def expect(self, condition: bool, title: str, details: str = ""):
+        print(f"{'ok  ' if condition else 'FAIL'} {title}{'  ' + details if details else ''}")
+        if not condition:
+            self.failed += 1
+
+
+async def check_concurrency(checks: Checks, chats: int, latency: float):
+    bot = RecordingBot(latency)
+    dispatcher = NotificationDispatcher(bot, global_rate=0, chat_rate=0)
+    started = time.monotonic()
+    for chat_id in range(chats):
+        dispatcher.submit(chat_id, "Новый заказ")
+    await dispatcher.drain()
+    elapsed = time.monotonic() - started
+
+    sequential = RecordingBot(latency)
+    sequential_started = time.monotonic()
+    for chat_id in range(chats):
+        await sequential.send_message(chat_id=chat_id, text="Новый заказ")
+    sequential_elapsed = time.monotonic() - sequential_started
+
+    checks.expect(bot.max_in_flight == chats and elapsed < latency * 3,
+                  "отправки в разные чаты параллельны",
+                  f"{chats} чатов за {elapsed * 1000:.0f} ms (последовательно {sequential_elapsed * 1000:.0f} ms), "
+                  f"одновременно {bot.max_in_flight}")
+
+
+async def check_chat_rate(checks: Checks, latency: float):
+    rate = 20
+    bot = RecordingBot(latency)
+    dispatcher = NotificationDispatcher(bot, global_rate=0, chat_rate=rate)
+    for index in range(10):
+        dispatcher.submit(1, f"Статус {index}")
+    await dispatcher.drain()
+    smallest = min(gaps(bot.attempts[1]))
+    checks.expect(len(bot.delivered[1]) == 10 and smallest >= 1 / rate - EPSILON,
+                  "лимит на чат", f"минимальный интервал {smallest * 1000:.1f} ms при {rate}/s")
+
+
+async def check_global_rate(checks: Checks, chats: int, latency: float):
+    rate = 200
+    bot = RecordingBot(latency)
+    dispatcher = NotificationDispatcher(bot, global_rate=rate, chat_rate=0)
+    for chat_id in range(chats):
+        dispatcher.submit(chat_id, "Акция")
+    await dispatcher.drain()
+    times = [moment for moments in bot.attempts.values() for moment in moments]
+    smallest = min(gaps(times))
+    checks.expect(smallest >= 1 / rate - EPSILON and bot.max_in_flight > 1,
+                  "лимит на бота", f"минимальный интервал {smallest * 1000:.2f} ms при {rate}/s, "
+                                   f"одновременно {bot.max_in_flight}")
+
+
+async def check_retries(checks: Checks, latency: float):
+    backoff = 0.05
+    bot = RecordingBot(latency, failures={
+        1: [lambda: RetryAfter(0.2)],
+        2: [lambda: NetworkError("timeout"), lambda: NetworkError("timeout")],
+        3: [lambda: NetworkError("timeout")] * 3,
+        4: [lambda: BadRequest("Can't parse entities")],
+        5: [lambda: TypeError("reply_markup is not serializable")],
+    })
+    dispatcher = NotificationDispatcher(bot, global_rate=0, chat_rate=0, max_retries=2, backoff=backoff)
+    tasks = [dispatcher.submit(chat_id, "Заказ готов") for chat_id in range(1, 6)]
+    await dispatcher.drain()
+    results = [task.result() for task in tasks]
+
+    retry_after = gaps(bot.attempts[1])
+    checks.expect(results[0] and retry_after[0] >= 0.2 + latency - EPSILON,
+                  "RetryAfter: повтор через retry_after", f"{retry_after[0] * 1000:.0f} ms")
+
+    network = gaps(bot.attempts[2])
+    expected = [backoff + latency, 2 * backoff + latency]
+    checks.expect(results[1] and all(gap >= bound - EPSILON for gap, bound in zip(network, expected)),
+                  "NetworkError: экспоненциальная задержка",
+                  f"интервалы {[round(gap * 1000) for gap in network]} ms")
+
+    checks.expect(not results[2] and len(bot.attempts[3]) == 3,
+                  "NetworkError: отказ после max_retries", f"попыток {len(bot.attempts[3])}")
+    checks.expect(not results[3] and len(bot.attempts[4]) == 1, "BadRequest без повторов")
+    checks.expect(not results[4] and len(bot.attempts[5]) == 1 and all(task.exception() is None for task in tasks),
+                  "постороннее исключение не выходит из задачи")
+    checks.expect(dispatcher.stats() == {'sent': 2, 'failed': 3, 'pending': 0},
+                  "статистика", str(dispatcher.stats()))
+
+
+async def main(chats: int, latency: float) -> int:
+    checks = Checks()
+    await check_concurrency(checks, chats, latency)
+    await check_chat_rate(checks, latency)
+    await check_global_rate(checks, chats, latency)
+    await check_retries(checks, latency)
+    return 1 if checks.failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа Bot API, с")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.chats, args.latency)))
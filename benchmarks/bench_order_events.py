@@ -0,0 +1,173 @@
+"""Бенчмарк push-статусов заказов: тысячи простаивающих подписчиков в одном процессе
+
+Режим bus - подписчики напрямую на EventBus (стоимость самой шины).
+Режим http - настоящие SSE-соединения к uvicorn на localhost через aiohttp.
+Замеряется память на подписчика и задержка от update_order_status
+до получения события всеми подписчиками заказа.
+
+Запуск: python -m benchmarks.bench_order_events --subscribers 5000 --users 500 --mode http
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import socket
+import time
+
+import aiohttp
+
+from benchmarks.common import FakeUser, make_order, percentile, place_order, report, signed_init_data, temp_db_path
+from bot.api import create_app, create_server
+from bot.database import Database
+from bot.loyalty import LoyaltySystem
+from config.settings import settings
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Deliveries:
+    """Время отправки каждого обновления и время его получения подписчиками"""
+
+    def __init__(self):
+        self.sent = {}
+        self.latencies = []
+
+    def received(self, data: dict):
+        sent_at = self.sent.get((data['id'], data['status']))
+        if sent_at is not None:
+            self.latencies.append(time.perf_counter() - sent_at)
+
+
+async def bus_subscriber(db: Database, telegram_id: int, deliveries: Deliveries, ready: asyncio.Event):
+    async with db.order_events.subscribe(telegram_id) as subscription:
+        ready.set()
+        while True:
+            message = await subscription.get()
+            data = json.loads(message.split(b"data: ", 1)[1])
+            deliveries.received(data)
+
+
+async def http_subscriber(session: aiohttp.ClientSession, base: str, init_data: str, deliveries: Deliveries,
+                          ready: asyncio.Event):
+    """Как Mini App: токен по заголовку initData, затем поток с токеном в адресе"""
+    async with session.post(f"{base}/api/user/orders/stream/token",
+                            headers={"X-Telegram-Init-Data": init_data}) as response:
+        response.raise_for_status()
+        token = (await response.json())["token"]
+    async with session.get(f"{base}/api/user/orders/stream", params={"token": token}) as response:
+        response.raise_for_status()
+        async for line in response.content:
+            if line.startswith(b"retry:"):
+                ready.set()
+            elif line.startswith(b"data: "):
+                deliveries.received(json.loads(line[6:]))
+
+
+async def main(subscribers: int, users: int, updates: int, mode: str):
+    temp_db_path("order_events.db")
+    db = Database()
+    await db.open()
+
+    server = None
+    server_task = None
+    session = None
+    tasks = []
+    try:
+        rng = random.Random(3)
+        people = [FakeUser(600000 + i) for i in range(users)]
+        items = await db.get_all_menu_items()
+        orders = {}
+        for user in people:
+            await db.register_user(user)
+            orders[user.id] = await place_order(db, user.id, make_order(rng, items))
+
+        if mode == "http":
+            settings.API_HOST, settings.API_PORT = "127.0.0.1", free_port()
+            server = create_server(create_app(db, LoyaltySystem(db)))
+            server.config.log_level = "warning"
+            server.config.timeout_keep_alive = 3600
+            server.config.limit_concurrency = None
+            server_task = asyncio.create_task(server.serve())
+            while not server.started:
+                await asyncio.sleep(0.01)
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=0),
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=30)
+            )
+
+        deliveries = Deliveries()
+        rss_before = rss_mb()
+        readies = []
+
+        started = time.perf_counter()
+        for i in range(subscribers):
+            user = people[i % users]
+            ready = asyncio.Event()
+            readies.append(ready)
+            if mode == "http":
+                base = f"http://{settings.API_HOST}:{settings.API_PORT}"
+                init_data = signed_init_data(user.id, settings.BOT_TOKEN)
+                tasks.append(asyncio.create_task(http_subscriber(session, base, init_data, deliveries, ready)))
+            else:
+                tasks.append(asyncio.create_task(bus_subscriber(db, user.id, deliveries, ready)))
+        for ready in readies:
+            await ready.wait()
+        connect_time = time.perf_counter() - started
+
+        print(f"{subscribers} подписчиков ({mode}) на {users} пользователей: подключение {connect_time:.2f}s, "
+              f"пик RSS +{rss_mb() - rss_before:.1f} MB")
+
+        # Простой: подписчики только ждут
+        await asyncio.sleep(1)
+
+        fanout = subscribers // users
+        expected = 0
+        update_latencies = []
+        started = time.perf_counter()
+        for seq in range(updates):
+            user = rng.choice(people)
+            status = f"status-{seq}"
+            deliveries.sent[(orders[user.id], status)] = time.perf_counter()
+            t = time.perf_counter()
+            await db.update_order_status(orders[user.id], status)
+            update_latencies.append(time.perf_counter() - t)
+            expected += fanout + (1 if people.index(user) < subscribers % users else 0)
+        report("update_order_status + publish", updates, time.perf_counter() - started, update_latencies)
+
+        deadline = time.perf_counter() + 10
+        while len(deliveries.latencies) < expected and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+
+        received = sorted(deliveries.latencies)
+        print(f"доставлено {len(received)}/{expected}: "
+              f"p50={percentile(received, 50) * 1000:.2f}ms p99={percentile(received, 99) * 1000:.2f}ms")
+        print(f"шина: {db.order_events.stats()}")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if session is not None:
+            await session.close()
+        if server is not None:
+            server.should_exit = True
+            await server_task
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--mode", choices=("bus", "http"), default="http")
+    args = parser.parse_args()
+    asyncio.run(main(args.subscribers, args.users, args.updates, args.mode))
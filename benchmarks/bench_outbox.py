@@ -0,0 +1,201 @@
+"""Проверка OutboxWorker против локальной заглушки внешней системы на aiohttp.web
+
+Заглушка принимает POST /events и отвечает по сценарию: 200, 5xx или
+ответ дольше таймаута клиента. Проверяется:
+- события уходят пачками не больше batch_size, каждое доставлено один раз;
+- баллы по заказам не считаются дважды: сумма баллов во всех событиях
+  равна сумме леджера, в событиях 'order' баллов нет;
+- после 5xx и таймаута пачка повторяется с экспоненциальной задержкой;
+- после max_attempts неудачных попыток события переходят в failed.
+
+Запуск: python -m benchmarks.bench_outbox --orders 120 --batch 25
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from collections import Counter
+from typing import List, Optional
+
+from aiohttp import web
+
+from benchmarks.common import FakeUser, make_order, place_order, temp_db_path
+from bot.database import Database
+from bot.http_client import HttpClient
+from bot.outbox import OutboxWorker
+from config.settings import settings
+
+# Допуск на точность таймеров event loop
+EPSILON = 0.005
+
+
+class ExternalStub:
+    """POST /events: ответы по сценарию (200, код ошибки или 'slow'), затем 200"""
+
+    def __init__(self, slow: float = 0.5):
+        self.slow = slow
+        self.script: List = []
+        self.requests: List[float] = []
+        self.batches: List[list] = []
+        self.delivered: List[dict] = []
+
+    async def events(self, request: web.Request) -> web.Response:
+        self.requests.append(time.monotonic())
+        body = await request.json()
+        self.batches.append(body['events'])
+        answer = self.script.pop(0) if self.script else 200
+        if answer == 'slow':
+            await asyncio.sleep(self.slow)
+            answer = 200
+        if answer == 200:
+            self.delivered.extend(body['events'])
+        return web.json_response({'ok': answer == 200}, status=answer)
+
+    def reset(self, script: Optional[list] = None):
+        self.script = list(script or [])
+        self.requests.clear()
+        self.batches.clear()
+        self.delivered.clear()
+
+
+class Checks:
+    def __init__(self):
+        self.failed = 0
+
+    def expect(self, condition: bool, title: str, details: str = ""):
+        print(f"{'ok  ' if condition else 'FAIL'} {title}{'  ' + details if details else ''}")
+        if not condition:
+            self.failed += 1
+
+
+def gaps(times: List[float]) -> List[float]:
+    return [later - earlier for earlier, later in zip(times, times[1:])]
+
+
+async def outbox_counts(db: Database) -> Counter:
+    async with db.connect() as conn:
+        cursor = await conn.execute("SELECT sync_status, COUNT(*) FROM external_sync GROUP BY sync_status")
+        return Counter({row[0]: row[1] for row in await cursor.fetchall()})
+
+
+async def drain(db: Database, worker: OutboxWorker, timeout: float = 10):
+    """Работа воркера, пока в outbox есть pending"""
+    worker.start()
+    deadline = time.monotonic() + timeout
+    try:
+        while (await outbox_counts(db))['pending'] and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+    finally:
+        await worker.stop()
+
+
+async def place_orders(db: Database, rng: random.Random, customers: List[int], orders: int):
+    items = await db.get_all_menu_items()
+    for _ in range(orders):
+        await place_order(db, rng.choice(customers), make_order(rng, items))
+
+
+async def check_batching(checks: Checks, db: Database, stub: ExternalStub, worker: OutboxWorker,
+                         rng: random.Random, customers: List[int], orders: int):
+    stub.reset()
+    await place_orders(db, rng, customers, orders)
+    pending = (await outbox_counts(db))['pending']
+    await drain(db, worker)
+
+    sizes = [len(batch) for batch in stub.batches]
+    ids = Counter(event['event_id'] for event in stub.delivered)
+    checks.expect(max(sizes) <= worker.batch_size and len(ids) == pending and max(ids.values()) == 1
+                  and (await outbox_counts(db))['synced'] == pending,
+                  "пачки и доставка", f"{pending} событий в {len(sizes)} пачках, размеры {sorted(set(sizes))}")
+
+    async with db.connect() as conn:
+        cursor = await conn.execute("SELECT COALESCE(SUM(points), 0) FROM loyalty_points")
+        ledger = (await cursor.fetchone())[0]
+    external = sum((event['data'] or {}).get('points', 0) for event in stub.delivered)
+    in_orders = [event for event in stub.delivered
+                 if event['type'] == 'order' and {'points', 'points_used'} & set(event['data'])]
+    checks.expect(external == ledger and not in_orders,
+                  "баллы без двойного учета", f"в событиях {external}, в леджере {ledger}")
+
+
+async def check_retries(checks: Checks, db: Database, stub: ExternalStub, worker: OutboxWorker,
+                        rng: random.Random, customers: List[int]):
+    stub.reset([503, 'slow', 502, 200])
+    await place_orders(db, rng, customers, 1)
+    await drain(db, worker)
+
+    intervals = gaps(stub.requests)
+    # Задержка после n-й неудачи - backoff * 2 ** (n - 1); у 'slow' к ней добавляется таймаут клиента
+    expected = [worker.backoff, worker.http.timeout + 2 * worker.backoff, 4 * worker.backoff]
+    checks.expect(len(stub.requests) == 4 and (await outbox_counts(db))['pending'] == 0
+                  and all(gap >= bound - EPSILON for gap, bound in zip(intervals, expected)),
+                  "повтор после 5xx и таймаута с экспоненциальной задержкой",
+                  f"интервалы {[round(gap * 1000) for gap in intervals]} ms, "
+                  f"не меньше {[round(bound * 1000) for bound in expected]} ms")
+
+
+async def check_max_attempts(checks: Checks, db: Database, stub: ExternalStub, worker: OutboxWorker,
+                             rng: random.Random, customers: List[int]):
+    stub.reset([500] * 100)
+    before = await outbox_counts(db)
+    await place_orders(db, rng, customers, 1)
+    await drain(db, worker)
+    requests = len(stub.requests)
+    await asyncio.sleep(worker.max_backoff * 2)
+
+    async with db.connect() as conn:
+        cursor = await conn.execute("SELECT attempts, last_error FROM external_sync WHERE sync_status = 'failed'")
+        failed = await cursor.fetchall()
+    counts = await outbox_counts(db)
+    checks.expect(counts['failed'] - before['failed'] > 0 and counts['pending'] == 0
+                  and requests == worker.max_attempts == len(stub.requests)
+                  and all(row[0] == worker.max_attempts for row in failed),
+                  "failed после max_attempts",
+                  f"запросов {requests}, событий failed {counts['failed']}, ошибка {failed[0][1] if failed else None}")
+
+
+async def main(orders: int, batch: int) -> int:
+    stub = ExternalStub()
+    app = web.Application()
+    app.router.add_post('/events', stub.events)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    temp_db_path("outbox.db")
+    settings.SYNC_ENABLED = True
+    settings.EXTERNAL_LOYALTY_API = f"http://127.0.0.1:{port}"
+    db = Database()
+    await db.open()
+    http = HttpClient(timeout=0.2)
+    checks = Checks()
+    try:
+        customers = list(range(1000, 1050))
+        for telegram_id in customers:
+            await db.register_user(FakeUser(telegram_id))
+        rng = random.Random(10)
+
+        def worker(**kwargs) -> OutboxWorker:
+            options = dict(batch_size=batch, interval=0.01, backoff=0.05, max_backoff=0.2)
+            options.update(kwargs)
+            return OutboxWorker(db, http, f"{settings.EXTERNAL_LOYALTY_API}/events", **options)
+
+        await check_batching(checks, db, stub, worker(), rng, customers, orders)
+        await check_retries(checks, db, stub, worker(), rng, customers)
+        await check_max_attempts(checks, db, stub, worker(max_attempts=3), rng, customers)
+    finally:
+        await http.close()
+        await db.close()
+        await runner.cleanup()
+    return 1 if checks.failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=120)
+    parser.add_argument("--batch", type=int, default=25)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.orders, args.batch)))
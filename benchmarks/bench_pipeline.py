@@ -0,0 +1,244 @@
+"""Нагрузочный стенд всего конвейера: настоящие обработчики CoffeeShopBot на большой базе
+
+База заполняется benchmarks.seed (или берется готовая через --db), бот
+собирается с заглушкой Bot API: запросы сериализуются как обычно, но
+не уходят в сеть. Апдейты подаются в Application.process_update
+с заданной параллельностью. Для каждого сценария печатаются пропускная
+способность и p50/p99; --json сохраняет результаты, --compare сверяет
+их с сохраненными ранее и завершается с кодом 1 при регрессии.
+
+Запуск: python -m benchmarks.seed --db /tmp/coffee_load.db --users 1000000
+        python -m benchmarks.bench_pipeline --db /tmp/coffee_load.db --requests 2000 --json results.json
+        python -m benchmarks.bench_pipeline --db /tmp/coffee_load.db --compare results.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from contextlib import closing
+from typing import Callable, Dict, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import ExtBot
+from telegram.request import BaseRequest, RequestData
+
+from benchmarks.common import (callback_update, command_update, make_order, percentile, temp_db_path,
+                               web_app_update)
+from benchmarks.seed import seed, telegram_id
+from config.settings import settings
+
+ADMIN_ID = 1
+SCENARIOS = ("start", "menu", "profile", "balance", "create_order", "admin_stats")
+
+
+class StubRequest(BaseRequest):
+    """Bot API без сети: тело запроса собирается, ответ - минимальный валидный объект"""
+
+    MESSAGE_METHODS = {"sendMessage", "editMessageText"}
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         *args, **kwargs) -> Tuple[int, bytes]:
+        api_method = url.rsplit('/', 1)[-1]
+        self.calls[api_method] += 1
+        parameters = {}
+        if request_data is not None:
+            request_data.json_payload  # сериализация, как перед отправкой
+            parameters = request_data.parameters
+
+        if api_method == "getMe":
+            result = {"id": ADMIN_ID, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif api_method in self.MESSAGE_METHODS:
+            chat_id = int(parameters.get("chat_id", 0))
+            result = {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": parameters.get("text", "")
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def table_sizes(path: str) -> Dict[str, int]:
+    with closing(sqlite3.connect(path)) as conn:
+        return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("users", "orders", "order_items", "loyalty_points")}
+
+
+async def drive(application, make_update: Callable[[int], dict], requests: int, concurrency: int,
+                errors: Counter, scenario: str) -> Dict:
+    """requests апдейтов через process_update, не больше concurrency одновременно"""
+    ids = iter(range(requests))
+    latencies: List[float] = []
+    errors_before = errors[scenario]
+
+    async def worker():
+        for seq in ids:
+            update = Update.de_json(make_update(seq), application.bot)
+            started = time.perf_counter()
+            await application.process_update(update)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'ops': requests,
+        'elapsed': round(elapsed, 4),
+        'ops_per_s': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'errors': errors[scenario] - errors_before
+    }
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Сценарии, где пропускная способность упала или p99 вырос больше чем на tolerance"""
+    regressions = []
+    for scenario, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(scenario)
+        if previous is None:
+            continue
+        if current['ops_per_s'] < previous['ops_per_s'] * (1 - tolerance):
+            regressions.append(f"{scenario}: {previous['ops_per_s']} -> {current['ops_per_s']} ops/s")
+        if current['p99_ms'] > previous['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{scenario}: p99 {previous['p99_ms']} -> {current['p99_ms']} ms")
+    return regressions
+
+
+async def main(path: Optional[str], seed_users: int, requests: int, concurrency: int,
+               scenarios: List[str], json_path: Optional[str], baseline_path: Optional[str], tolerance: float):
+    if path is None:
+        path = temp_db_path("pipeline.db")
+        seed(path, seed_users)
+    settings.DATABASE_PATH = path
+    sizes = table_sizes(path)
+
+    # Уведомления админам без лимитов, ADMIN_ID видит статистику
+    settings.ADMIN_IDS = [str(ADMIN_ID)]
+    settings.ORDER_CHAT_ID = ""
+    settings.NOTIFY_GLOBAL_RATE = settings.NOTIFY_CHAT_RATE = 0
+
+    from bot.main import CoffeeShopBot
+
+    stub = StubRequest()
+    bot = CoffeeShopBot(bot=ExtBot(settings.BOT_TOKEN, request=stub, get_updates_request=StubRequest()))
+    application = bot.application
+    errors: Counter = Counter()
+    current = {'scenario': None}
+
+    async def on_error(update, context):
+        errors[current['scenario']] += 1
+        if errors[current['scenario']] == 1:
+            print(f"    ошибка в {current['scenario']}: {context.error!r}", file=sys.stderr)
+
+    application.add_error_handler(on_error)
+
+    rng = random.Random(13)
+    users = sizes['users']
+    items = None
+
+    def random_user() -> int:
+        return telegram_id(rng.randrange(users))
+
+    def order_payload() -> dict:
+        order = make_order(rng, items)
+        order.update(action="create_order", idempotencyKey=uuid.uuid4().hex)
+        return order
+
+    makers = {
+        'start': lambda seq: command_update(seq, random_user(), "/start"),
+        'menu': lambda seq: command_update(seq, random_user(), "/menu"),
+        'profile': lambda seq: command_update(seq, random_user(), "/profile"),
+        'balance': lambda seq: command_update(seq, random_user(), "/balance"),
+        'create_order': lambda seq: web_app_update(seq, random_user(), order_payload()),
+        'admin_stats': lambda seq: callback_update(seq, ADMIN_ID, "admin_stats"),
+    }
+
+    await bot.db.open()
+    await application.initialize()
+    bot.activity.start()
+    try:
+        items = [dict(item) for item in await bot.db.get_all_menu_items()]
+        results = {
+            'meta': {
+                'revision': git_revision(),
+                'timestamp': int(time.time()),
+                'python': platform.python_version(),
+                'database': sizes,
+                'requests': requests,
+                'concurrency': concurrency
+            },
+            'scenarios': {}
+        }
+        print(f"база: {sizes}, параллельность {concurrency}")
+        for scenario in scenarios:
+            current['scenario'] = scenario
+            result = await drive(application, makers[scenario], requests, concurrency, errors, scenario)
+            await bot.notifier.drain()
+            results['scenarios'][scenario] = result
+            print(f"{scenario:<14} {result['ops']:>7} ops  {result['ops_per_s']:>9.1f} ops/s  "
+                  f"p50={result['p50_ms']:8.2f}ms  p99={result['p99_ms']:8.2f}ms  errors={result['errors']}")
+        results['meta']['bot_api_calls'] = dict(stub.calls)
+        print(f"вызовы Bot API: {dict(stub.calls)}")
+    finally:
+        await bot.activity.stop()
+        await application.shutdown()
+        await bot.http.close()
+        await bot.db.close()
+
+    if json_path:
+        with open(json_path, 'w') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+        print(f"результаты: {json_path}")
+
+    if baseline_path:
+        with open(baseline_path) as file:
+            regressions = compare(results, json.load(file), tolerance)
+        for line in regressions:
+            print(f"РЕГРЕССИЯ {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="готовая база из benchmarks.seed (по умолчанию - временная)")
+    parser.add_argument("--seed-users", type=int, default=20000, help="пользователей во временной базе")
+    parser.add_argument("--requests", type=int, default=2000, help="апдейтов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    parser.add_argument("--compare", help="сравнить с сохраненными результатами")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение, доля")
+    args = parser.parse_args()
+    asyncio.run(main(args.db, args.seed_users, args.requests, args.concurrency,
+                     [name for name in args.scenarios.split(",") if name], args.json, args.compare, args.tolerance))
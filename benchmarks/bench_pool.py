@@ -0,0 +1,88 @@
+"""Бенчмарк: aiosqlite.connect на каждый вызов против пула соединений
+
+Запуск: python -m benchmarks.bench_pool --ops 10000
+"""
+import argparse
+import asyncio
+import random
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+from benchmarks.common import FakeUser, Timer, make_order, place_order, report, temp_db_path
+from bot.database import Database
+
+
+class PerCallDatabase(Database):
+    """Старое поведение: новое соединение на каждый вызов"""
+
+    @asynccontextmanager
+    async def _per_call(self, commit: bool):
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            yield db
+            if commit:
+                await db.commit()
+
+    def connect(self):
+        return self._per_call(commit=False)
+
+    def transaction(self):
+        return self._per_call(commit=True)
+
+
+async def run_mix(db: Database, ops: int, concurrency: int, seed: int = 42):
+    rng = random.Random(seed)
+    users = [FakeUser(100000 + i) for i in range(200)]
+    for user in users:
+        await db.register_user(user)
+    items = await db.get_all_menu_items()
+    categories = await db.get_menu_categories()
+
+    async def one(i: int):
+        roll = rng.random()
+        user = rng.choice(users)
+        if roll < 0.35:
+            await db.get_menu_items_by_category(rng.choice(categories))
+        elif roll < 0.60:
+            await db.get_user_data(user.id)
+        elif roll < 0.80:
+            await db.get_user_orders(user.id)
+        elif roll < 0.90:
+            await db.register_user(user)
+        else:
+            await place_order(db, user.id, make_order(rng, items))
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def guarded(i: int):
+        async with semaphore:
+            await one(i)
+
+    with Timer() as timer:
+        await asyncio.gather(*(guarded(i) for i in range(ops)))
+    return timer.elapsed
+
+
+async def main(ops: int, concurrency: int):
+    temp_db_path("per_call.db")
+    per_call = PerCallDatabase()
+    elapsed = await run_mix(per_call, ops, concurrency)
+    report("per-call connect", ops, elapsed)
+
+    temp_db_path("pooled.db")
+    pooled = Database()
+    await pooled.open()
+    try:
+        elapsed = await run_mix(pooled, ops, concurrency)
+        report("pooled connections", ops, elapsed)
+    finally:
+        await pooled.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ops", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+    asyncio.run(main(args.ops, args.concurrency))
@@ -0,0 +1,68 @@
+"""Бенчмарк расчета корзины: price_cart на снимке меню и PricingEngine.quote с балансом
+
+Запуск: python -m benchmarks.bench_pricing --quotes 20000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.common import FakeUser, make_order, place_order, report, temp_db_path
+from bot.database import Database
+from bot.loyalty import LoyaltySystem
+from bot.pricing import PricingEngine, price_cart
+
+
+async def main(quotes: int, concurrency: int):
+    temp_db_path("pricing.db")
+    db = Database()
+    loyalty = LoyaltySystem(db)
+    pricing = PricingEngine(db, loyalty)
+    await db.open()
+    try:
+        rng = random.Random(11)
+        people = [FakeUser(500000 + i) for i in range(100)]
+        items = await db.get_all_menu_items()
+        for user in people:
+            await db.register_user(user)
+            await place_order(db, user.id, make_order(rng, items))
+
+        carts = [make_order(rng, items) for _ in range(256)]
+        snapshot = await db.get_menu()
+        levels = await loyalty.get_levels()
+
+        # Чистый расчет без базы
+        latencies = []
+        started = time.perf_counter()
+        for i in range(quotes):
+            cart = carts[i % len(carts)]
+            t = time.perf_counter()
+            price_cart(snapshot, levels, cart['items'], cart['deliveryType'], balance=700, points_to_use=300)
+            latencies.append(time.perf_counter() - t)
+        report("price_cart", quotes, time.perf_counter() - started, latencies)
+
+        # С чтением баланса из пула
+        latencies = []
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(i: int):
+            async with semaphore:
+                cart = carts[i % len(carts)]
+                t = time.perf_counter()
+                await pricing.quote(cart['items'], cart['deliveryType'], points_to_use=300,
+                                    telegram_id=people[i % len(people)].id)
+                latencies.append(time.perf_counter() - t)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(quotes)))
+        report("PricingEngine.quote", quotes, time.perf_counter() - started, latencies)
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--quotes", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(main(args.quotes, args.concurrency))
@@ -0,0 +1,120 @@
+"""Задержка /menu при тяжелом потоке заказов: последовательная обработка против UpdateScheduler
+
+Апдейты подаются в update_queue Application с постоянной частотой (открытая
+нагрузка). Заказ - запись в базу и долгий внешний ввод-вывод (уведомления,
+синхронизация). Для каждого режима печатается p50/p99 /menu без заказов
+и под заказами; у планировщика p99 /menu не должен расти вместе с заказами.
+
+Запуск: python -m benchmarks.bench_scheduler --rate 100 --seconds 5 --workers 64
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+
+from telegram import Update
+from telegram.ext import Application, CommandHandler
+
+from benchmarks.common import FakeUser, OfflineBot, command_update, make_order, percentile, place_order, temp_db_path
+from bot.database import Database
+from bot.updates import UpdateScheduler
+from config.settings import settings
+
+
+async def run_scenario(db: Database, people, items, processor, rate: float, seconds: float,
+                       order_share: float, order_io: float):
+    rng = random.Random(4)
+    enqueued_at = {}
+    menu_latencies = []
+    pending = set()
+    done = asyncio.Event()
+
+    def finished(update_id: int):
+        pending.discard(update_id)
+        if not pending and feeding_done:
+            done.set()
+
+    async def menu(update, context):
+        await db.get_menu_categories()
+        menu_latencies.append(time.perf_counter() - enqueued_at[update.update_id])
+        finished(update.update_id)
+
+    async def order(update, context):
+        await place_order(db, update.effective_user.id, make_order(rng, items))
+        await asyncio.sleep(order_io)
+        finished(update.update_id)
+
+    builder = Application.builder().bot(OfflineBot(settings.BOT_TOKEN)).updater(None)
+    application = builder.concurrent_updates(processor).build()
+    application.add_handler(CommandHandler("menu", menu))
+    application.add_handler(CommandHandler("order", order))
+
+    await application.initialize()
+    await application.start()
+    try:
+        feeding_done = False
+        ids = itertools.count()
+        interval = 1 / rate
+        started = time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            update_id = next(ids)
+            user = rng.choice(people)
+            command = "/order" if rng.random() < order_share else "/menu"
+            update = Update.de_json(command_update(update_id, user.id, command), application.bot)
+            pending.add(update_id)
+            enqueued_at[update_id] = time.perf_counter()
+            await application.update_queue.put(update)
+
+            # Держим частоту с учетом времени, ушедшего на обработку
+            next_at = started + (update_id + 1) * interval
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+
+        feeding_done = True
+        if pending:
+            await done.wait()
+    finally:
+        await application.stop()
+        await application.shutdown()
+
+    return menu_latencies
+
+
+async def main(rate: float, seconds: float, workers: int, order_share: float, order_io: float, users: int):
+    temp_db_path("scheduler.db")
+    db = Database()
+    await db.open()
+    try:
+        people = [FakeUser(800000 + i) for i in range(users)]
+        for user in people:
+            await db.register_user(user)
+        items = await db.get_all_menu_items()
+
+        modes = [
+            ("sequential", lambda: False),
+            (f"scheduler x{workers}", lambda: UpdateScheduler(workers)),
+        ]
+        for title, make_processor in modes:
+            for share in (0.0, order_share):
+                processor = make_processor()
+                latencies = await run_scenario(db, people, items, processor, rate, seconds, share, order_io)
+                line = (f"{title:<16} orders={share:>4.0%}  /menu n={len(latencies):<6} "
+                        f"p50={percentile(latencies, 50) * 1000:8.2f}ms  p99={percentile(latencies, 99) * 1000:8.2f}ms")
+                if isinstance(processor, UpdateScheduler):
+                    stats = processor.stats()
+                    line += f"  peak_waiting={stats['peak_waiting']} wait_p99={stats['wait_p99'] * 1000:.1f}ms"
+                print(line)
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=float, default=100, help="апдейтов в секунду")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument("--order-share", type=float, default=0.3)
+    parser.add_argument("--order-io", type=float, default=0.2, help="внешний I/O заказа, с")
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.rate, args.seconds, args.workers, args.order_share, args.order_io, args.users))
@@ -0,0 +1,149 @@
+"""Бенчмарк: CPU обработчика на вызов со сборкой экрана и с ScreenCache
+
+Старые обработчики собирали текст, словарь эмодзи и InlineKeyboardMarkup
+на каждый вызов; здесь их сборка воспроизведена как есть. Отправка
+не замеряется, но to_dict() клавиатуры (сериализация при отправке)
+можно включить флагом --serialize.
+
+Запуск: python -m benchmarks.bench_views --calls 20000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
+
+from benchmarks.common import temp_db_path
+from bot.database import Database
+from bot.views import ScreenCache
+from config.settings import settings
+
+EMOJIS = {'coffee': '☕', 'tea': '🍵', 'bakery': '🥐', 'dessert': '🍰', 'food': '🥪'}
+
+
+def legacy_start(first_name: str):
+    text = f"""
+🎉 *Добро пожаловать в {settings.SHOP_NAME}!* ☕
+
+*Мы рады видеть вас, {first_name}!*
+
+✨ *Наши преимущества:*
+• 🚀 Быстрое приготовление
+• 🌱 Свежие ингредиенты
+• 💫 Авторские рецепты
+• 🎁 Программа лояльности
+
+📱 *Используйте кнопку "🛒 Заказать" или команды ниже:*
+"""
+    keyboard = [
+        [
+            InlineKeyboardButton("📋 Посмотреть меню", callback_data="view_menu"),
+            InlineKeyboardButton("🛒 Открыть Mini App", web_app=WebAppInfo(url=settings.WEBAPP_URL))
+        ],
+        [
+            InlineKeyboardButton("👤 Мой профиль", callback_data="profile"),
+            InlineKeyboardButton("💎 Баланс баллов", callback_data="balance")
+        ],
+        [
+            InlineKeyboardButton("📦 Мои заказы", callback_data="my_orders"),
+            InlineKeyboardButton("⭐ Избранное", callback_data="favorites")
+        ],
+        [
+            InlineKeyboardButton("🏆 Акции", callback_data="promotions"),
+            InlineKeyboardButton("📍 Контакты", callback_data="contacts")
+        ]
+    ]
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+async def legacy_menu(db: Database):
+    categories = await db.get_menu_categories()
+    keyboard = []
+    for category in categories:
+        emoji = dict(EMOJIS).get(category, '📋')
+        keyboard.append([InlineKeyboardButton(f"{emoji} {category.capitalize()}", callback_data=f"category_{category}")])
+    keyboard.append([InlineKeyboardButton("🛒 Открыть полное меню в Mini App",
+                                          web_app=WebAppInfo(url=settings.WEBAPP_URL))])
+    return "☕ *Наше меню*\n\nВыберите категорию:", InlineKeyboardMarkup(keyboard)
+
+
+async def legacy_category(db: Database, category: str):
+    items = await db.get_menu_items_by_category(category)
+    emoji = dict(EMOJIS).get(category, '📋')
+    text = f"{emoji} *{category.capitalize()}*\n\n"
+    for item in items[:5]:
+        text += f"• *{item['name']}* - {item['price']}₽\n"
+    if len(items) > 5:
+        text += f"\n...и еще {len(items) - 5} позиций"
+    keyboard = [
+        [InlineKeyboardButton("🛒 Открыть в Mini App", web_app=WebAppInfo(
+            url=f"{settings.WEBAPP_URL}/?category={category}"
+        ))],
+        [InlineKeyboardButton("⬅️ Назад", callback_data="view_menu")]
+    ]
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+async def measure(title: str, render, calls: int, serialize: bool):
+    cpu_started = time.process_time()
+    for i in range(calls):
+        text, reply_markup = await render(i)
+        if serialize:
+            reply_markup.to_dict()
+    cpu = time.process_time() - cpu_started
+    print(f"{title:<28} {calls:>8} calls  {cpu / calls * 1e6:8.2f} us CPU/call")
+
+
+async def main(calls: int, serialize: bool, invalidate_every: int):
+    temp_db_path("views.db")
+    db = Database()
+    await db.open()
+    try:
+        screens = ScreenCache(db)
+        rng = random.Random(5)
+        categories = list(await db.get_menu_categories())
+        picks = [rng.choice(categories) for _ in range(calls)]
+
+        async def cached_start(i):
+            screen = screens.welcome(f"User{i}")
+            return screen.text, screen.reply_markup
+
+        async def cached_menu(i):
+            if invalidate_every and i % invalidate_every == 0:
+                db.invalidate_menu()
+            screen = await screens.menu()
+            return screen.text, screen.reply_markup
+
+        async def cached_category(i):
+            if invalidate_every and i % invalidate_every == 0:
+                db.invalidate_menu()
+            screen = await screens.category(picks[i])
+            return screen.text, screen.reply_markup
+
+        async def old_start(i):
+            return legacy_start(f"User{i}")
+
+        scenarios = [
+            ("start (build)", old_start),
+            ("start (cached)", cached_start),
+            ("show_menu (build)", lambda i: legacy_menu(db)),
+            ("show_menu (cached)", cached_menu),
+            ("category (build)", lambda i: legacy_category(db, picks[i])),
+            ("category (cached)", cached_category),
+        ]
+        for title, render in scenarios:
+            await measure(title, render, calls, serialize)
+        print(f"экраны: {screens.stats()}")
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--serialize", action="store_true", help="добавить to_dict() клавиатуры")
+    parser.add_argument("--invalidate-every", type=int, default=0,
+                        help="сбрасывать кэш меню каждые N вызовов (0 - никогда)")
+    args = parser.parse_args()
+    asyncio.run(main(args.calls, args.serialize, args.invalidate_every))
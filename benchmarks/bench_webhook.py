@@ -0,0 +1,126 @@
+"""Стенд webhook: синтетические апдейты POST-ом в ASGI-приложение, пропускная способность обработки
+
+Бот не ходит в сеть: get_me подменен, обработчики только читают базу
+и имитируют внешний ввод-вывод заказа. Проверяется и порядок апдейтов
+каждого пользователя.
+
+Запуск: python -m benchmarks.bench_webhook --updates 5000 --users 200 --concurrency 64
+        (--concurrency 1 - последовательная обработка, как раньше)
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+
+import httpx
+from telegram.ext import Application, CommandHandler
+
+from benchmarks.common import FakeUser, OfflineBot, command_update, make_order, place_order, report, temp_db_path
+from bot.api import create_app
+from bot.database import Database
+from bot.loyalty import LoyaltySystem
+from bot.updates import UpdateScheduler
+from config.settings import settings
+
+
+async def main(updates: int, users: int, concurrency: int, order_share: float, order_io: float):
+    temp_db_path("webhook.db")
+    db = Database()
+    await db.open()
+
+    rng = random.Random(8)
+    people = [FakeUser(700000 + i) for i in range(users)]
+    for user in people:
+        await db.register_user(user)
+    items = await db.get_all_menu_items()
+
+    processed = 0
+    done = asyncio.Event()
+    last_seq = {}
+    out_of_order = 0
+    latencies = []
+    sent_at = {}
+
+    def finished(update_id: int, user_id: int, seq: int):
+        nonlocal processed, out_of_order
+        if seq < last_seq.get(user_id, -1):
+            out_of_order += 1
+        last_seq[user_id] = seq
+        latencies.append(time.perf_counter() - sent_at[update_id])
+        processed += 1
+        if processed == updates:
+            done.set()
+
+    async def menu(update, context):
+        await db.get_menu_categories()
+        finished(update.update_id, update.effective_user.id, int(context.args[0]))
+
+    async def order(update, context):
+        await place_order(db, update.effective_user.id, make_order(rng, items))
+        # Подтверждение, уведомления админам, внешняя синхронизация
+        await asyncio.sleep(order_io)
+        finished(update.update_id, update.effective_user.id, int(context.args[0]))
+
+    application = (
+        Application.builder()
+        .bot(OfflineBot(settings.BOT_TOKEN))
+        .updater(None)
+        .concurrent_updates(UpdateScheduler(concurrency))
+        .build()
+    )
+    application.add_handler(CommandHandler("menu", menu))
+    application.add_handler(CommandHandler("order", order))
+
+    settings.WEBHOOK_SECRET = "bench-webhook-secret"
+    app = create_app(db, LoyaltySystem(db), application=application)
+    transport = httpx.ASGITransport(app=app)
+
+    await application.initialize()
+    await application.start()
+    try:
+        seqs = {user.id: itertools.count() for user in people}
+        payloads = []
+        for update_id in range(updates):
+            user = rng.choice(people)
+            command = "/order" if rng.random() < order_share else "/menu"
+            payloads.append((update_id, command_update(update_id, user.id, f"{command} {next(seqs[user.id])}")))
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            forged = command_update(updates, people[0].id, "/order 0")
+            anonymous = await client.post(settings.WEBHOOK_PATH, json=forged)
+            wrong = await client.post(settings.WEBHOOK_PATH, json=forged,
+                                      headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+            print(f"апдейт без секрета: {anonymous.status_code}, с неверным: {wrong.status_code}")
+            if anonymous.status_code != 403 or wrong.status_code != 403:
+                raise SystemExit(1)
+
+            client.headers["X-Telegram-Bot-Api-Secret-Token"] = settings.WEBHOOK_SECRET
+            started = time.perf_counter()
+            for update_id, payload in payloads:
+                sent_at[update_id] = time.perf_counter()
+                response = await client.post(settings.WEBHOOK_PATH, json=payload)
+                response.raise_for_status()
+            accepted = time.perf_counter() - started
+
+            await done.wait()
+            elapsed = time.perf_counter() - started
+
+        print(f"приняты за {accepted:.2f}s ({updates / accepted:.0f} POST/s)")
+        report(f"updates (concurrency={concurrency})", updates, elapsed, latencies)
+        print(f"    нарушений порядка у пользователя: {out_of_order}")
+    finally:
+        await application.stop()
+        await application.shutdown()
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--order-share", type=float, default=0.1)
+    parser.add_argument("--order-io", type=float, default=0.05, help="имитация внешнего I/O заказа, с")
+    args = parser.parse_args()
+    asyncio.run(main(args.updates, args.users, args.concurrency, args.order_share, args.order_io))
@@ -0,0 +1,75 @@
+"""Бенчмарк: задержка create_order при параллельных чтениях админки и webapp
+
+Запуск: python -m benchmarks.bench_write_queue --orders 2000 --readers 8
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmarks.common import FakeUser, make_order, place_order, report, temp_db_path
+from bot.database import Database
+
+
+async def place_orders(db: Database, users, items, orders: int, concurrency: int):
+    rng = random.Random(7)
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            user = rng.choice(users)
+            started = time.perf_counter()
+            await place_order(db, user.id, make_order(rng, items))
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(orders)))
+    return time.perf_counter() - started, latencies
+
+
+async def background_reads(db: Database, stop: asyncio.Event, counter: list):
+    while not stop.is_set():
+        await db.get_admin_stats()
+        await db.get_all_menu_items()
+        counter[0] += 2
+
+
+async def main(orders: int, readers: int, concurrency: int):
+    temp_db_path("write_queue.db")
+    db = Database()
+    await db.open()
+    try:
+        users = [FakeUser(200000 + i) for i in range(100)]
+        for user in users:
+            await db.register_user(user)
+        items = await db.get_all_menu_items()
+
+        elapsed, latencies = await place_orders(db, users, items, orders, concurrency)
+        report("create_order (idle)", orders, elapsed, latencies)
+
+        stop = asyncio.Event()
+        counter = [0]
+        tasks = [asyncio.create_task(background_reads(db, stop, counter)) for _ in range(readers)]
+        commits_before = db.pool.commits
+        transactions_before = db.pool.transactions
+
+        elapsed, latencies = await place_orders(db, users, items, orders, concurrency)
+        stop.set()
+        await asyncio.gather(*tasks)
+
+        report(f"create_order (+{readers} readers)", orders, elapsed, latencies)
+        report("background reads", counter[0], elapsed)
+        print(f"group commit: {db.pool.transactions - transactions_before} транзакций "
+              f"за {db.pool.commits - commits_before} коммитов")
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(main(args.orders, args.readers, args.concurrency))
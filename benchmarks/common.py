@@ -0,0 +1,162 @@
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlencode
+
+# Бенчмарки запускаются из корня репозитория: python -m benchmarks.<name>
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("BOT_TOKEN", "bench:token")
+
+from telegram import User  # noqa: E402
+from telegram.ext import ExtBot  # noqa: E402
+
+from config.settings import settings  # noqa: E402
+
+
+def temp_db_path(name: str = "bench.db") -> str:
+    """Путь к свежей временной базе и настройка settings на нее"""
+    path = os.path.join(tempfile.mkdtemp(prefix="coffee_bench_"), name)
+    settings.DATABASE_PATH = path
+    return path
+
+
+class FakeUser:
+    """Минимальная замена telegram.User"""
+
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.username = f"user{user_id}"
+        self.first_name = f"User {user_id}"
+        self.last_name = None
+
+
+def percentile(samples, p: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(title: str, ops: int, elapsed: float, latencies=None):
+    line = f"{title:<32} {ops:>8} ops  {elapsed:8.3f}s  {ops / elapsed:10.1f} ops/s"
+    if latencies:
+        line += f"  p50={percentile(latencies, 50) * 1000:.2f}ms  p99={percentile(latencies, 99) * 1000:.2f}ms"
+    print(line)
+
+
+def make_order(rng: random.Random, items: list) -> dict:
+    lines = []
+    for item in rng.sample(items, k=min(len(items), rng.randint(1, 4))):
+        lines.append({
+            "id": item["id"],
+            "name": item["name"],
+            "price": item["price"],
+            "quantity": rng.randint(1, 3),
+        })
+    total = sum(line["price"] * line["quantity"] for line in lines)
+    delivery_type = rng.choice(["pickup", "delivery"]) if total >= settings.MIN_ORDER else "pickup"
+    return {
+        "action": "create_order",
+        "items": lines,
+        "total": total,
+        "deliveryType": delivery_type,
+        "phone": "+79990000000",
+    }
+
+
+async def place_order(db, telegram_id: int, order: dict) -> int:
+    """create_order с расчетом по снимку меню, без уровней и списания баллов"""
+    from bot.loyalty import LevelTable
+    from bot.pricing import price_cart
+
+    quote = price_cart(await db.get_menu(), LevelTable(()), order["items"], order["deliveryType"])
+    order_id, _ = await db.create_order(telegram_id, order, quote)
+    return order_id
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def signed_init_data(user_id: int, bot_token: str, auth_date: Optional[int] = None) -> str:
+    """initData Mini App, подписанный так же, как это делает Telegram"""
+    fields = {
+        "auth_date": str(auth_date if auth_date is not None else int(time.time())),
+        "query_id": f"AAH{user_id}",
+        "user": json.dumps({"id": user_id, "first_name": f"User {user_id}"}, separators=(",", ":")),
+    }
+    data_check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+    secret_key = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+class OfflineBot(ExtBot):
+    """Бот без обращений к Bot API (для стендов с настоящим Application)"""
+
+    async def get_me(self, *args, **kwargs) -> User:
+        self._bot_user = User(id=1, first_name="Bench", is_bot=True, username="bench_bot")
+        return self._bot_user
+
+
+def command_update(update_id: int, user_id: int, text: str) -> dict:
+    """JSON апдейта с командой, как его присылает Telegram"""
+    command = text.split()[0]
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        }
+    }
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    """JSON апдейта с нажатием inline-кнопки под сообщением бота"""
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": str(user_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+            "data": data,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "Bench"},
+                "text": "..."
+            }
+        }
+    }
+
+
+def web_app_update(update_id: int, user_id: int, payload: dict) -> dict:
+    """JSON апдейта с данными Mini App (Telegram.WebApp.sendData)"""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+            "web_app_data": {"data": json.dumps(payload), "button_text": "Заказать"}
+        }
+    }
@@ -0,0 +1,145 @@
+"""Проверка планов запросов: ни один запрос Database/LoyaltySystem не сканирует большие таблицы
+
+Все методы выполняются на заполненной базе, выполненные SQL перехватываются
+через trace callback и прогоняются через EXPLAIN QUERY PLAN.
+
+Запуск: python -m benchmarks.query_plans
+"""
+import asyncio
+import random
+import re
+import sqlite3
+import sys
+from datetime import datetime
+
+from benchmarks.common import FakeUser, make_order, place_order, temp_db_path
+from bot.database import Database
+from bot.export import export_stream
+from bot.loyalty import LoyaltySystem
+from bot.pricing import PricingEngine
+
+# Маленькие справочники, которые дешевле прочитать целиком
+SMALL_TABLES = {'categories', 'c', 'loyalty_levels', 'll'}
+
+# Методы, которым по смыслу нужна вся таблица (экспорт, аналитика по всему леджеру)
+FULL_READ_ALLOWED = {'_load_menu_snapshot', 'get_loyalty_stats',
+                     'sync_menu_from_external', 'disable_missing_menu_items', 'rebuild_daily_stats'}
+
+SCAN_RE = re.compile(r'\bSCAN (\w+)')
+
+
+async def drain(iterator):
+    async for _ in iterator:
+        pass
+
+
+async def seed(db: Database, loyalty: LoyaltySystem, users: int = 300, orders: int = 1500):
+    rng = random.Random(1)
+    people = [FakeUser(300000 + i) for i in range(users)]
+    for user in people:
+        await db.register_user(user)
+    items = await db.get_all_menu_items()
+    for _ in range(orders):
+        user = rng.choice(people)
+        order_id = await place_order(db, user.id, make_order(rng, items))
+        await loyalty.add_points(user.id, rng.randint(1, 50), f"Заказ #{order_id}", order_id)
+    return people
+
+
+async def main() -> int:
+    path = temp_db_path("query_plans.db")
+    db = Database()
+    loyalty = LoyaltySystem(db)
+    await db.open()
+
+    people = await seed(db, loyalty)
+    user = people[0]
+    order = (await db.get_user_orders(user.id))[0]
+
+    pricing = PricingEngine(db, loyalty)
+    cart = [{'id': 1, 'quantity': 2}]
+    quote = await pricing.quote(cart, points_to_use=100, telegram_id=user.id)
+
+    captured = []
+    current = {'method': None}
+
+    def trace(statement: str):
+        if current['method']:
+            captured.append((current['method'], statement))
+
+    for conn in db.pool._readers + [db.pool._writer]:
+        await conn.set_trace_callback(trace)
+
+    calls = [
+        ('register_user', lambda: db.register_user(user)),
+        ('touch_users', lambda: db.touch_users([(person.id, person.username, person.first_name,
+                                                 person.last_name, datetime.now()) for person in people[:50]])),
+        ('get_user_data', lambda: db.get_user_data(user.id)),
+        ('get_user_id', lambda: db.get_user_id(user.id)),
+        ('get_user_data_by_id', lambda: db.get_user_data_by_id(1)),
+        ('get_menu_categories', lambda: db.get_menu_categories()),
+        ('get_menu_items_by_category', lambda: db.get_menu_items_by_category('coffee')),
+        ('get_all_menu_items', lambda: db.get_all_menu_items()),
+        ('_load_menu_snapshot', lambda: db._load_menu_snapshot(0)),
+        ('quote', lambda: pricing.quote(cart, points_to_use=100, telegram_id=user.id)),
+        ('create_order', lambda: db.create_order(user.id, {'phone': '+79990000000'}, quote, 'plan-key')),
+        ('create_order (repeat)', lambda: db.create_order(user.id, {'phone': '+79990000000'}, quote, 'plan-key')),
+        ('find_order_by_key', lambda: db.find_order_by_key(user.id, 'plan-key')),
+        ('get_user_orders', lambda: db.get_user_orders(user.id)),
+        ('get_orders_by_user_id', lambda: db.get_orders_by_user_id(1)),
+        ('get_order', lambda: db.get_order(order['id'])),
+        ('get_orders_items', lambda: db.get_orders_items([order['id']])),
+        ('update_order_status', lambda: db.update_order_status(order['id'], 'confirmed')),
+        ('get_admin_stats', lambda: db.get_admin_stats()),
+        ('rebuild_daily_stats', lambda: db.rebuild_daily_stats()),
+        ('sync_menu_from_external', lambda: db.sync_menu_from_external([
+            {'external_id': 'ext-1', 'name': 'Флэт уайт', 'price': 210, 'category': 'coffee'}])),
+        ('apply_menu_batch', lambda: db.apply_menu_batch([
+            {'external_id': 'ext-1', 'name': 'Флэт уайт', 'price': 220, 'category': 'coffee'},
+            {'external_id': 'ext-2', 'name': 'Раф', 'price': 250, 'category': 'coffee'}])),
+        ('disable_missing_menu_items', lambda: db.disable_missing_menu_items({'ext-2'})),
+        ('export_menu_to_json', lambda: db.export_menu_to_json()),
+        ('iter_menu_export', lambda: drain(db.iter_menu_export())),
+        ('export_stream orders', lambda: drain(export_stream(db, 'orders', 'csv', page_size=500))),
+        ('export_stream loyalty', lambda: drain(export_stream(db, 'loyalty', 'columnar', page_size=500))),
+        ('get_user_points', lambda: loyalty.get_user_points(user.id)),
+        ('get_points_by_user_id', lambda: loyalty.get_points_by_user_id(1)),
+        ('add_points', lambda: loyalty.add_points(user.id, 10, "Проверка")),
+        ('get_user_level', lambda: loyalty.get_user_level(user.id)),
+        ('get_points_history', lambda: loyalty.get_points_history(user.id)),
+        ('exchange_points', lambda: loyalty.exchange_points(user.id, 5)),
+        ('get_available_products_for_points', lambda: loyalty.get_available_products_for_points(3)),
+        ('get_loyalty_stats', lambda: loyalty.get_loyalty_stats()),
+    ]
+
+    for name, call in calls:
+        current['method'] = name
+        await call()
+    current['method'] = None
+
+    await db.close()
+
+    conn = sqlite3.connect(path)
+    violations = 0
+    for method, statement in captured:
+        if not re.match(r'\s*(SELECT|INSERT|UPDATE|DELETE|WITH)', statement, re.I):
+            continue
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}")]
+        scans = [
+            detail for detail in plan
+            for table in SCAN_RE.findall(detail)
+            if table not in SMALL_TABLES
+        ]
+        if scans and method not in FULL_READ_ALLOWED:
+            violations += 1
+            print(f"FULL SCAN in {method}: {' | '.join(scans)}")
+            print(f"    {' '.join(statement.split())[:200]}")
+    conn.close()
+
+    checked = len({method for method, _ in captured})
+    print(f"Проверено методов: {checked}, запросов: {len(captured)}, нарушений: {violations}")
+    return 1 if violations else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
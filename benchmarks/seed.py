@@ -0,0 +1,138 @@
+"""Наполнение базы синтетическими данными для нагрузочных стендов
+
+Схема и начальные данные (категории, меню, уровни) создаются настоящим
+Database.init_database, затем users, orders, order_items, loyalty_points
+и loyalty_balances заполняются напрямую через sqlite3 пачками, затем
+пересчитывается дневной свод daily_stats.
+Заказы распределены по последним days дням, включая сегодняшний.
+
+Запуск: python -m benchmarks.seed --db /tmp/coffee_load.db --users 1000000 --orders-per-user 3
+"""
+import argparse
+import random
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta
+from typing import Dict
+
+from benchmarks.common import Timer
+from bot.daily_stats import BACKFILL as DAILY_STATS_BACKFILL
+from bot.database import Database
+from config.settings import settings
+
+TELEGRAM_ID_BASE = 10_000_000
+STATUSES = (('delivered', 0.80), ('ready', 0.05), ('cancelled', 0.05), ('confirmed', 0.04),
+            ('preparing', 0.03), ('pending', 0.03))
+
+
+def telegram_id(index: int) -> int:
+    """telegram_id синтетического пользователя с номером index (с нуля)"""
+    return TELEGRAM_ID_BASE + index
+
+
+def seed(path: str, users: int, orders_per_user: float = 3, max_items: int = 4, days: int = 90,
+         chunk: int = 20000, seed_value: int = 7) -> Dict[str, int]:
+    """Заполнение базы по пути path; возвращает количество вставленных строк по таблицам"""
+    settings.DATABASE_PATH = path
+    Database()  # миграции и начальные данные
+
+    rng = random.Random(seed_value)
+    now = datetime.now().replace(microsecond=0)
+    statuses = [status for status, _ in STATUSES]
+    weights = [weight for _, weight in STATUSES]
+    counts = {'users': 0, 'orders': 0, 'order_items': 0, 'loyalty_points': 0}
+
+    with closing(sqlite3.connect(path, isolation_level=None)) as conn:
+        conn.execute("PRAGMA synchronous = OFF")
+        menu = conn.execute("SELECT id, price FROM menu_items WHERE available = 1").fetchall()
+        next_user_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM users").fetchone()[0]
+        next_order_id = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM orders").fetchone()[0]
+
+        conn.execute("BEGIN")
+        for start in range(0, users, chunk):
+            user_rows, order_rows, item_rows, point_rows = [], [], [], []
+
+            for index in range(start, min(start + chunk, users)):
+                user_id = next_user_id + index
+                created = now - timedelta(seconds=rng.randint(0, days * 86400))
+                total_orders = 0
+                total_spent = 0.0
+
+                for _ in range(rng.randint(0, int(orders_per_user * 2))):
+                    order_id = next_order_id
+                    next_order_id += 1
+                    ordered_at = (now - timedelta(seconds=rng.randint(0, days * 86400))).isoformat(' ')
+                    status = rng.choices(statuses, weights)[0]
+
+                    total = 0.0
+                    for menu_item_id, price in rng.sample(menu, k=rng.randint(1, min(max_items, len(menu)))):
+                        quantity = rng.randint(1, 3)
+                        total += price * quantity
+                        item_rows.append((order_id, menu_item_id, quantity, price))
+
+                    order_rows.append((order_id, user_id, total, status, 'pickup', ordered_at, ordered_at))
+                    if status == 'cancelled':
+                        continue
+
+                    total_orders += 1
+                    total_spent += total
+                    points = int(total * settings.POINTS_PER_RUBLE)
+                    if points:
+                        point_rows.append((user_id, points, f"Заказ #{order_id}", order_id, ordered_at))
+                    if rng.random() < 0.05 and points > 10:
+                        point_rows.append((user_id, -(points // 2), "Обмен баллов", None, ordered_at))
+
+                user_rows.append((user_id, telegram_id(index), f"user{index}", f"User {index}",
+                                  total_orders, total_spent, created.isoformat(' '), created.isoformat(' ')))
+
+            conn.executemany(
+                '''INSERT INTO users (id, telegram_id, username, first_name, total_orders, total_spent,
+                                      created_at, last_active)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', user_rows)
+            conn.executemany(
+                '''INSERT INTO orders (id, user_id, total_amount, status, delivery_type, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)''', order_rows)
+            conn.executemany(
+                "INSERT INTO order_items (order_id, menu_item_id, quantity, price) VALUES (?, ?, ?, ?)",
+                item_rows)
+            conn.executemany(
+                "INSERT INTO loyalty_points (user_id, points, reason, order_id, created_at) VALUES (?, ?, ?, ?, ?)",
+                point_rows)
+
+            counts['users'] += len(user_rows)
+            counts['orders'] += len(order_rows)
+            counts['order_items'] += len(item_rows)
+            counts['loyalty_points'] += len(point_rows)
+
+        # Материализованные балансы, как их поддерживает record_points
+        conn.execute('''INSERT OR REPLACE INTO loyalty_balances (user_id, points, earned, spent)
+                        SELECT user_id,
+                               SUM(points),
+                               SUM(CASE WHEN points > 0 THEN points ELSE 0 END),
+                               SUM(CASE WHEN points < 0 THEN -points ELSE 0 END)
+                        FROM loyalty_points
+                        GROUP BY user_id''')
+        # Дневной свод, как его поддерживают create_order и регистрация
+        for statement in DAILY_STATS_BACKFILL:
+            conn.execute(statement)
+        conn.execute("COMMIT")
+        conn.execute("ANALYZE")
+
+    return counts
+
+
+def main(path: str, users: int, orders_per_user: float, days: int):
+    with Timer() as timer:
+        counts = seed(path, users, orders_per_user, days=days)
+    rows = sum(counts.values())
+    print(f"{path}: {counts} за {timer.elapsed:.1f}s ({rows / timer.elapsed:.0f} строк/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", required=True, help="путь к базе (создается, если нет)")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--orders-per-user", type=float, default=3)
+    parser.add_argument("--days", type=int, default=90)
+    args = parser.parse_args()
+    main(args.db, args.users, args.orders_per_user, args.days)
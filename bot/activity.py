@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from bot.database import Database
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityTracker:
+    """Последняя активность и профиль пользователей с отложенной записью
+
+    touch() для известного пользователя только запоминает время и данные
+    профиля в памяти; повторные касания между сбросами схлопываются в одну
+    строку. Раз в interval секунд (или при max_pending ожидающих) все
+    накопленное записывается в users одним пакетным upsert. Синхронно
+    пишется только новый пользователь, чтобы сразу после /start он был
+    в базе для заказов и профиля.
+    """
+
+    def __init__(self, db: Database, interval: float = 5, max_pending: int = 5000, max_known: int = 100000):
+        self.db = db
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_known = max_known
+
+        # telegram_id -> (username, first_name, last_name, last_active)
+        self._pending: Dict[int, Tuple[Optional[str], Optional[str], Optional[str], datetime]] = {}
+        # telegram_id пользователей, которые точно есть в users (LRU)
+        self._known: 'OrderedDict[int, None]' = OrderedDict()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.touches = 0
+        self.registered = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+
+    def _remember(self, telegram_id: int):
+        self._known[telegram_id] = None
+        self._known.move_to_end(telegram_id)
+        if len(self._known) > self.max_known:
+            self._known.popitem(last=False)
+
+    async def touch(self, user):
+        """Отметить активность пользователя Telegram; новый пользователь регистрируется сразу"""
+        self.touches += 1
+        if user.id in self._known:
+            self._known.move_to_end(user.id)
+        elif await self.db.get_user_id(user.id) is None:
+            await self.db.register_user(user)
+            self.registered += 1
+            self._remember(user.id)
+            return
+        else:
+            self._remember(user.id)
+
+        self._pending[user.id] = (user.username, user.first_name, user.last_name, datetime.now())
+        if len(self._pending) >= self.max_pending:
+            self._wake.set()
+
+    async def flush(self) -> int:
+        """Записать накопленную активность; возвращает количество строк"""
+        if not self._pending:
+            return 0
+
+        batch, self._pending = self._pending, {}
+        rows = [(telegram_id, *values) for telegram_id, values in batch.items()]
+        try:
+            await self.db.touch_users(rows)
+        except Exception:
+            # Возвращаем в очередь то, что не перекрыто более свежими касаниями
+            for telegram_id, values in batch.items():
+                self._pending.setdefault(telegram_id, values)
+            raise
+
+        self.flushes += 1
+        self.flushed_rows += len(rows)
+        return len(rows)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка с финальным сбросом"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи активности пользователей: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            'pending': len(self._pending),
+            'known': len(self._known),
+            'touches': self.touches,
+            'registered': self.registered,
+            'flushes': self.flushes,
+            'flushed_rows': self.flushed_rows
+        }
@@ -0,0 +1,82 @@
+import logging
+from typing import Dict
+
+from bot.database import Database
+
+logger = logging.getLogger(__name__)
+
+
+class LoyaltyAnalytics:
+    """Агрегаты программы лояльности за один проход
+
+    Каждый пользователь попадает ровно в один уровень; заработанные,
+    потраченные и оставшиеся баллы считаются в том же GROUP BY.
+    Источник - материализованные балансы (loyalty_balances) или сам леджер.
+    """
+
+    SOURCES = ('balances', 'ledger')
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    @staticmethod
+    def _source_sql(source: str) -> str:
+        if source == 'balances':
+            return "SELECT user_id, points, earned, spent FROM loyalty_balances"
+        if source == 'ledger':
+            # Один проход по индексу (user_id, created_at, points) без временной таблицы
+            return '''SELECT user_id,
+                             SUM(points)                                      as points,
+                             SUM(CASE WHEN points > 0 THEN points ELSE 0 END)  as earned,
+                             SUM(CASE WHEN points < 0 THEN -points ELSE 0 END) as spent
+                      FROM loyalty_points
+                      GROUP BY user_id'''
+        raise ValueError(f"Неизвестный источник статистики: {source}")
+
+    async def level_stats(self, levels, source: str = 'balances') -> Dict:
+        """Распределение пользователей по уровням и итоги по баллам
+
+        levels - LevelTable из LoyaltySystem.get_levels().
+        """
+        async with self.db.connect() as db:
+            cursor = await db.execute(f'''
+                                      SELECT {levels.sql_bucket('COALESCE(b.points, 0)')} as level_index,
+                                             COUNT(*)                                  as users_count,
+                                             COUNT(b.user_id)                          as active_users,
+                                             COALESCE(SUM(b.points), 0)                as outstanding,
+                                             COALESCE(SUM(b.earned), 0)                as earned,
+                                             COALESCE(SUM(b.spent), 0)                 as spent
+                                      FROM users u
+                                               LEFT JOIN ({self._source_sql(source)}) b ON b.user_id = u.id
+                                      GROUP BY level_index
+                                      ''')
+            rows = {row['level_index']: dict(row) for row in await cursor.fetchall()}
+
+        empty = {'users_count': 0, 'active_users': 0, 'outstanding': 0, 'earned': 0, 'spent': 0}
+        buckets = []
+
+        # Баланс ниже минимального порога (например, после списаний)
+        if -1 in rows:
+            buckets.append((None, rows[-1]))
+        for index, name in enumerate(levels.names):
+            buckets.append((name, rows.get(index, empty)))
+
+        levels_stats = [
+            {
+                'level': name,
+                'users': row['users_count'],
+                'points_outstanding': row['outstanding'],
+                'points_earned': row['earned'],
+                'points_spent': row['spent']
+            }
+            for name, row in buckets
+        ]
+
+        return {
+            'total_points': sum(row['outstanding'] for row in rows.values()),
+            'active_users': sum(row['active_users'] for row in rows.values()),
+            'points_earned': sum(row['earned'] for row in rows.values()),
+            'points_spent': sum(row['spent'] for row in rows.values()),
+            'points_outstanding': sum(row['outstanding'] for row in rows.values()),
+            'levels': levels_stats
+        }
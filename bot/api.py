@@ -0,0 +1,346 @@
+import hashlib
+import hmac
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import uvicorn
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from pydantic import BaseModel
+from telegram import Update
+from telegram.ext import Application
+
+from bot.database import Database
+from bot.export import export_stream, writer_for
+from bot.loyalty import LoyaltySystem
+from bot.menu_cache import MenuSnapshot
+from bot.metrics import MetricsRegistry
+from bot.pricing import PricingEngine
+from bot.webapp_auth import InitDataError, InitDataVerifier, LinkTokenError, LinkTokens, WebAppUser
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# Назначения токенов ссылок: поток статусов заказов и скачивание выгрузки
+ORDERS_STREAM = 'orders_stream'
+
+
+def export_purpose(dataset: str, fmt: str) -> str:
+    return f'export:{dataset}:{fmt}'
+
+
+class MenuPayloads:
+    """Готовые JSON-ответы меню с ETag, пересобираются только при смене снимка"""
+
+    def __init__(self):
+        self._snapshot: Optional[MenuSnapshot] = None
+        self._bodies: Dict[str, bytes] = {}
+        self._etags: Dict[str, str] = {}
+
+    def _serialize(self, snapshot: MenuSnapshot):
+        documents = {
+            'menu': [dict(item) for item in snapshot.items],
+            'categories': [
+                {'name': name, 'emoji': snapshot.emojis.get(name)}
+                for name in snapshot.categories
+            ]
+        }
+        for key, document in documents.items():
+            body = json.dumps(document, ensure_ascii=False, separators=(',', ':')).encode()
+            self._bodies[key] = body
+            self._etags[key] = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+        self._snapshot = snapshot
+
+    def response(self, key: str, snapshot: MenuSnapshot, request: Request) -> Response:
+        if snapshot is not self._snapshot:
+            self._serialize(snapshot)
+
+        etag = self._etags[key]
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match and etag in (tag.strip() for tag in if_none_match.split(',')):
+            return Response(status_code=304, headers=headers)
+
+        return Response(self._bodies[key], media_type='application/json', headers=headers)
+
+
+class CartItem(BaseModel):
+    id: int
+    quantity: int = 1
+    notes: Optional[str] = None
+
+
+class QuoteRequest(BaseModel):
+    items: List[CartItem]
+    delivery_type: str = 'pickup'
+    points_to_use: int = 0
+
+
+def create_app(db: Database, loyalty: LoyaltySystem, verifier: Optional[InitDataVerifier] = None,
+               pricing: Optional[PricingEngine] = None, application: Optional[Application] = None,
+               metrics: Optional[MetricsRegistry] = None) -> FastAPI:
+    """ASGI-приложение с API для Mini App и статикой webapp/admin_panel
+
+    С application добавляется прием апдейтов Telegram по webhook,
+    с metrics - выдача метрик в формате Prometheus на /metrics (по METRICS_TOKEN).
+    """
+    app = FastAPI(title=f"{settings.SHOP_NAME} API", docs_url=None, redoc_url=None)
+    payloads = MenuPayloads()
+    pricing = pricing or PricingEngine(db, loyalty)
+    verifier = verifier or InitDataVerifier(
+        settings.BOT_TOKEN,
+        max_age=settings.WEBAPP_AUTH_MAX_AGE,
+        ttl=settings.WEBAPP_AUTH_CACHE_TTL,
+        max_entries=settings.WEBAPP_AUTH_CACHE_SIZE
+    )
+    app.state.verifier = verifier
+    link_tokens = LinkTokens(ttl=settings.LINK_TOKEN_TTL)
+    app.state.link_tokens = link_tokens
+
+    async def resolve_user(init_data: Optional[str]) -> WebAppUser:
+        """Пользователь из initData
+
+        users.id запоминается в закешированном WebAppUser, так что повторные
+        запросы той же сессии не обращаются к таблице users.
+        """
+        try:
+            user = verifier.verify(init_data)
+        except InitDataError as e:
+            raise HTTPException(status_code=401, detail=str(e))
+
+        if user.user_id is None:
+            user.user_id = await db.get_user_id(user.telegram_id)
+            if user.user_id is None:
+                raise HTTPException(status_code=404, detail="Пользователь не найден")
+        return user
+
+    async def current_user(x_telegram_init_data: Optional[str] = Header(None)) -> WebAppUser:
+        """Пользователь из заголовка X-Telegram-Init-Data"""
+        return await resolve_user(x_telegram_init_data)
+
+    def check_admin(user: WebAppUser) -> WebAppUser:
+        if str(user.telegram_id) not in settings.ADMIN_IDS:
+            raise HTTPException(status_code=403, detail="Доступ запрещен")
+        return user
+
+    async def current_admin(x_telegram_init_data: Optional[str] = Header(None)) -> WebAppUser:
+        """Администратор из заголовка X-Telegram-Init-Data"""
+        try:
+            user = verifier.verify(x_telegram_init_data)
+        except InitDataError as e:
+            raise HTTPException(status_code=401, detail=str(e))
+        return check_admin(user)
+
+    @app.get("/api/menu")
+    async def menu(request: Request):
+        return payloads.response('menu', await db.get_menu(), request)
+
+    @app.get("/api/menu/categories")
+    async def menu_categories(request: Request):
+        return payloads.response('categories', await db.get_menu(), request)
+
+    @app.post("/api/cart/quote")
+    async def cart_quote(request: QuoteRequest, user: WebAppUser = Depends(current_user)):
+        quote = await pricing.quote(
+            [{'id': item.id, 'quantity': item.quantity, 'notes': item.notes} for item in request.items],
+            delivery_type=request.delivery_type,
+            points_to_use=request.points_to_use,
+            user_id=user.user_id
+        )
+        return quote.to_dict()
+
+    @app.get("/api/user/profile")
+    async def user_profile(user: WebAppUser = Depends(current_user)):
+        user_data = await db.get_user_data_by_id(user.user_id)
+        if not user_data:
+            raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+        fields = ('first_name', 'last_name', 'username', 'phone', 'email',
+                  'total_orders', 'total_spent', 'avg_order', 'created_at')
+        return {field: user_data.get(field) for field in fields}
+
+    @app.get("/api/user/loyalty")
+    async def user_loyalty(user: WebAppUser = Depends(current_user)):
+        if not settings.LOYALTY_ENABLED:
+            return {'points': 0, 'level': None}
+
+        levels = await loyalty.get_levels()
+        level = levels.level_info(await loyalty.get_points_by_user_id(user.user_id))
+        return {'points': level['points'], 'level': level}
+
+    @app.get("/api/user/orders")
+    async def user_orders(user: WebAppUser = Depends(current_user), limit: int = 50):
+        # LIMIT -1 в SQLite - без ограничения, поэтому и снизу
+        orders = await db.get_orders_by_user_id(user.user_id, limit=max(1, min(limit, 100)))
+        items = await db.get_orders_items([order['id'] for order in orders])
+
+        return [
+            {
+                'id': order['id'],
+                'date': order['created_at'],
+                'status': order['status'],
+                'total': order['total_amount'],
+                'delivery_type': order['delivery_type'],
+                'items': [
+                    {
+                        'id': item['menu_item_id'],
+                        'name': item['name'],
+                        'quantity': item['quantity'],
+                        'price': item['price']
+                    }
+                    for item in items.get(order['id'], [])
+                ]
+            }
+            for order in orders
+        ]
+
+    @app.post("/api/user/orders/stream/token")
+    async def user_orders_stream_token(user: WebAppUser = Depends(current_user)):
+        """Токен для адреса потока статусов: EventSource не умеет передавать заголовки"""
+        return {'token': link_tokens.issue(user, ORDERS_STREAM), 'expires_in': link_tokens.ttl}
+
+    @app.get("/api/user/orders/stream")
+    async def user_orders_stream(token: Optional[str] = None,
+                                 x_telegram_init_data: Optional[str] = Header(None)):
+        """Статусы заказов в реальном времени (Server-Sent Events)
+
+        Браузер подключается с token из /api/user/orders/stream/token
+        (многоразовый в пределах LINK_TOKEN_TTL - EventSource переподключается
+        по тому же адресу), остальные клиенты - с заголовком initData.
+        """
+        if token is not None:
+            try:
+                user = link_tokens.redeem(token, ORDERS_STREAM)
+            except LinkTokenError as e:
+                raise HTTPException(status_code=401, detail=str(e))
+        else:
+            user = await resolve_user(x_telegram_init_data)
+
+        async def stream():
+            async with db.order_events.subscribe(user.telegram_id) as subscription:
+                yield b"retry: 5000\n\n"
+                while True:
+                    message = await subscription.get(timeout=settings.SSE_KEEPALIVE)
+                    yield message if message is not None else b": keepalive\n\n"
+
+        return StreamingResponse(stream(), media_type='text/event-stream',
+                                 headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    @app.post("/api/admin/export/{dataset}/token")
+    async def admin_export_token(dataset: str, fmt: str = Query('ndjson', alias='format'),
+                                 admin: WebAppUser = Depends(current_admin)):
+        """Одноразовый токен для ссылки на скачивание: initData в адрес не попадает"""
+        try:
+            writer_for(dataset, fmt)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        token = link_tokens.issue(admin, export_purpose(dataset, fmt), single_use=True)
+        return {'token': token, 'expires_in': link_tokens.ttl}
+
+    @app.get("/api/admin/export/{dataset}")
+    async def admin_export(dataset: str, fmt: str = Query('ndjson', alias='format'), token: Optional[str] = None,
+                           x_telegram_init_data: Optional[str] = Header(None)):
+        """Выгрузка меню, заказов или леджера баллов файлом; строки читаются и отдаются страницами
+
+        Ссылка на скачивание несет token из /api/admin/export/{dataset}/token,
+        запрос из кода - заголовок initData.
+        """
+        try:
+            writer = writer_for(dataset, fmt)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        if token is not None:
+            try:
+                admin = check_admin(link_tokens.redeem(token, export_purpose(dataset, fmt)))
+            except LinkTokenError as e:
+                raise HTTPException(status_code=401, detail=str(e))
+        else:
+            admin = await current_admin(x_telegram_init_data)
+
+        logger.info(f"Выгрузка {dataset} ({fmt}) для администратора {admin.telegram_id}")
+        filename = f"{dataset}-{datetime.now():%Y%m%d-%H%M}.{writer.extension}"
+        return StreamingResponse(export_stream(db, dataset, fmt, settings.EXPORT_PAGE_SIZE),
+                                 media_type=writer.media_type,
+                                 headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+    if application is not None:
+        @app.post(settings.WEBHOOK_PATH)
+        async def telegram_webhook(request: Request,
+                                   x_telegram_bot_api_secret_token: Optional[str] = Header(None)):
+            """Апдейт от Telegram: ставится в очередь приложения, ответ сразу
+
+            Без настроенного WEBHOOK_SECRET не принимается ни один апдейт.
+            """
+            if not settings.WEBHOOK_SECRET or not hmac.compare_digest(
+                    (x_telegram_bot_api_secret_token or '').encode(), settings.WEBHOOK_SECRET.encode()):
+                raise HTTPException(status_code=403, detail="Неверный секретный токен")
+
+            try:
+                update = Update.de_json(await request.json(), application.bot)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Некорректный апдейт")
+
+            await application.update_queue.put(update)
+            return Response(status_code=200)
+
+    if metrics is not None:
+        metrics.collector('webapp_auth', verifier.stats)
+        metrics.collector('link_tokens', link_tokens.stats)
+
+        # Порт API публичный, поэтому метрики отдаются только с Bearer-токеном из настроек
+        if not settings.METRICS_TOKEN:
+            logger.warning("METRICS_TOKEN не задан, /metrics не публикуется")
+        else:
+            @app.get("/metrics", response_class=PlainTextResponse)
+            async def prometheus_metrics(authorization: Optional[str] = Header(None)):
+                scheme, _, token = (authorization or '').partition(' ')
+                if scheme.lower() != 'bearer' or not hmac.compare_digest(
+                        token.encode(), settings.METRICS_TOKEN.encode()):
+                    raise HTTPException(status_code=401, detail="Неверный токен метрик",
+                                        headers={'WWW-Authenticate': 'Bearer'})
+                return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+    # Статика после API, чтобы не перекрывать /api/*
+    app.mount("/admin", StaticFiles(directory=ROOT_DIR / "admin_panel", html=True), name="admin")
+    app.mount("/", StaticFiles(directory=ROOT_DIR / "webapp", html=True), name="webapp")
+
+    return app
+
+
+class StripQueryFilter(logging.Filter):
+    """Журнал доступа uvicorn без строки запроса: в ней бывают токены ссылок"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Аргументы uvicorn.access: (клиент, метод, путь с запросом, версия HTTP, статус)
+        if isinstance(record.args, tuple) and len(record.args) >= 3:
+            path = record.args[2]
+            if isinstance(path, str) and '?' in path:
+                record.args = record.args[:2] + (path.split('?', 1)[0],) + record.args[3:]
+        return True
+
+
+class ApiServer(uvicorn.Server):
+    """uvicorn внутри event loop бота: сигналы остаются за ботом"""
+
+    def install_signal_handlers(self):
+        pass
+
+
+def create_server(app: FastAPI) -> ApiServer:
+    # SSE-соединения не завершаются сами: при остановке ждем их недолго
+    config = uvicorn.Config(app, host=settings.API_HOST, port=settings.API_PORT, log_level="info",
+                            timeout_graceful_shutdown=5)
+    # Config настраивает логирование uvicorn, поэтому фильтр - после него
+    access_log = logging.getLogger("uvicorn.access")
+    if not any(isinstance(item, StripQueryFilter) for item in access_log.filters):
+        access_log.addFilter(StripQueryFilter())
+    return ApiServer(config)
@@ -0,0 +1,92 @@
+"""Дневной свод (daily_stats) для статистики админа
+
+Строка на день: заказы по группам статусов, выручка, новые пользователи
+и уникальные заказавшие. create_order, update_order_status и регистрация
+пользователей обновляют свод в своих транзакциях (Database._rollup_*),
+поэтому get_admin_stats читает несколько строк вместо заказов и
+пользователей за день.
+
+Уникальные заказавшие за несколько дней считаются без перебора заказов:
+user_last_order хранит день последнего заказа пользователя, а
+last_active_users - сколько пользователей заказывали последний раз в этот
+день. Каждый пользователь учтен ровно в одном дне, так что сумма
+last_active_users за окно - число разных заказавших в нем.
+
+Пересчет свода по истории: python -m bot.daily_stats
+"""
+import asyncio
+from typing import Dict, Optional, Tuple
+
+# Группы статусов заказа - колонки daily_stats
+STATUS_BUCKETS: Dict[str, str] = {
+    'pending': 'new_orders',
+    'confirmed': 'processing_orders',
+    'preparing': 'processing_orders',
+    'on_delivery': 'processing_orders',
+    'ready': 'completed_orders',
+    'delivered': 'completed_orders',
+    'cancelled': 'cancelled_orders',
+}
+BUCKET_COLUMNS: Tuple[str, ...] = ('new_orders', 'processing_orders', 'completed_orders', 'cancelled_orders')
+
+
+def bucket(status: Optional[str]) -> Optional[str]:
+    """Колонка daily_stats для статуса; None для статусов вне групп"""
+    return STATUS_BUCKETS.get(status)
+
+
+def _bucket_sums() -> str:
+    sums = []
+    for column in BUCKET_COLUMNS:
+        statuses = ', '.join(f"'{status}'" for status, target in STATUS_BUCKETS.items() if target == column)
+        sums.append(f"SUM(CASE WHEN status IN ({statuses}) THEN 1 ELSE 0 END)")
+    return ',\n                  '.join(sums)
+
+
+# Пересчет свода по orders и users; используется миграцией и командой пересчета
+BACKFILL: Tuple[str, ...] = (
+    "DELETE FROM daily_stats",
+    "DELETE FROM user_last_order",
+    f'''INSERT INTO daily_stats (day, total_orders, {', '.join(BUCKET_COLUMNS)}, revenue, active_users)
+        SELECT DATE(created_at),
+               COUNT(*),
+               {_bucket_sums()},
+               COALESCE(SUM(total_amount), 0),
+               COUNT(DISTINCT user_id)
+        FROM orders
+        WHERE created_at IS NOT NULL
+        GROUP BY DATE(created_at)''',
+    '''INSERT INTO daily_stats (day, new_users)
+       SELECT DATE(created_at), COUNT(*)
+       FROM users
+       WHERE created_at IS NOT NULL
+       GROUP BY DATE(created_at)
+       ON CONFLICT (day) DO UPDATE SET new_users = excluded.new_users''',
+    '''INSERT INTO user_last_order (user_id, day)
+       SELECT user_id, DATE(MAX(created_at))
+       FROM orders
+       WHERE created_at IS NOT NULL
+       GROUP BY user_id''',
+    '''INSERT INTO daily_stats (day, last_active_users)
+       SELECT day, COUNT(*)
+       FROM user_last_order
+       WHERE true
+       GROUP BY day
+       ON CONFLICT (day) DO UPDATE SET last_active_users = excluded.last_active_users''',
+)
+
+
+async def main():
+    from bot.database import Database
+
+    db = Database()
+    await db.open()
+    try:
+        days = await db.rebuild_daily_stats()
+        print(f"Дневной свод пересчитан: {days} дн.")
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,11 +1,22 @@
 import sqlite3
 import aiosqlite
 import json
+from contextlib import closing
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Any
+from typing import AsyncIterator, List, Dict, Optional, Any, Mapping, Sequence, Set, Tuple, TYPE_CHECKING
 from config.settings import settings
+from bot.daily_stats import BACKFILL as DAILY_STATS_BACKFILL, bucket
+from bot.events import EventBus
+from bot.export import DATASETS as EXPORT_DATASETS
+from bot.menu_cache import MenuCache, MenuSnapshot
+from bot.menu_sync import MenuSyncPlan, content_hash, diff_menu, iterate, sync_menu_items
+from bot.migrations import migrate
+from bot.pool import ConnectionPool
 import logging
 
+if TYPE_CHECKING:
+    from bot.pricing import Quote
+
 logger = logging.getLogger(__name__)
 
 
@@ -13,363 +24,78 @@ class Database:
     def __init__(self):
         self.db_path = settings.DATABASE_PATH
         self.init_database()
+        self.pool = ConnectionPool(
+            self.db_path,
+            readers=settings.DB_POOL_READERS,
+            pragmas=self.storage_profile(),
+            max_batch=settings.DB_WRITE_BATCH
+        )
+        self.menu_cache = MenuCache(self._load_menu_snapshot, enabled=settings.MENU_CACHE_ENABLED)
+        # Изменения статусов заказов для подписчиков Mini App (тема - telegram_id)
+        self.order_events = EventBus()
+
+    @staticmethod
+    def storage_profile() -> Dict[str, Any]:
+        """Настройки SQLite для всех соединений пула"""
+        return {
+            'journal_mode': settings.DB_JOURNAL_MODE,
+            'synchronous': settings.DB_SYNCHRONOUS,
+            'mmap_size': settings.DB_MMAP_SIZE,
+            'cache_size': settings.DB_CACHE_SIZE,
+            'busy_timeout': settings.DB_BUSY_TIMEOUT,
+            'temp_store': 'MEMORY'
+        }
+
+    async def open(self):
+        """Открытие пула соединений (вызывается при старте бота)"""
+        await self.pool.open()
+
+    async def close(self):
+        """Закрытие пула соединений (вызывается при остановке бота)"""
+        await self.pool.close()
+
+    def connect(self):
+        """Соединение для чтения из пула"""
+        return self.pool.reader()
+
+    def transaction(self):
+        """Транзакция через очередь записи: изменения фиксируются при выходе из блока
+
+        Внутри блока нельзя вызывать commit() и открывать вложенные транзакции.
+        """
+        return self.pool.writer()
+
+    async def iter_pages(self, query: str, page_size: int = 1000, after: int = 0) -> AsyncIterator[List[aiosqlite.Row]]:
+        """Постраничное чтение по возрастанию id
+
+        query принимает параметры (after, limit) и возвращает id первой колонкой.
+        Соединение берется из пула на каждую страницу, так что длинная выгрузка
+        не занимает читателя между страницами.
+        """
+        while True:
+            async with self.connect() as db:
+                cursor = await db.execute(query, (after, page_size))
+                rows = await cursor.fetchall()
+            if not rows:
+                return
+            yield rows
+            if len(rows) < page_size:
+                return
+            after = rows[-1][0]
 
     def init_database(self):
-        """Инициализация базы данных"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
+        """Инициализация базы данных: миграции схемы и начальные данные"""
+        with closing(sqlite3.connect(self.db_path, isolation_level=None)) as conn:
+            # WAL сохраняется в файле базы: читатели не блокируются писателем
+            conn.execute(f"PRAGMA journal_mode = {settings.DB_JOURNAL_MODE}")
 
-            # Пользователи
-            cursor.execute('''
-                           CREATE TABLE IF NOT EXISTS users
-                           (
-                               id
-                               INTEGER
-                               PRIMARY
-                               KEY
-                               AUTOINCREMENT,
-                               telegram_id
-                               INTEGER
-                               UNIQUE
-                               NOT
-                               NULL,
-                               username
-                               TEXT,
-                               first_name
-                               TEXT
-                               NOT
-                               NULL,
-                               last_name
-                               TEXT,
-                               phone
-                               TEXT,
-                               email
-                               TEXT,
-                               balance
-                               REAL
-                               DEFAULT
-                               0,
-                               total_orders
-                               INTEGER
-                               DEFAULT
-                               0,
-                               total_spent
-                               REAL
-                               DEFAULT
-                               0,
-                               created_at
-                               TIMESTAMP
-                               DEFAULT
-                               CURRENT_TIMESTAMP,
-                               last_active
-                               TIMESTAMP
-                               DEFAULT
-                               CURRENT_TIMESTAMP
-                           )
-                           ''')
-
-            # Программа лояльности
-            cursor.execute('''
-                           CREATE TABLE IF NOT EXISTS loyalty_points
-                           (
-                               id
-                               INTEGER
-                               PRIMARY
-                               KEY
-                               AUTOINCREMENT,
-                               user_id
-                               INTEGER
-                               NOT
-                               NULL,
-                               points
-                               INTEGER
-                               NOT
-                               NULL,
-                               reason
-                               TEXT,
-                               order_id
-                               INTEGER,
-                               created_at
-                               TIMESTAMP
-                               DEFAULT
-                               CURRENT_TIMESTAMP,
-                               FOREIGN
-                               KEY
-                           (
-                               user_id
-                           ) REFERENCES users
-                           (
-                               id
-                           )
-                               )
-                           ''')
-
-            cursor.execute('''
-                           CREATE TABLE IF NOT EXISTS loyalty_levels
-                           (
-                               id
-                               INTEGER
-                               PRIMARY
-                               KEY
-                               AUTOINCREMENT,
-                               name
-                               TEXT
-                               NOT
-                               NULL,
-                               min_points
-                               INTEGER
-                               NOT
-                               NULL,
-                               discount
-                               INTEGER
-                               NOT
-                               NULL,
-                               color
-                               TEXT
-                               DEFAULT
-                               '#3498db'
-                           )
-                           ''')
-
-            # Категории меню
-            cursor.execute('''
-                           CREATE TABLE IF NOT EXISTS categories
-                           (
-                               id
-                               INTEGER
-                               PRIMARY
-                               KEY
-                               AUTOINCREMENT,
-                               name
-                               TEXT
-                               NOT
-                               NULL
-                               UNIQUE,
-                               emoji
-                               TEXT,
-                               position
-                               INTEGER
-                               DEFAULT
-                               0
-                           )
-                           ''')
-
-            # Меню
-            cursor.execute('''
-                           CREATE TABLE IF NOT EXISTS menu_items
-                           (
-                               id
-                               INTEGER
-                               PRIMARY
-                               KEY
-                               AUTOINCREMENT,
-                               category_id
-                               INTEGER,
-                               name
-                               TEXT
-                               NOT
-                               NULL,
-                               description
-                               TEXT,
-                               price
-                               REAL
-                               NOT
-                               NULL,
-                               image_url
-                               TEXT,
-                               available
-                               BOOLEAN
-                               DEFAULT
-                               1,
-                               position
-                               INTEGER
-                               DEFAULT
-                               0,
-                               external_id
-                               TEXT
-                               UNIQUE,
-                               sync_enabled
-                               BOOLEAN
-                               DEFAULT
-                               0,
-                               created_at
-                               TIMESTAMP
-                               DEFAULT
-                               CURRENT_TIMESTAMP,
-                               updated_at
-                               TIMESTAMP
-                               DEFAULT
-                               CURRENT_TIMESTAMP,
-                               FOREIGN
-                               KEY
-                           (
-                               category_id
-                           ) REFERENCES categories
-                           (
-                               id
-                           )
-                               )
-                           ''')
-
-            # Заказы
-            cursor.execute('''
-                           CREATE TABLE IF NOT EXISTS orders
-                           (
-                               id
-                               INTEGER
-                               PRIMARY
-                               KEY
-                               AUTOINCREMENT,
-                               user_id
-                               INTEGER
-                               NOT
-                               NULL,
-                               total_amount
-                               REAL
-                               NOT
-                               NULL,
-                               status
-                               TEXT
-                               DEFAULT
-                               'pending',
-                               payment_method
-                               TEXT
-                               DEFAULT
-                               'cash',
-                               delivery_type
-                               TEXT
-                               DEFAULT
-                               'pickup',
-                               address
-                               TEXT,
-                               phone
-                               TEXT,
-                               notes
-                               TEXT,
-                               scheduled_time
-                               TIMESTAMP,
-                               created_at
-                               TIMESTAMP
-                               DEFAULT
-                               CURRENT_TIMESTAMP,
-                               updated_at
-                               TIMESTAMP
-                               DEFAULT
-                               CURRENT_TIMESTAMP,
-                               external_sync
-                               BOOLEAN
-                               DEFAULT
-                               0,
-                               FOREIGN
-                               KEY
-                           (
-                               user_id
-                           ) REFERENCES users
-                           (
-                               id
-                           )
-                               )
-                           ''')
-
-            # Позиции заказа
-            cursor.execute('''
-                           CREATE TABLE IF NOT EXISTS order_items
-                           (
-                               id
-                               INTEGER
-                               PRIMARY
-                               KEY
-                               AUTOINCREMENT,
-                               order_id
-                               INTEGER
-                               NOT
-                               NULL,
-                               menu_item_id
-                               INTEGER
-                               NOT
-                               NULL,
-                               quantity
-                               INTEGER
-                               NOT
-                               NULL,
-                               price
-                               REAL
-                               NOT
-                               NULL,
-                               notes
-                               TEXT,
-                               FOREIGN
-                               KEY
-                           (
-                               order_id
-                           ) REFERENCES orders
-                           (
-                               id
-                           ),
-                               FOREIGN KEY
-                           (
-                               menu_item_id
-                           ) REFERENCES menu_items
-                           (
-                               id
-                           )
-                               )
-                           ''')
-
-            # Настройки
-            cursor.execute('''
-                           CREATE TABLE IF NOT EXISTS settings
-                           (
-                               key
-                               TEXT
-                               PRIMARY
-                               KEY,
-                               value
-                               TEXT,
-                               updated_at
-                               TIMESTAMP
-                               DEFAULT
-                               CURRENT_TIMESTAMP
-                           )
-                           ''')
-
-            # Внешние интеграции
-            cursor.execute('''
-                           CREATE TABLE IF NOT EXISTS external_sync
-                           (
-                               id
-                               INTEGER
-                               PRIMARY
-                               KEY
-                               AUTOINCREMENT,
-                               entity_type
-                               TEXT
-                               NOT
-                               NULL,
-                               entity_id
-                               INTEGER
-                               NOT
-                               NULL,
-                               external_id
-                               TEXT,
-                               sync_status
-                               TEXT
-                               DEFAULT
-                               'pending',
-                               last_sync
-                               TIMESTAMP,
-                               UNIQUE
-                           (
-                               entity_type,
-                               entity_id
-                           )
-                               )
-                           ''')
+            self.schema_version = migrate(conn)
 
             # Добавляем начальные данные
+            cursor = conn.cursor()
+            cursor.execute("BEGIN")
             self._add_initial_data(cursor)
-
-            conn.commit()
+            cursor.execute("COMMIT")
 
     def _add_initial_data(self, cursor):
         """Добавление начальных данных"""
@@ -452,74 +178,87 @@ class Database:
             sample_items
         )
 
-    async def register_user(self, user):
-        """Регистрация пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                """INSERT
-                OR IGNORE INTO users 
-                (telegram_id, username, first_name, last_name, created_at) 
-                VALUES (?, ?, ?, ?, ?)""",
-                (user.id, user.username, user.first_name, user.last_name, datetime.now())
-            )
+    USER_UPSERT = """INSERT INTO users (telegram_id, username, first_name, last_name, created_at, last_active)
+                     VALUES (?, ?, ?, ?, ?, ?)
+                     ON CONFLICT (telegram_id) DO UPDATE
+                         SET last_active = excluded.last_active,
+                             username    = COALESCE(excluded.username, users.username),
+                             first_name  = COALESCE(excluded.first_name, users.first_name),
+                             last_name   = COALESCE(excluded.last_name, users.last_name)"""
 
-            await db.execute(
-                """UPDATE users
-                   SET last_active = ?,
-                       username    = COALESCE(?, username),
-                       first_name  = COALESCE(?, first_name),
-                       last_name   = COALESCE(?, last_name)
-                   WHERE telegram_id = ?""",
-                (datetime.now(), user.username, user.first_name, user.last_name, user.id)
+    async def register_user(self, user):
+        """Регистрация пользователя (или обновление профиля и last_active)"""
+        now = datetime.now()
+        async with self.transaction() as db:
+            last_id = await self._last_user_id(db)
+            await db.execute(self.USER_UPSERT, (user.id, user.username, user.first_name, user.last_name, now, now))
+            await self._rollup_new_users(db, last_id)
+
+    async def touch_users(self, rows: Sequence[Tuple]):
+        """Пакетная запись активности: (telegram_id, username, first_name, last_name, last_active)"""
+        async with self.transaction() as db:
+            last_id = await self._last_user_id(db)
+            await db.executemany(
+                self.USER_UPSERT,
+                [(telegram_id, username, first_name, last_name, seen, seen)
+                 for telegram_id, username, first_name, last_name, seen in rows]
             )
-
-            await db.commit()
+            await self._rollup_new_users(db, last_id)
+
+    @staticmethod
+    async def _last_user_id(db) -> int:
+        cursor = await db.execute("SELECT COALESCE(MAX(id), 0) FROM users")
+        return (await cursor.fetchone())[0]
+
+    @staticmethod
+    async def _rollup_new_users(db, last_id: int):
+        """Новые пользователи в daily_stats (внутри transaction()): вставленные upsert'ом строки - с id > last_id"""
+        await db.execute('''
+                         INSERT INTO daily_stats (day, new_users)
+                         SELECT DATE(created_at), COUNT(*)
+                         FROM users
+                         WHERE id > ?
+                         GROUP BY DATE(created_at)
+                         ON CONFLICT (day) DO UPDATE SET new_users = new_users + excluded.new_users
+                         ''', (last_id,))
 
     async def get_user_data(self, telegram_id: int) -> Dict:
         """Получение данных пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        return await self._fetch_user_data("telegram_id", telegram_id)
+
+    async def get_user_data_by_id(self, user_id: int) -> Optional[Dict]:
+        """Данные пользователя по users.id (когда id уже известен, например в API)"""
+        return await self._fetch_user_data("id", user_id)
+
+    async def get_user_id(self, telegram_id: int) -> Optional[int]:
+        """users.id по telegram_id"""
+        async with self.connect() as db:
+            cursor = await db.execute("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,))
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+    async def _fetch_user_data(self, column: str, value: int) -> Optional[Dict]:
+        async with self.connect() as db:
             cursor = await db.execute(
-                """SELECT *,
+                f"""SELECT *,
                           (SELECT COUNT(*) FROM orders WHERE user_id = users.id)                       as total_orders,
                           (SELECT COALESCE(SUM(total_amount), 0) FROM orders WHERE user_id = users.id) as total_spent,
                           (SELECT COALESCE(AVG(total_amount), 0) FROM orders WHERE user_id = users.id) as avg_order
                    FROM users
-                   WHERE telegram_id = ?""",
-                (telegram_id,)
+                   WHERE {column} = ?""",
+                (value,)
             )
             row = await cursor.fetchone()
             return dict(row) if row else None
 
-    async def get_menu_categories(self) -> List[str]:
-        """Получение категорий меню"""
-        async with aiosqlite.connect(self.db_path) as db:
+    async def _load_menu_snapshot(self, version: int) -> MenuSnapshot:
+        """Чтение меню из базы для кэша"""
+        async with self.connect() as db:
             cursor = await db.execute(
-                "SELECT name FROM categories ORDER BY position"
+                "SELECT name, emoji FROM categories ORDER BY position"
             )
-            rows = await cursor.fetchall()
-            return [row[0] for row in rows]
+            categories = await cursor.fetchall()
 
-    async def get_menu_items_by_category(self, category: str) -> List[Dict]:
-        """Получение товаров по категории"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute('''
-                                      SELECT mi.*
-                                      FROM menu_items mi
-                                               JOIN categories c ON mi.category_id = c.id
-                                      WHERE c.name = ?
-                                        AND mi.available = 1
-                                      ORDER BY mi.position
-                                      ''', (category,))
-
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
-
-    async def get_all_menu_items(self) -> List[Dict]:
-        """Получение всех товаров меню"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
             cursor = await db.execute('''
                                       SELECT mi.*, c.name as category_name, c.emoji as category_emoji
                                       FROM menu_items mi
@@ -527,57 +266,89 @@ class Database:
                                       WHERE mi.available = 1
                                       ORDER BY c.position, mi.position
                                       ''')
+            items = await cursor.fetchall()
 
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
+        return MenuSnapshot.build(version, categories, items)
 
-    async def create_order(self, user_id: int, order_data: Dict) -> int:
-        """Создание заказа"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Получаем ID пользователя в базе
-            cursor = await db.execute(
-                "SELECT id FROM users WHERE telegram_id = ?",
-                (user_id,)
-            )
-            user_row = await cursor.fetchone()
-            if not user_row:
-                raise ValueError("Пользователь не найден")
+    async def get_menu(self) -> MenuSnapshot:
+        """Текущий снимок меню из кэша"""
+        return await self.menu_cache.get()
 
-            db_user_id = user_row[0]
+    def invalidate_menu(self):
+        """Сброс кэша меню; вызывается после фиксации любых изменений меню"""
+        self.menu_cache.invalidate()
+
+    async def get_menu_categories(self) -> Sequence[str]:
+        """Получение категорий меню"""
+        return (await self.get_menu()).categories
 
-            # Создаем заказ
+    async def get_menu_items_by_category(self, category: str) -> Sequence[Mapping]:
+        """Получение товаров по категории"""
+        return (await self.get_menu()).by_category.get(category, ())
+
+    async def get_all_menu_items(self) -> Sequence[Mapping]:
+        """Получение всех товаров меню"""
+        return (await self.get_menu()).items
+
+    async def create_order(self, user_id: int, order_data: Dict, quote: 'Quote',
+                           idempotency_key: Optional[str] = None) -> Tuple[int, bool]:
+        """Создание заказа; возвращает (ID заказа, создан ли он этим вызовом)
+
+        Позиции, цены, сумма и баллы берутся из расчета (PricingEngine),
+        из order_data - только контакты, адрес и пожелания. Заказ, его
+        позиции, статистика пользователя, списание и начисление баллов
+        записываются одной транзакцией. Если заказ с тем же idempotency_key
+        уже есть, ничего не пишется и возвращается (его ID, False) - по
+        этому признаку вызывающий код не шлет повторные уведомления.
+        """
+        if not quote.ok:
+            raise ValueError("; ".join(quote.problems))
+
+        now = datetime.now()
+
+        async with self.transaction() as db:
+            # Создаем заказ, ID пользователя находим в том же запросе
             cursor = await db.execute('''
                                       INSERT INTO orders
                                       (user_id, total_amount, status, payment_method, delivery_type,
-                                       address, phone, notes, scheduled_time, created_at)
-                                      VALUES (?, ?, 'pending', ?, ?, ?, ?, ?, ?, ?)
+                                       address, phone, notes, scheduled_time, created_at, idempotency_key)
+                                      SELECT id, ?, 'pending', ?, ?, ?, ?, ?, ?, ?, ?
+                                      FROM users
+                                      WHERE telegram_id = ?
+                                      ON CONFLICT DO NOTHING
+                                      RETURNING id, user_id
                                       ''', (
-                                          db_user_id,
-                                          order_data['total'],
+                                          quote.total,
                                           order_data.get('paymentMethod', 'cash'),
-                                          order_data.get('deliveryType', 'pickup'),
+                                          quote.delivery_type,
                                           order_data.get('address'),
                                           order_data.get('phone'),
                                           order_data.get('notes'),
                                           order_data.get('scheduledTime'),
-                                          datetime.now()
+                                          now,
+                                          idempotency_key,
+                                          user_id
                                       ))
+            row = await cursor.fetchone()
+            await cursor.close()
+            if not row:
+                # Повтор уже записанного заказа
+                existing = await self._order_id_by_key(db, user_id, idempotency_key) if idempotency_key else None
+                if existing is not None:
+                    return existing, False
+                raise ValueError("Пользователь не найден")
 
-            order_id = cursor.lastrowid
+            order_id, db_user_id = row
 
-            # Добавляем позиции заказа
-            for item in order_data['items']:
-                await db.execute('''
+            # Добавляем позиции заказа одним пакетом
+            await db.executemany('''
                                  INSERT INTO order_items
                                      (order_id, menu_item_id, quantity, price, notes)
                                  VALUES (?, ?, ?, ?, ?)
-                                 ''', (
-                                     order_id,
-                                     item['id'],
-                                     item['quantity'],
-                                     item['price'],
-                                     item.get('notes')
-                                 ))
+                                 ''', [
+                                     (order_id, line.id, line.quantity, line.price, line.notes)
+                                     for line in quote.lines
+                                 ])
 
             # Обновляем статистику пользователя
             await db.execute('''
@@ -586,15 +357,97 @@ class Database:
                                  total_spent  = total_spent + ?,
                                  last_active  = ?
                              WHERE id = ?
-                             ''', (order_data['total'], datetime.now(), db_user_id))
-
-            await db.commit()
-            return order_id
+                             ''', (quote.total, now, db_user_id))
+
+            # Списываем баллы, если ими оплачена часть заказа
+            if quote.points_used:
+                cursor = await db.execute(
+                    "SELECT points FROM loyalty_balances WHERE user_id = ?", (db_user_id,)
+                )
+                balance = await cursor.fetchone()
+                if not balance or balance[0] < quote.points_used:
+                    raise ValueError("Недостаточно баллов")
+                await self.record_points(db, db_user_id, -quote.points_used, f"Оплата заказа #{order_id}", order_id)
+
+            # Начисляем баллы за заказ
+            if quote.points_earned:
+                await self.record_points(db, db_user_id, quote.points_earned, f"Заказ #{order_id}", order_id)
+
+            await self._rollup_order(db, db_user_id, now.date().isoformat(), quote.total)
+
+            # Событие для внешней системы уйдет в фоне из outbox. Баллов в нем нет:
+            # списание и начисление выше уже отправлены событиями 'points' из леджера
+            if self.outbox_enabled:
+                await self.enqueue_sync(db, 'order', order_id, {
+                    'telegram_id': user_id,
+                    'total': quote.total,
+                    'delivery_type': quote.delivery_type,
+                    'items': [
+                        {'id': line.id, 'quantity': line.quantity, 'price': line.price}
+                        for line in quote.lines
+                    ],
+                    'created_at': now.isoformat()
+                })
+
+            return order_id, True
+
+    @staticmethod
+    async def _rollup_order(db, user_id: int, day: str, total: float):
+        """Новый заказ в daily_stats (внутри transaction())
+
+        Первый заказ пользователя за день добавляет его в active_users дня и
+        переносит его день последнего заказа (last_active_users) на этот день.
+        """
+        cursor = await db.execute("SELECT day FROM user_last_order WHERE user_id = ?", (user_id,))
+        row = await cursor.fetchone()
+        previous = row[0] if row else None
+        first_today = previous is None or previous < day
+
+        # Заказ создается в статусе pending
+        await db.execute('''
+                         INSERT INTO daily_stats (day, total_orders, new_orders, revenue, active_users,
+                                                  last_active_users)
+                         VALUES (?, 1, 1, ?, ?, ?)
+                         ON CONFLICT (day) DO UPDATE
+                             SET total_orders      = total_orders + 1,
+                                 new_orders        = new_orders + 1,
+                                 revenue           = revenue + excluded.revenue,
+                                 active_users      = active_users + excluded.active_users,
+                                 last_active_users = last_active_users + excluded.last_active_users
+                         ''', (day, total, int(first_today), int(first_today)))
+
+        if first_today:
+            await db.execute(
+                "INSERT INTO user_last_order (user_id, day) VALUES (?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET day = excluded.day",
+                (user_id, day)
+            )
+            if previous is not None:
+                await db.execute(
+                    "UPDATE daily_stats SET last_active_users = last_active_users - 1 WHERE day = ?",
+                    (previous,)
+                )
+
+    async def find_order_by_key(self, telegram_id: int, idempotency_key: str) -> Optional[int]:
+        """ID заказа пользователя с данным ключом идемпотентности"""
+        async with self.connect() as db:
+            return await self._order_id_by_key(db, telegram_id, idempotency_key)
+
+    @staticmethod
+    async def _order_id_by_key(db, telegram_id: int, idempotency_key: str) -> Optional[int]:
+        cursor = await db.execute('''
+                                  SELECT o.id
+                                  FROM orders o
+                                           JOIN users u ON o.user_id = u.id
+                                  WHERE u.telegram_id = ?
+                                    AND o.idempotency_key = ?
+                                  ''', (telegram_id, idempotency_key))
+        row = await cursor.fetchone()
+        return row[0] if row else None
 
     async def get_user_orders(self, telegram_id: int, limit: int = 10) -> List[Dict]:
         """Получение заказов пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.connect() as db:
             cursor = await db.execute('''
                                       SELECT o.*
                                       FROM orders o
@@ -606,10 +459,42 @@ class Database:
             rows = await cursor.fetchall()
             return [dict(row) for row in rows]
 
+    async def get_orders_by_user_id(self, user_id: int, limit: int = 10) -> List[Dict]:
+        """Заказы пользователя по users.id"""
+        async with self.connect() as db:
+            cursor = await db.execute('''
+                                      SELECT *
+                                      FROM orders
+                                      WHERE user_id = ?
+                                      ORDER BY created_at DESC LIMIT ?
+                                      ''', (user_id, limit))
+
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+    async def get_orders_items(self, order_ids: List[int]) -> Dict[int, List[Dict]]:
+        """Позиции нескольких заказов одним запросом"""
+        if not order_ids:
+            return {}
+
+        placeholders = ", ".join("?" for _ in order_ids)
+        async with self.connect() as db:
+            cursor = await db.execute(f'''
+                                      SELECT oi.order_id, oi.menu_item_id, oi.quantity, oi.price, mi.name
+                                      FROM order_items oi
+                                               LEFT JOIN menu_items mi ON mi.id = oi.menu_item_id
+                                      WHERE oi.order_id IN ({placeholders})
+                                      ORDER BY oi.order_id, oi.id
+                                      ''', list(order_ids))
+
+            items: Dict[int, List[Dict]] = {order_id: [] for order_id in order_ids}
+            for row in await cursor.fetchall():
+                items[row['order_id']].append(dict(row))
+            return items
+
     async def get_order(self, order_id: int) -> Optional[Dict]:
         """Получение информации о заказе"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self.connect() as db:
             cursor = await db.execute('''
                                       SELECT o.*, u.telegram_id, u.first_name, u.username
                                       FROM orders o
@@ -620,107 +505,184 @@ class Database:
             row = await cursor.fetchone()
             return dict(row) if row else None
 
+    @staticmethod
+    async def _rollup_status(db, day: Optional[str], old_status: str, new_status: str):
+        """Перенос заказа между группами статусов в daily_stats дня его создания (внутри transaction())"""
+        old_column, new_column = bucket(old_status), bucket(new_status)
+        if day is None or old_column == new_column:
+            return
+
+        changes = []
+        if old_column:
+            changes.append(f"{old_column} = {old_column} - 1")
+        if new_column:
+            changes.append(f"{new_column} = {new_column} + 1")
+        await db.execute(f"UPDATE daily_stats SET {', '.join(changes)} WHERE day = ?", (day,))
+
     async def update_order_status(self, order_id: int, status: str):
-        """Обновление статуса заказа"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute('''
-                             UPDATE orders
-                             SET status     = ?,
-                                 updated_at = ?
-                             WHERE id = ?
-                             ''', (status, datetime.now(), order_id))
-            await db.commit()
+        """Обновление статуса заказа
 
-    async def get_admin_stats(self) -> Dict:
-        """Получение статистики для админа"""
-        async with aiosqlite.connect(self.db_path) as db:
-            today = datetime.now().date()
-            tomorrow = today + timedelta(days=1)
+        После фиксации изменение публикуется в order_events владельцу заказа.
+        """
+        now = datetime.now()
+        async with self.transaction() as db:
+            cursor = await db.execute("SELECT status, DATE(created_at) FROM orders WHERE id = ?", (order_id,))
+            previous = await cursor.fetchone()
 
-            # Заказы за сегодня
             cursor = await db.execute('''
-                                      SELECT COUNT(*)                                                          as total_orders,
-                                             SUM(CASE WHEN status = 'pending' THEN 1 ELSE 0 END)               as new_orders,
-                                             SUM(CASE
-                                                     WHEN status IN ('confirmed', 'preparing', 'on_delivery') THEN 1
-                                                     ELSE 0 END)                                               as processing_orders,
-                                             SUM(CASE WHEN status IN ('delivered', 'ready') THEN 1 ELSE 0 END) as completed_orders,
-                                             COALESCE(SUM(total_amount), 0)                                    as revenue,
-                                             COALESCE(AVG(total_amount), 0)                                    as avg_order
-                                      FROM orders
-                                      WHERE DATE (created_at) = DATE (?)
-                                      ''', (datetime.now(),))
+                                      UPDATE orders
+                                      SET status     = ?,
+                                          updated_at = ?
+                                      WHERE id = ?
+                                      RETURNING (SELECT telegram_id FROM users WHERE users.id = orders.user_id)
+                                      ''', (status, now, order_id))
+            row = await cursor.fetchone()
+            await cursor.close()
 
-            stats = dict(await cursor.fetchone())
+            if previous is not None:
+                await self._rollup_status(db, previous[1], previous[0], status)
 
-            # Новые пользователи сегодня
-            cursor = await db.execute('''
-                                      SELECT COUNT(*) as new_users
-                                      FROM users
-                                      WHERE DATE (created_at) = DATE (?)
-                                      ''', (datetime.now(),))
+        if row and row[0] is not None:
+            self.order_events.publish(row[0], 'order_status', {
+                'id': order_id,
+                'status': status,
+                'updated_at': now.isoformat()
+            })
 
-            stats.update(dict(await cursor.fetchone()))
+    async def get_admin_stats(self) -> Dict:
+        """Статистика для админа за сегодня из дневного свода (daily_stats)
 
-            # Активные пользователи (за последние 7 дней)
+        Активные пользователи - разные заказавшие за последние 7 дней,
+        включая сегодняшний.
+        """
+        today = datetime.now().date()
+        async with self.connect() as db:
             cursor = await db.execute('''
-                                      SELECT COUNT(DISTINCT user_id) as active_users
-                                      FROM orders
-                                      WHERE created_at >= DATETIME(?, '-7 days')
-                                      ''', (datetime.now(),))
+                                      SELECT total_orders,
+                                             new_orders,
+                                             processing_orders,
+                                             completed_orders,
+                                             revenue,
+                                             CASE WHEN total_orders > 0 THEN revenue / total_orders ELSE 0 END as avg_order,
+                                             new_users
+                                      FROM daily_stats
+                                      WHERE day = ?
+                                      ''', (today.isoformat(),))
+            row = await cursor.fetchone()
+            stats = dict(row) if row else {
+                'total_orders': 0, 'new_orders': 0, 'processing_orders': 0, 'completed_orders': 0,
+                'revenue': 0, 'avg_order': 0, 'new_users': 0
+            }
 
+            cursor = await db.execute('''
+                                      SELECT COALESCE(SUM(last_active_users), 0) as active_users
+                                      FROM daily_stats
+                                      WHERE day > ?
+                                      ''', ((today - timedelta(days=7)).isoformat(),))
             stats.update(dict(await cursor.fetchone()))
 
             return stats
 
-    async def sync_menu_from_external(self, menu_data: List[Dict]):
-        """Синхронизация меню с внешним источником"""
-        async with aiosqlite.connect(self.db_path) as db:
-            for item in menu_data:
-                # Проверяем существует ли уже товар с таким external_id
-                if item.get('external_id'):
-                    cursor = await db.execute(
-                        "SELECT id FROM menu_items WHERE external_id = ?",
-                        (item['external_id'],)
-                    )
-                    existing = await cursor.fetchone()
-
-                    if existing:
-                        # Обновляем существующий
-                        await db.execute('''
-                                         UPDATE menu_items
-                                         SET name        = ?,
-                                             description = ?,
-                                             price       = ?,
-                                             available   = ?,
-                                             updated_at  = ?
-                                         WHERE external_id = ?
-                                         ''', (
-                                             item['name'],
-                                             item.get('description', ''),
-                                             item['price'],
-                                             item.get('available', 1),
-                                             datetime.now(),
-                                             item['external_id']
-                                         ))
-                    else:
-                        # Добавляем новый
-                        category_id = await self.get_or_create_category(db, item.get('category', 'other'))
-
-                        await db.execute('''
-                                         INSERT INTO menu_items
-                                         (category_id, name, description, price, available, external_id, sync_enabled)
-                                         VALUES (?, ?, ?, ?, ?, ?, 1)
-                                         ''', (
-                                             category_id,
-                                             item['name'],
-                                             item.get('description', ''),
-                                             item['price'],
-                                             item.get('available', 1),
-                                             item['external_id']
-                                         ))
-
-            await db.commit()
+    async def rebuild_daily_stats(self) -> int:
+        """Пересчет дневного свода по всей истории заказов и пользователей; возвращает число дней"""
+        async with self.transaction() as db:
+            for statement in DAILY_STATS_BACKFILL:
+                await db.execute(statement)
+            cursor = await db.execute("SELECT COUNT(*) FROM daily_stats")
+            return (await cursor.fetchone())[0]
+
+    async def sync_menu_from_external(self, menu_data: List[Dict]) -> Dict[str, int]:
+        """Синхронизация меню с уже загруженной выгрузкой
+
+        То же, что потоковая синхронизация MenuSyncWorker: пачки через
+        apply_menu_batch и выключение пропавших позиций. Возвращает число
+        добавленных, измененных, неизменных, выключенных и пропущенных позиций.
+        """
+        return await sync_menu_items(self, iterate(menu_data), settings.MENU_SYNC_BATCH)
+
+    async def apply_menu_batch(self, items: List[Mapping]) -> MenuSyncPlan:
+        """Сравнение пачки позиций выгрузки с базой и запись изменений одной транзакцией
+
+        Из базы читаются только позиции с external_id из пачки; записываются
+        только изменившиеся по хешу содержимого. Кэш меню не сбрасывается -
+        это делает вызывающий код после всех пачек.
+        """
+        external_ids = list({str(item['external_id']) for item in items
+                             if isinstance(item, Mapping) and item.get('external_id')})
+
+        async with self.transaction() as db:
+            current = {}
+            if external_ids:
+                cursor = await db.execute(f'''
+                                          SELECT mi.id, mi.external_id, mi.name, mi.description, mi.price,
+                                                 mi.available, c.name
+                                          FROM menu_items mi
+                                                   LEFT JOIN categories c ON c.id = mi.category_id
+                                          WHERE mi.external_id IN ({','.join('?' * len(external_ids))})
+                                          ''', external_ids)
+                for item_id, external_id, name, description, price, available, category in await cursor.fetchall():
+                    fields = (name, description or '', float(price), 1 if available else 0, category or 'other')
+                    current[external_id] = (item_id, content_hash(fields))
+
+            plan = diff_menu(current, items)
+            now = datetime.now()
+
+            if plan.inserts or plan.updates:
+                categories = await self._category_ids(
+                    db, {fields[4] for _, fields in plan.inserts + plan.updates}
+                )
+
+            if plan.updates:
+                await db.executemany('''
+                                     UPDATE menu_items
+                                     SET name        = ?,
+                                         description = ?,
+                                         price       = ?,
+                                         available   = ?,
+                                         category_id = ?,
+                                         updated_at  = ?
+                                     WHERE id = ?
+                                     ''', [
+                                         (name, description, price, available, categories[category], now, item_id)
+                                         for item_id, (name, description, price, available, category) in plan.updates
+                                     ])
+
+            if plan.inserts:
+                await db.executemany('''
+                                     INSERT INTO menu_items
+                                     (category_id, name, description, price, available, external_id, sync_enabled,
+                                      updated_at)
+                                     VALUES (?, ?, ?, ?, ?, ?, 1, ?)
+                                     ''', [
+                                         (categories[category], name, description, price, available, external_id, now)
+                                         for external_id, (name, description, price, available, category) in plan.inserts
+                                     ])
+
+        return plan
+
+    async def disable_missing_menu_items(self, seen: Set[str]) -> int:
+        """Выключение доступных внешних позиций, которых нет в seen; возвращает их количество"""
+        async with self.transaction() as db:
+            cursor = await db.execute(
+                "SELECT id, external_id FROM menu_items WHERE external_id IS NOT NULL AND available = 1"
+            )
+            missing = [item_id for item_id, external_id in await cursor.fetchall() if external_id not in seen]
+            if missing:
+                now = datetime.now()
+                await db.executemany(
+                    "UPDATE menu_items SET available = 0, updated_at = ? WHERE id = ?",
+                    [(now, item_id) for item_id in missing]
+                )
+        return len(missing)
+
+    async def _category_ids(self, db, names) -> Dict[str, int]:
+        """id категорий по именам (внутри transaction()); недостающие создаются"""
+        cursor = await db.execute("SELECT name, id FROM categories")
+        categories = {name: category_id for name, category_id in await cursor.fetchall()}
+        for name in names:
+            if name not in categories:
+                categories[name] = await self.get_or_create_category(db, name)
+        return categories
 
     async def get_or_create_category(self, db, category_name: str) -> int:
         """Получить или создать категорию"""
@@ -739,22 +701,61 @@ class Database:
             )
             return cursor.lastrowid
 
+    async def record_points(self, db, user_id: int, points: int, reason: str, order_id: Optional[int] = None,
+                            sync: bool = True):
+        """Запись в леджер баллов вместе с обновлением баланса (внутри transaction())
+
+        Событие 'points' в outbox - единственный источник баллов для внешней
+        системы, в том числе по заказам (событие 'order' баллов не содержит).
+        sync=False - не отправлять начисление во внешнюю систему (например, оно пришло оттуда).
+        """
+        now = datetime.now()
+        cursor = await db.execute('''
+                                  INSERT INTO loyalty_points (user_id, points, reason, order_id, created_at)
+                                  VALUES (?, ?, ?, ?, ?)
+                                  ''', (user_id, points, reason, order_id, now))
+        ledger_id = cursor.lastrowid
+
+        await db.execute('''
+                         INSERT INTO loyalty_balances (user_id, points, earned, spent, updated_at)
+                         VALUES (?, ?, ?, ?, ?)
+                         ON CONFLICT(user_id) DO UPDATE SET points     = points + excluded.points,
+                                                            earned     = earned + excluded.earned,
+                                                            spent      = spent + excluded.spent,
+                                                            updated_at = excluded.updated_at
+                         ''', (user_id, points, max(points, 0), max(-points, 0), now))
+
+        if sync and self.outbox_enabled:
+            cursor = await db.execute("SELECT telegram_id FROM users WHERE id = ?", (user_id,))
+            row = await cursor.fetchone()
+            await self.enqueue_sync(db, 'points', ledger_id, {
+                'telegram_id': row[0] if row else None,
+                'points': points,
+                'reason': reason,
+                'order_id': order_id,
+                'created_at': now.isoformat()
+            })
+
+    @property
+    def outbox_enabled(self) -> bool:
+        return bool(settings.SYNC_ENABLED and settings.EXTERNAL_LOYALTY_API)
+
+    async def enqueue_sync(self, db, entity_type: str, entity_id: int, payload: Dict):
+        """Событие для внешней системы в outbox (внутри transaction() вместе с изменением)"""
+        now = datetime.now()
+        await db.execute('''
+                         INSERT OR REPLACE INTO external_sync
+                         (entity_type, entity_id, sync_status, payload, attempts, next_attempt_at, created_at)
+                         VALUES (?, ?, 'pending', ?, 0, ?, ?)
+                         ''', (entity_type, entity_id, json.dumps(payload, ensure_ascii=False), now, now))
+
     async def export_menu_to_json(self) -> List[Dict]:
         """Экспорт меню в JSON формат"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute('''
-                                      SELECT mi.id,
-                                             mi.name,
-                                             mi.description,
-                                             mi.price,
-                                             mi.available,
-                                             c.name as category,
-                                             mi.external_id,
-                                             mi.sync_enabled
-                                      FROM menu_items mi
-                                               LEFT JOIN categories c ON mi.category_id = c.id
-                                      ''')
-
-            rows = await cursor.fetchall()
-            return [dict(row) for row in rows]
\ No newline at end of file
+        return [item async for item in self.iter_menu_export()]
+
+    async def iter_menu_export(self) -> AsyncIterator[Dict]:
+        """Экспорт меню построчно, страницами по id (без загрузки всего меню в память)"""
+        menu = EXPORT_DATASETS['menu']
+        async for page in self.iter_pages(menu.query):
+            for row in page:
+                yield dict(zip(menu.columns, row))
\ No newline at end of file
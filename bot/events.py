@@ -0,0 +1,101 @@
+import asyncio
+import json
+import logging
+from typing import Dict, Hashable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+def encode_sse(event: str, data: Dict) -> bytes:
+    """Событие в формате Server-Sent Events"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str)
+    return f"event: {event}\ndata: {payload}\n\n".encode()
+
+
+class Subscription:
+    """Очередь событий одного подписчика
+
+    Очередь ограничена: медленный подписчик теряет самые старые события,
+    а не задерживает публикацию для остальных.
+    """
+
+    def __init__(self, bus: 'EventBus', topic: Hashable, maxsize: int):
+        self.bus = bus
+        self.topic = topic
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def push(self, message: bytes):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """Следующее событие или None, если за timeout ничего не пришло"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    async def __aenter__(self) -> 'Subscription':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+class EventBus:
+    """Pub/sub внутри процесса: тема -> подписчики
+
+    Событие сериализуется один раз и раскладывается по очередям подписчиков
+    темы без обращений к базе и без ожидания.
+    """
+
+    def __init__(self, queue_size: int = 32):
+        self.queue_size = queue_size
+        self._topics: Dict[Hashable, Set[Subscription]] = {}
+
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, topic: Hashable) -> Subscription:
+        subscription = Subscription(self, topic, self.queue_size)
+        self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscribers = self._topics.get(subscription.topic)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._topics[subscription.topic]
+
+    def publish(self, topic: Hashable, event: str, data: Dict) -> int:
+        """Отправка события подписчикам темы; возвращает их количество"""
+        self.published += 1
+        subscribers = self._topics.get(topic)
+        if not subscribers:
+            return 0
+
+        message = encode_sse(event, data)
+        for subscription in subscribers:
+            subscription.push(message)
+        self.delivered += len(subscribers)
+        return len(subscribers)
+
+    @property
+    def subscribers(self) -> int:
+        return sum(len(subscribers) for subscribers in self._topics.values())
+
+    def stats(self) -> Dict:
+        return {
+            'topics': len(self._topics),
+            'subscribers': self.subscribers,
+            'published': self.published,
+            'delivered': self.delivered
+        }
@@ -0,0 +1,176 @@
+"""Потоковая выгрузка меню, заказов и леджера баллов
+
+Строки читаются страницами по возрастанию id (Database.iter_pages) и
+сразу сериализуются, поэтому память не зависит от размера таблицы.
+Форматы: NDJSON, CSV и колоночный (columnar) - JSON-строки с группами
+колонок для аналитики.
+
+Запуск: python -m bot.export orders --format csv --output orders.csv
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import sys
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Iterable, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from bot.database import Database
+
+
+@dataclass(frozen=True)
+class ExportDataset:
+    """Выгружаемый набор: колонки и запрос страницы (id > ? ... LIMIT ?), id - первая колонка"""
+    columns: Tuple[str, ...]
+    query: str
+
+
+DATASETS: Dict[str, ExportDataset] = {
+    'menu': ExportDataset(
+        ('id', 'name', 'description', 'price', 'available', 'category', 'external_id', 'sync_enabled'),
+        '''SELECT mi.id, mi.name, mi.description, mi.price, mi.available, c.name, mi.external_id, mi.sync_enabled
+           FROM menu_items mi
+                    LEFT JOIN categories c ON c.id = mi.category_id
+           WHERE mi.id > ?
+           ORDER BY mi.id
+           LIMIT ?'''
+    ),
+    'orders': ExportDataset(
+        ('id', 'user_id', 'telegram_id', 'total_amount', 'status', 'payment_method', 'delivery_type',
+         'created_at', 'updated_at'),
+        '''SELECT o.id, o.user_id, u.telegram_id, o.total_amount, o.status, o.payment_method, o.delivery_type,
+                  o.created_at, o.updated_at
+           FROM orders o
+                    LEFT JOIN users u ON u.id = o.user_id
+           WHERE o.id > ?
+           ORDER BY o.id
+           LIMIT ?'''
+    ),
+    'loyalty': ExportDataset(
+        ('id', 'user_id', 'telegram_id', 'points', 'reason', 'order_id', 'created_at'),
+        '''SELECT lp.id, lp.user_id, u.telegram_id, lp.points, lp.reason, lp.order_id, lp.created_at
+           FROM loyalty_points lp
+                    LEFT JOIN users u ON u.id = lp.user_id
+           WHERE lp.id > ?
+           ORDER BY lp.id
+           LIMIT ?'''
+    ),
+}
+
+
+class ExportWriter(ABC):
+    """Сериализатор набора: заголовок и по куску байтов на страницу строк"""
+    media_type = 'application/octet-stream'
+    extension = 'bin'
+
+    def __init__(self, dataset: str, columns: Sequence[str]):
+        self.dataset = dataset
+        self.columns = columns
+
+    def header(self) -> bytes:
+        return b''
+
+    @abstractmethod
+    def page(self, rows: Sequence[Sequence]) -> bytes:
+        """Кусок выгрузки для страницы строк"""
+
+
+class NdjsonWriter(ExportWriter):
+    media_type = 'application/x-ndjson'
+    extension = 'ndjson'
+
+    def page(self, rows: Sequence[Sequence]) -> bytes:
+        columns = self.columns
+        return ''.join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows
+        ).encode()
+
+
+class CsvWriter(ExportWriter):
+    media_type = 'text/csv'
+    extension = 'csv'
+
+    @staticmethod
+    def _csv(rows: Iterable[Sequence]) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode()
+
+    def header(self) -> bytes:
+        return self._csv([self.columns])
+
+    def page(self, rows: Sequence[Sequence]) -> bytes:
+        return self._csv(rows)
+
+
+class ColumnarWriter(ExportWriter):
+    """Первая строка - схема, дальше по строке на страницу: {"rows": n, "columns": [[...], ...]}
+
+    Группа сразу превращается в колонки DataFrame без разбора построчных
+    объектов: pd.DataFrame(dict(zip(schema['columns'], group['columns']))).
+    """
+    media_type = 'application/x-ndjson'
+    extension = 'columnar.jsonl'
+    version = 1
+
+    def header(self) -> bytes:
+        schema = {'format': 'columnar', 'version': self.version, 'dataset': self.dataset,
+                  'columns': list(self.columns)}
+        return (json.dumps(schema) + '\n').encode()
+
+    def page(self, rows: Sequence[Sequence]) -> bytes:
+        columns = [list(column) for column in zip(*rows)]
+        return (json.dumps({'rows': len(rows), 'columns': columns}, ensure_ascii=False) + '\n').encode()
+
+
+FORMATS = {'ndjson': NdjsonWriter, 'csv': CsvWriter, 'columnar': ColumnarWriter}
+
+
+def writer_for(dataset: str, fmt: str):
+    """Сериализатор набора; ValueError для неизвестного набора или формата"""
+    if dataset not in DATASETS:
+        raise ValueError(f"Неизвестный набор для выгрузки: {dataset}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+    return FORMATS[fmt](dataset, DATASETS[dataset].columns)
+
+
+async def export_stream(db: 'Database', dataset: str, fmt: str = 'ndjson',
+                        page_size: int = 1000) -> AsyncIterator[bytes]:
+    """Выгрузка набора в формате fmt кусками байтов, по куску на страницу"""
+    writer = writer_for(dataset, fmt)
+    header = writer.header()
+    if header:
+        yield header
+    async for page in db.iter_pages(DATASETS[dataset].query, page_size):
+        yield writer.page(page)
+
+
+async def main(dataset: str, fmt: str, output: str, page_size: int):
+    from bot.database import Database
+
+    db = Database()
+    await db.open()
+    try:
+        file = open(output, 'wb') if output != '-' else sys.stdout.buffer
+        try:
+            async for chunk in export_stream(db, dataset, fmt, page_size):
+                file.write(chunk)
+        finally:
+            if file is not sys.stdout.buffer:
+                file.close()
+    finally:
+        await db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("dataset", choices=sorted(DATASETS))
+    parser.add_argument("--format", choices=sorted(FORMATS), default='ndjson')
+    parser.add_argument("--output", default='-', help="файл (по умолчанию - stdout)")
+    parser.add_argument("--page-size", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.dataset, args.format, args.output, args.page_size))
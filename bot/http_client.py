@@ -0,0 +1,33 @@
+import logging
+from typing import List, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class HttpClient:
+    """Общая сессия aiohttp с пулом соединений для внешних API"""
+
+    def __init__(self, limit: int = 20, timeout: float = 10,
+                 trace_configs: Optional[List[aiohttp.TraceConfig]] = None):
+        self.limit = limit
+        self.timeout = timeout
+        self.trace_configs = trace_configs
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Сессия создается при первом обращении внутри event loop"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                trace_configs=self.trace_configs
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class IdempotencyCache:
+    """Результаты операций по ключу идемпотентности на короткое время
+
+    Повтор с тем же ключом получает сохраненный результат, а пока первая
+    попытка выполняется - ждет ее же, не запуская действие второй раз.
+    Ошибки и результат None не сохраняются: такую операцию можно повторить.
+    """
+
+    def __init__(self, ttl: float = 600, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # ключ -> (результат, когда истекает)
+        self._results: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Сохраненный результат или None"""
+        cached = self._results.get(key)
+        if cached is None:
+            return None
+
+        result, expires_at = cached
+        if time.monotonic() >= expires_at:
+            del self._results[key]
+            return None
+        return result
+
+    def put(self, key: Hashable, result: Any):
+        self._results[key] = (result, time.monotonic() + self.ttl)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    async def run(self, key: Hashable, action: Callable[[], Awaitable]) -> Tuple[Any, bool]:
+        """Выполнить действие один раз на ключ
+
+        Возвращает (результат, True) для первого вызова и (результат, False)
+        для повторов.
+        """
+        result = self.get(key)
+        if result is not None:
+            self.hits += 1
+            return result, False
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.hits += 1
+            return await asyncio.shield(inflight), False
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await action()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Ошибку уже получил первый вызов; без ожидающих повторов не логируем ее
+            future.exception()
+            raise
+        else:
+            if result is not None:
+                self.put(key, result)
+            future.set_result(result)
+            return result, True
+        finally:
+            del self._inflight[key]
+
+    def stats(self) -> Dict:
+        return {'entries': len(self._results), 'inflight': len(self._inflight),
+                'hits': self.hits, 'misses': self.misses}
@@ -1,32 +1,135 @@
 import logging
+import time
+from array import array
+from bisect import bisect_right
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
+from bot.analytics import LoyaltyAnalytics
 from bot.database import Database
+from bot.http_client import HttpClient
+from bot.metrics import metrics
 from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
 
+class LevelTable:
+    """Уровни лояльности в виде отсортированных массивов для бинарного поиска"""
+
+    # Уровень для баланса ниже минимального порога
+    DEFAULT_LEVEL = ('Новичок', 0, '#95a5a6')
+
+    def __init__(self, rows: Iterable):
+        rows = sorted(rows, key=lambda row: row['min_points'])
+        self.thresholds = array('q', (row['min_points'] for row in rows))
+        self.discounts = array('q', (row['discount'] for row in rows))
+        self.names = tuple(row['name'] for row in rows)
+        self.colors = tuple(row['color'] for row in rows)
+
+    def __len__(self) -> int:
+        return len(self.thresholds)
+
+    def index(self, points: int) -> int:
+        """Индекс уровня для баланса (-1, если баланс ниже всех порогов)"""
+        return bisect_right(self.thresholds, points) - 1
+
+    def level_info(self, points: int) -> Dict:
+        """Текущий и следующий уровень для баланса"""
+        index = self.index(points)
+
+        if index >= 0:
+            name, discount, color = self.names[index], self.discounts[index], self.colors[index]
+        else:
+            name, discount, color = self.DEFAULT_LEVEL
+
+        next_index = index + 1
+        has_next = next_index < len(self)
+
+        return {
+            'name': name,
+            'discount': discount,
+            'color': color,
+            'points': points,
+            'next_level': self.names[next_index] if has_next else None,
+            'points_needed': self.thresholds[next_index] - points if has_next else 0
+        }
+
+    def sql_bucket(self, expression: str) -> str:
+        """SQL-выражение с индексом уровня для баланса (те же границы, что у index())"""
+        if not len(self):
+            return "-1"
+
+        branches = " ".join(
+            f"WHEN {expression} >= {threshold} THEN {index}"
+            for index, threshold in reversed(list(enumerate(self.thresholds)))
+        )
+        return f"CASE {branches} ELSE -1 END"
+
+
 class LoyaltySystem:
-    def __init__(self, db: Database):
+    def __init__(self, db: Database, http: Optional[HttpClient] = None, levels_check_interval: float = 1.0):
         self.db = db
+        self.http = http or HttpClient()
+        self.analytics = LoyaltyAnalytics(db)
+        self.levels_check_interval = levels_check_interval
+        self._levels: Optional[LevelTable] = None
+        self._levels_version: Optional[str] = None
+        self._levels_checked = 0.0
+
+    async def get_levels(self) -> LevelTable:
+        """Таблица уровней, перечитывается только при изменении loyalty_levels
+
+        Версию уровней поднимают триггеры на loyalty_levels (settings,
+        ключ loyalty_levels_version); она проверяется не чаще раза
+        в levels_check_interval секунд.
+        """
+        now = time.monotonic()
+        if self._levels is not None and now - self._levels_checked < self.levels_check_interval:
+            return self._levels
+
+        async with self.db.connect() as db:
+            cursor = await db.execute("SELECT value FROM settings WHERE key = 'loyalty_levels_version'")
+            row = await cursor.fetchone()
+            version = row[0] if row else None
+
+            if self._levels is None or version != self._levels_version:
+                cursor = await db.execute(
+                    "SELECT name, min_points, discount, color FROM loyalty_levels"
+                )
+                self._levels = LevelTable(await cursor.fetchall())
+                self._levels_version = version
+
+        self._levels_checked = now
+        return self._levels
+
+    def invalidate_levels(self):
+        """Немедленный сброс таблицы уровней (без ожидания проверки версии)"""
+        self._levels = None
 
     async def get_user_points(self, telegram_id: int) -> int:
         """Получение баланса баллов пользователя"""
         async with self.db.connect() as db:
             cursor = await db.execute('''
-                                      SELECT COALESCE(SUM(points), 0) as total_points
-                                      FROM loyalty_points lp
-                                               JOIN users u ON lp.user_id = u.id
+                                      SELECT lb.points
+                                      FROM loyalty_balances lb
+                                               JOIN users u ON lb.user_id = u.id
                                       WHERE u.telegram_id = ?
                                       ''', (telegram_id,))
 
             row = await cursor.fetchone()
             return row[0] if row else 0
 
-    async def add_points(self, telegram_id: int, points: int, reason: str, order_id: Optional[int] = None):
-        """Добавление баллов пользователю"""
+    async def get_points_by_user_id(self, user_id: int) -> int:
+        """Баланс баллов по users.id"""
         async with self.db.connect() as db:
+            cursor = await db.execute("SELECT points FROM loyalty_balances WHERE user_id = ?", (user_id,))
+            row = await cursor.fetchone()
+            return row[0] if row else 0
+
+    async def add_points(self, telegram_id: int, points: int, reason: str, order_id: Optional[int] = None,
+                         sync: bool = True):
+        """Добавление баллов пользователю"""
+        async with self.db.transaction() as db:
             # Получаем ID пользователя
             cursor = await db.execute(
                 "SELECT id FROM users WHERE telegram_id = ?",
@@ -38,56 +141,73 @@ class LoyaltySystem:
                 logger.error(f"Пользователь {telegram_id} не найден")
                 return
 
-            user_id = user_row[0]
-
-            # Добавляем баллы
-            await db.execute('''
-                             INSERT INTO loyalty_points (user_id, points, reason, order_id, created_at)
-                             VALUES (?, ?, ?, ?, ?)
-                             ''', (user_id, points, reason, order_id, datetime.now()))
+            # Добавляем баллы и обновляем баланс в одной транзакции
+            await self.db.record_points(db, user_row[0], points, reason, order_id, sync=sync)
 
-            await db.commit()
+        logger.info(f"Добавлено {points} баллов пользователю {telegram_id} за {reason}")
 
-            logger.info(f"Добавлено {points} баллов пользователю {telegram_id} за {reason}")
+    async def reconcile_balances(self, fix: bool = True) -> Dict:
+        """Сверка балансов с леджером баллов
 
-    async def get_user_level(self, telegram_id: int) -> Dict:
-        """Получение уровня пользователя"""
-        points = await self.get_user_points(telegram_id)
-
-        async with self.db.connect() as db:
+        Возвращает список расхождений; при fix=True балансы пересобираются из леджера.
+        """
+        async with self.db.transaction() as db:
             cursor = await db.execute('''
-                                      SELECT name, discount, color
-                                      FROM loyalty_levels
-                                      WHERE min_points <= ?
-                                      ORDER BY min_points DESC LIMIT 1
-                                      ''', (points,))
+                                      WITH ledger AS (SELECT user_id, SUM(points) as points
+                                                      FROM loyalty_points
+                                                      GROUP BY user_id)
+                                      SELECT l.user_id, l.points as ledger_points, lb.points as balance_points
+                                      FROM ledger l
+                                               LEFT JOIN loyalty_balances lb ON lb.user_id = l.user_id
+                                      WHERE lb.points IS NOT l.points
+                                      UNION ALL
+                                      SELECT lb.user_id, 0, lb.points
+                                      FROM loyalty_balances lb
+                                      WHERE lb.points != 0
+                                        AND NOT EXISTS (SELECT 1 FROM loyalty_points lp WHERE lp.user_id = lb.user_id)
+                                      ''')
 
-            current_level = await cursor.fetchone()
+            drift = [
+                {
+                    'user_id': row['user_id'],
+                    'ledger': row['ledger_points'],
+                    'balance': row['balance_points'] or 0,
+                    'diff': row['ledger_points'] - (row['balance_points'] or 0)
+                }
+                for row in await cursor.fetchall()
+            ]
+
+            if fix and drift:
+                await db.execute("DELETE FROM loyalty_balances")
+                await db.execute('''
+                                 INSERT INTO loyalty_balances (user_id, points, earned, spent, updated_at)
+                                 SELECT user_id,
+                                        SUM(points),
+                                        SUM(CASE WHEN points > 0 THEN points ELSE 0 END),
+                                        SUM(CASE WHEN points < 0 THEN -points ELSE 0 END),
+                                        ?
+                                 FROM loyalty_points
+                                 GROUP BY user_id
+                                 ''', (datetime.now(),))
+
+        if drift:
+            logger.warning(f"Расхождение балансов баллов у {len(drift)} пользователей"
+                           f"{', исправлено' if fix else ''}")
 
-            cursor = await db.execute('''
-                                      SELECT name, min_points
-                                      FROM loyalty_levels
-                                      WHERE min_points > ?
-                                      ORDER BY min_points ASC LIMIT 1
-                                      ''', (points,))
-
-            next_level = await cursor.fetchone()
-
-            level_info = {
-                'name': current_level[0] if current_level else 'Новичок',
-                'discount': current_level[1] if current_level else 0,
-                'color': current_level[2] if current_level else '#95a5a6',
-                'points': points,
-                'next_level': next_level[0] if next_level else None,
-                'points_needed': next_level[1] - points if next_level else 0
-            }
+        return {
+            'drift': drift,
+            'fixed': fix and bool(drift)
+        }
 
-            return level_info
+    async def get_user_level(self, telegram_id: int) -> Dict:
+        """Получение уровня пользователя"""
+        points = await self.get_user_points(telegram_id)
+        levels = await self.get_levels()
+        return levels.level_info(points)
 
     async def get_points_history(self, telegram_id: int, limit: int = 10) -> List[Dict]:
         """Получение истории начисления баллов"""
         async with self.db.connect() as db:
-            db.row_factory = aiosqlite.Row
             cursor = await db.execute('''
                                       SELECT lp.points, lp.reason, lp.created_at, o.id as order_id
                                       FROM loyalty_points lp
@@ -106,44 +226,42 @@ class LoyaltySystem:
             return None
 
         try:
-            import aiohttp
-            import json
-
             user_data = await self.db.get_user_data(telegram_id)
             if not user_data:
                 return None
 
-            async with aiohttp.ClientSession() as session:
-                # Получаем текущие баллы из внешней системы
-                async with session.get(
-                        f"{settings.EXTERNAL_LOYALTY_API}/points/{telegram_id}"
-                ) as response:
-                    if response.status == 200:
-                        external_data = await response.json()
-                        external_points = external_data.get('points', 0)
-
-                        # Синхронизируем если есть расхождения
-                        current_points = await self.get_user_points(telegram_id)
-
-                        if external_points != current_points:
-                            # Обновляем в нашей системе
-                            diff = external_points - current_points
-                            if diff != 0:
-                                await self.add_points(
-                                    telegram_id,
-                                    diff,
-                                    "Синхронизация с внешней системой"
-                                )
-
-                            return {
-                                'synced': True,
-                                'points_added': diff,
-                                'new_total': external_points
-                            }
+            # Получаем текущие баллы из внешней системы
+            async with self.http.session.get(
+                    f"{settings.EXTERNAL_LOYALTY_API}/points/{telegram_id}"
+            ) as response:
+                if response.status == 200:
+                    external_data = await response.json()
+                    external_points = external_data.get('points', 0)
+
+                    # Синхронизируем если есть расхождения
+                    current_points = await self.get_user_points(telegram_id)
+
+                    if external_points != current_points:
+                        # Обновляем в нашей системе
+                        diff = external_points - current_points
+                        if diff != 0:
+                            await self.add_points(
+                                telegram_id,
+                                diff,
+                                "Синхронизация с внешней системой",
+                                sync=False
+                            )
+
+                        return {
+                            'synced': True,
+                            'points_added': diff,
+                            'new_total': external_points
+                        }
 
             return {'synced': True, 'points_added': 0}
 
         except Exception as e:
+            metrics.error('external', 'sync_with_external')
             logger.error(f"Ошибка синхронизации с внешней системой: {e}")
             return None
 
@@ -194,7 +312,6 @@ class LoyaltySystem:
     async def get_available_products_for_points(self, points: int) -> List[Dict]:
         """Получение товаров доступных для обмена на баллы"""
         async with self.db.connect() as db:
-            db.row_factory = aiosqlite.Row
             cursor = await db.execute('''
                                       SELECT id, name, price, image_url
                                       FROM menu_items
@@ -206,39 +323,7 @@ class LoyaltySystem:
             rows = await cursor.fetchall()
             return [dict(row) for row in rows]
 
-    async def get_loyalty_stats(self) -> Dict:
+    async def get_loyalty_stats(self, source: str = 'balances') -> Dict:
         """Статистика программы лояльности"""
-        async with self.db.connect() as db:
-            # Общее количество баллов
-            cursor = await db.execute('''
-                                      SELECT COALESCE(SUM(points), 0)                              as total_points,
-                                             COUNT(DISTINCT user_id)                               as active_users,
-                                             SUM(CASE WHEN points > 0 THEN points ELSE 0 END)      as points_earned,
-                                             SUM(CASE WHEN points < 0 THEN ABS(points) ELSE 0 END) as points_spent
-                                      FROM loyalty_points
-                                      ''')
-
-            stats = dict(await cursor.fetchone())
-
-            # Распределение по уровням
-            cursor = await db.execute('''
-                                      SELECT ll.name,
-                                             COUNT(DISTINCT u.id) as users_count
-                                      FROM users u
-                                               LEFT JOIN loyalty_levels ll ON (SELECT COALESCE(SUM(points), 0)
-                                                                               FROM loyalty_points lp
-                                                                               WHERE lp.user_id = u.id) >= ll.min_points
-                                      GROUP BY ll.name
-                                      ORDER BY ll.min_points
-                                      ''')
-
-            levels_stats = []
-            for row in await cursor.fetchall():
-                levels_stats.append({
-                    'level': row[0],
-                    'users': row[1]
-                })
-
-            stats['levels'] = levels_stats
-
-            return stats
\ No newline at end of file
+        levels = await self.get_levels()
+        return await self.analytics.level_stats(levels, source)
@@ -6,14 +6,24 @@ from typing import Dict, List, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, MenuButtonWebApp, WebAppInfo
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler,
-    MessageHandler, filters, ContextTypes, ConversationHandler
+    MessageHandler, filters, ContextTypes, ConversationHandler, ExtBot
 )
 from telegram.constants import ParseMode
 
 from config.settings import settings
+from bot.activity import ActivityTracker
+from bot.api import create_app, create_server
 from bot.database import Database
-from bot.admin import AdminPanel
+from bot.http_client import HttpClient
+from bot.idempotency import IdempotencyCache
 from bot.loyalty import LoyaltySystem
+from bot.menu_sync import MenuSyncWorker
+from bot.metrics import InstrumentedRequest, metrics
+from bot.notifications import NotificationDispatcher
+from bot.outbox import OutboxWorker
+from bot.pricing import PricingEngine
+from bot.updates import UpdateScheduler
+from bot.views import ScreenCache, resolve_locale
 
 # Настройка логирования
 logging.basicConfig(
@@ -27,30 +37,90 @@ CHOOSING, TYPING_REPLY, TYPING_CHOICE = range(3)
 
 
 class CoffeeShopBot:
-    def __init__(self):
+    def __init__(self, bot: Optional[ExtBot] = None):
+        """bot - готовый ExtBot (стенды с заглушкой Bot API), по умолчанию создается по BOT_TOKEN"""
         self.db = Database()
-        self.admin = AdminPanel(self.db)
-        self.loyalty = LoyaltySystem(self.db)
-        self.application = Application.builder().token(settings.BOT_TOKEN).build()
-
-        # Загрузка меню из внешнего API если включено
-        if settings.SYNC_ENABLED and settings.EXTERNAL_MENU_API:
-            asyncio.create_task(self.sync_external_menu())
+        self.http = HttpClient(trace_configs=[metrics.http_trace()] if metrics.enabled else None)
+        self.loyalty = LoyaltySystem(self.db, self.http, levels_check_interval=settings.LOYALTY_LEVELS_CHECK_INTERVAL)
+        self.pricing = PricingEngine(self.db, self.loyalty)
+        self.order_keys = IdempotencyCache(ttl=settings.ORDER_DEDUP_TTL)
+        self.screens = ScreenCache(self.db)
+        self.activity = ActivityTracker(
+            self.db,
+            interval=settings.ACTIVITY_FLUSH_INTERVAL,
+            max_pending=settings.ACTIVITY_MAX_PENDING
+        )
+        self.outbox = OutboxWorker(
+            self.db,
+            self.http,
+            f"{settings.EXTERNAL_LOYALTY_API}/events",
+            batch_size=settings.OUTBOX_BATCH,
+            interval=settings.OUTBOX_INTERVAL,
+            max_attempts=settings.OUTBOX_MAX_ATTEMPTS
+        )
+        self.menu_sync = MenuSyncWorker(
+            self.db,
+            self.http,
+            settings.EXTERNAL_MENU_API,
+            interval=settings.MENU_SYNC_INTERVAL,
+            batch_size=settings.MENU_SYNC_BATCH
+        )
+        # Апдейты разных пользователей обрабатываются параллельно, одного - по порядку
+        self.scheduler = UpdateScheduler(
+            workers=settings.UPDATES_MAX_CONCURRENT,
+            max_queued=settings.UPDATES_MAX_QUEUED,
+            wait_warning=settings.UPDATES_WAIT_WARNING
+        )
+        builder = Application.builder().concurrent_updates(self.scheduler)
+        if self.webhook_mode:
+            # Апдейты приходят в API-сервер, getUpdates не нужен
+            builder = builder.updater(None)
+        if bot is not None:
+            builder = builder.bot(bot)
+        else:
+            builder = builder.token(settings.BOT_TOKEN)
+        if bot is None and metrics.enabled:
+            # Замер каждого вызова Bot API; размер пула как у запросов PTB по умолчанию
+            builder = builder.request(InstrumentedRequest(metrics, connection_pool_size=256))
+            builder = builder.get_updates_request(InstrumentedRequest(metrics))
+        self.application = builder.build()
+        self.notifier = NotificationDispatcher(
+            self.application.bot,
+            global_rate=settings.NOTIFY_GLOBAL_RATE,
+            chat_rate=settings.NOTIFY_CHAT_RATE,
+            max_retries=settings.NOTIFY_MAX_RETRIES
+        )
+        self.api_server = None
+        self.api_task = None
 
+        self.setup_metrics()
         self.setup_handlers()
 
-    async def sync_external_menu(self):
-        """Синхронизация меню с внешним API"""
-        try:
-            import aiohttp
-            async with aiohttp.ClientSession() as session:
-                async with session.get(settings.EXTERNAL_MENU_API) as response:
-                    if response.status == 200:
-                        menu_data = await response.json()
-                        await self.db.sync_menu_from_external(menu_data)
-                        logger.info("Меню синхронизировано с внешним API")
-        except Exception as e:
-            logger.error(f"Ошибка синхронизации меню: {e}")
+    @property
+    def webhook_mode(self) -> bool:
+        return settings.BOT_MODE == 'webhook'
+
+    def setup_metrics(self):
+        """Замеры методов базы, обработчиков и внешних синхронизаций, источники /metrics"""
+        if not metrics.enabled:
+            return
+
+        metrics.instrument(self.db, metrics.db, 'db')
+        metrics.instrument(self, metrics.handlers, 'handler', exclude=('run', 'setup_menu_button'))
+        metrics.instrument(self.menu_sync, metrics.external, 'external', names=('sync_once',))
+        metrics.instrument(self.loyalty, metrics.external, 'external', names=('sync_with_external',))
+        metrics.instrument(self.outbox, metrics.external, 'external', names=('drain_once',))
+
+        metrics.collector('updates', self.scheduler.stats)
+        metrics.collector('pool', self.db.pool.stats)
+        metrics.collector('menu_cache', self.db.menu_cache.stats)
+        metrics.collector('order_events', self.db.order_events.stats)
+        metrics.collector('screens', self.screens.stats)
+        metrics.collector('order_keys', self.order_keys.stats)
+        metrics.collector('notifications', self.notifier.stats)
+        metrics.collector('outbox', self.outbox.stats)
+        metrics.collector('activity', self.activity.stats)
+        metrics.collector('menu_sync', self.menu_sync.stats)
 
     def setup_handlers(self):
         """Настройка всех обработчиков"""
@@ -80,9 +150,6 @@ class CoffeeShopBot:
             self.handle_message
         ))
 
-        # Настройка кнопки меню
-        asyncio.run(self.setup_menu_button())
-
     async def setup_menu_button(self):
         """Настройка кнопки меню в боте"""
         await self.application.bot.set_chat_menu_button(
@@ -95,86 +162,26 @@ class CoffeeShopBot:
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
         user = update.effective_user
-        await self.db.register_user(user)
-
-        # Приветственное сообщение с красивым интерфейсом
-        welcome_text = f"""
-🎉 *Добро пожаловать в {settings.SHOP_NAME}!* ☕
-
-*Мы рады видеть вас, {user.first_name}!*
-
-✨ *Наши преимущества:*
-• 🚀 Быстрое приготовление
-• 🌱 Свежие ингредиенты
-• 💫 Авторские рецепты
-• 🎁 Программа лояльности
-
-📱 *Используйте кнопку "🛒 Заказать" или команды ниже:*
-"""
-
-        keyboard = [
-            [
-                InlineKeyboardButton("📋 Посмотреть меню", callback_data="view_menu"),
-                InlineKeyboardButton("🛒 Открыть Mini App", web_app=WebAppInfo(url=settings.WEBAPP_URL))
-            ],
-            [
-                InlineKeyboardButton("👤 Мой профиль", callback_data="profile"),
-                InlineKeyboardButton("💎 Баланс баллов", callback_data="balance")
-            ],
-            [
-                InlineKeyboardButton("📦 Мои заказы", callback_data="my_orders"),
-                InlineKeyboardButton("⭐ Избранное", callback_data="favorites")
-            ],
-            [
-                InlineKeyboardButton("🏆 Акции", callback_data="promotions"),
-                InlineKeyboardButton("📍 Контакты", callback_data="contacts")
-            ]
-        ]
+        # Новый пользователь записывается сразу, активность известных - пачками в фоне
+        await self.activity.touch(user)
 
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        # Приветствие и клавиатура собраны заранее, подставляется только имя
+        screen = self.screens.welcome(user.first_name, resolve_locale(user.language_code))
 
         if update.message:
             await update.message.reply_text(
-                welcome_text,
-                reply_markup=reply_markup,
+                screen.text,
+                reply_markup=screen.reply_markup,
                 parse_mode=ParseMode.MARKDOWN
             )
 
     async def show_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Показать категории меню"""
-        categories = await self.db.get_menu_categories()
-
-        text = "☕ *Наше меню*\n\nВыберите категорию:"
-
-        keyboard = []
-        for category in categories:
-            emoji = {
-                'coffee': '☕',
-                'tea': '🍵',
-                'bakery': '🥐',
-                'dessert': '🍰',
-                'food': '🥪'
-            }.get(category, '📋')
-
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"{emoji} {category.capitalize()}",
-                    callback_data=f"category_{category}"
-                )
-            ])
-
-        keyboard.append([
-            InlineKeyboardButton(
-                "🛒 Открыть полное меню в Mini App",
-                web_app=WebAppInfo(url=f"{settings.WEBAPP_URL}")
-            )
-        ])
-
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        screen = await self.screens.menu(resolve_locale(update.effective_user.language_code))
 
         await update.message.reply_text(
-            text,
-            reply_markup=reply_markup,
+            screen.text,
+            reply_markup=screen.reply_markup,
             parse_mode=ParseMode.MARKDOWN
         )
 
@@ -222,8 +229,8 @@ class CoffeeShopBot:
         user_data = await self.db.get_user_data(user.id)
 
         if settings.LOYALTY_ENABLED:
-            points = await self.loyalty.get_user_points(user.id)
             level = await self.loyalty.get_user_level(user.id)
+            points = level['points']
         else:
             points = 0
             level = {"name": "Новичок", "discount": 0}
@@ -273,8 +280,8 @@ class CoffeeShopBot:
             return
 
         user_id = update.effective_user.id
-        points = await self.loyalty.get_user_points(user_id)
         level = await self.loyalty.get_user_level(user_id)
+        points = level['points']
         history = await self.loyalty.get_points_history(user_id, limit=5)
 
         text = f"""
@@ -379,70 +386,21 @@ class CoffeeShopBot:
 
     async def show_menu_callback(self, query):
         """Показать меню в callback"""
-        categories = await self.db.get_menu_categories()
-
-        text = "☕ *Наше меню*\n\nВыберите категорию:"
-
-        keyboard = []
-        for category in categories:
-            emoji = {
-                'coffee': '☕',
-                'tea': '🍵',
-                'bakery': '🥐',
-                'dessert': '🍰',
-                'food': '🥪'
-            }.get(category, '📋')
-
-            keyboard.append([
-                InlineKeyboardButton(
-                    f"{emoji} {category.capitalize()}",
-                    callback_data=f"category_{category}"
-                )
-            ])
-
-        keyboard.append([
-            InlineKeyboardButton(
-                "🛒 Открыть полное меню",
-                web_app=WebAppInfo(url=settings.WEBAPP_URL)
-            )
-        ])
+        screen = await self.screens.menu(resolve_locale(query.from_user.language_code), inline=True)
 
         await query.edit_message_text(
-            text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            screen.text,
+            reply_markup=screen.reply_markup,
             parse_mode=ParseMode.MARKDOWN
         )
 
     async def show_category_items(self, query, category):
         """Показать товары категории"""
-        items = await self.db.get_menu_items_by_category(category)
-
-        emoji = {
-            'coffee': '☕',
-            'tea': '🍵',
-            'bakery': '🥐',
-            'dessert': '🍰',
-            'food': '🥪'
-        }.get(category, '📋')
-
-        text = f"{emoji} *{category.capitalize()}*\n\n"
-
-        for item in items[:5]:  # Показываем первые 5 товаров
-            text += f"• *{item['name']}* - {item['price']}₽\n"
-
-        if len(items) > 5:
-            text += f"\n...и еще {len(items) - 5} позиций"
-
-        keyboard = [
-            [InlineKeyboardButton("🛒 Открыть в Mini App", web_app=WebAppInfo(
-                url=f"{settings.WEBAPP_URL}/?category={category}"
-            ))],
-            [InlineKeyboardButton("⬅️ Назад", callback_data="view_menu")]
-        ]
+        screen = await self.screens.category(category, resolve_locale(query.from_user.language_code))
 
         await query.edit_message_text(
-            text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            screen.text,
+            reply_markup=screen.reply_markup,
             parse_mode=ParseMode.MARKDOWN
         )
 
@@ -460,27 +418,56 @@ class CoffeeShopBot:
             elif action == 'exchange_points':
                 await self.process_points_exchange(user, data)
 
-        except Exception as e:
-            logger.error(f"Ошибка обработки Web App данных: {e}")
+        except Exception:
+            metrics.error('handler', 'process_webapp_data')
+            logger.exception("Ошибка обработки Web App данных")
             await update.message.reply_text(
                 "❌ Произошла ошибка. Пожалуйста, попробуйте еще раз.",
                 parse_mode=ParseMode.MARKDOWN
             )
 
     async def process_order(self, user, data):
-        """Обработка нового заказа"""
+        """Обработка нового заказа
+
+        Повтор отправки с тем же idempotencyKey (повтор sendData, двойное
+        нажатие) не создает заказ заново и не рассылает уведомления.
+        """
+        key = data.get('idempotencyKey')
+        if not isinstance(key, str) or not 0 < len(key) <= 64:
+            await self.place_order(user, data)
+            return
+
+        order_id, created = await self.order_keys.run((user.id, key), lambda: self.place_order(user, data, key))
+        if not created:
+            logger.info(f"Повтор заказа #{order_id} от {user.id} проигнорирован")
+
+    async def place_order(self, user, data, idempotency_key: Optional[str] = None) -> Optional[int]:
+        """Расчет, запись и уведомления; возвращает ID заказа (None, если заказ не принят)"""
         try:
-            # Создаем заказ в базе
-            order_id = await self.db.create_order(user.id, data)
-
-            # Начисляем баллы если включена программа лояльности
-            if settings.LOYALTY_ENABLED:
-                points = int(data['total'] * settings.POINTS_PER_RUBLE)
-                await self.loyalty.add_points(
-                    user.id,
-                    points,
-                    f"Заказ #{order_id}"
+            # Заказ мог быть записан до перезапуска бота
+            if idempotency_key:
+                order_id = await self.db.find_order_by_key(user.id, idempotency_key)
+                if order_id is not None:
+                    return order_id
+
+            # Цены, скидки и баллы считает сервер, клиентским суммам не доверяем
+            quote = await self.pricing.quote_order(user.id, data)
+            if not quote.ok:
+                await self.application.bot.send_message(
+                    chat_id=user.id,
+                    text="❌ *Не удалось оформить заказ:*\n" + "\n".join(f"• {problem}" for problem in quote.problems),
+                    parse_mode=ParseMode.MARKDOWN
                 )
+                return None
+            data = quote.apply(data)
+
+            # Создаем заказ в базе; баллы списываются и начисляются в той же транзакции
+            order_id, created = await self.db.create_order(user.id, data, quote, idempotency_key)
+            if not created:
+                # Дубль, прошедший мимо find_order_by_key (перезапуск, второй процесс):
+                # подтверждение и уведомления по этому заказу уже отправлены
+                logger.info(f"Повтор заказа #{order_id} (ключ {idempotency_key}), уведомления пропущены")
+                return order_id
 
             # Отправляем подтверждение пользователю
             order_text = self.format_order_confirmation(order_id, data)
@@ -493,64 +480,57 @@ class CoffeeShopBot:
             # Отправляем уведомление администратору/чату
             await self.notify_admins(order_id, data, user)
 
-            # Синхронизируем с внешней системой если нужно
-            if settings.SYNC_ENABLED and settings.EXTERNAL_LOYALTY_API:
-                await self.sync_order_external(order_id, data, user.id)
+            # Событие для внешней системы уже в outbox, отправка идет в фоне
+            if self.db.outbox_enabled:
+                self.outbox.wake()
+
+            return order_id
 
         except Exception as e:
             logger.error(f"Ошибка обработки заказа: {e}")
             raise
 
     async def notify_admins(self, order_id: int, order_data: dict, user):
-        """Уведомление администраторов о новом заказе"""
+        """Уведомление администраторов о новом заказе
+
+        Сообщения уходят в фоне через диспетчер, заказ их не ждет.
+        """
         notification = self.format_admin_notification(order_id, order_data, user)
 
         # Отправляем в чат заказов если указан
         if settings.ORDER_CHAT_ID:
-            try:
-                await self.application.bot.send_message(
-                    chat_id=settings.ORDER_CHAT_ID,
-                    text=notification,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-            except Exception as e:
-                logger.error(f"Ошибка отправки в чат: {e}")
-
-        # Отправляем личным сообщениям администраторам
-        for admin_id in settings.ADMIN_IDS:
-            try:
-                await self.application.bot.send_message(
-                    chat_id=int(admin_id),
-                    text=notification,
-                    parse_mode=ParseMode.MARKDOWN
-                )
-
-                # Добавляем кнопки для быстрого управления заказом
-                keyboard = [
-                    [
-                        InlineKeyboardButton("✅ Принять", callback_data=f"accept_{order_id}"),
-                        InlineKeyboardButton("⏳ В процессе", callback_data=f"process_{order_id}")
-                    ],
-                    [
-                        InlineKeyboardButton("🚚 Готово", callback_data=f"ready_{order_id}"),
-                        InlineKeyboardButton("❌ Отменить", callback_data=f"cancel_{order_id}")
-                    ],
-                    [
-                        InlineKeyboardButton("📞 Позвонить", url=f"tel:{order_data.get('phone', '')}"),
-                        InlineKeyboardButton("💬 Написать",
-                                             url=f"https://t.me/{user.username}" if user.username else f"tg://user?id={user.id}")
-                    ]
-                ]
+            self.notifier.submit(
+                settings.ORDER_CHAT_ID,
+                notification,
+                parse_mode=ParseMode.MARKDOWN
+            )
 
-                await self.application.bot.send_message(
-                    chat_id=int(admin_id),
-                    text="⚡ *Быстрые действия:*",
-                    reply_markup=InlineKeyboardMarkup(keyboard),
-                    parse_mode=ParseMode.MARKDOWN
-                )
+        # Кнопки для быстрого управления заказом
+        keyboard = [
+            [
+                InlineKeyboardButton("✅ Принять", callback_data=f"accept_{order_id}"),
+                InlineKeyboardButton("⏳ В процессе", callback_data=f"process_{order_id}")
+            ],
+            [
+                InlineKeyboardButton("🚚 Готово", callback_data=f"ready_{order_id}"),
+                InlineKeyboardButton("❌ Отменить", callback_data=f"cancel_{order_id}")
+            ],
+            [
+                InlineKeyboardButton("📞 Позвонить", url=f"tel:{order_data.get('phone', '')}"),
+                InlineKeyboardButton("💬 Написать",
+                                     url=f"https://t.me/{user.username}" if user.username else f"tg://user?id={user.id}")
+            ]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
 
-            except Exception as e:
-                logger.error(f"Ошибка отправки админу {admin_id}: {e}")
+        # Личные сообщения администраторам: уведомление и кнопки одним сообщением
+        for admin_id in settings.ADMIN_IDS:
+            self.notifier.submit(
+                int(admin_id),
+                f"{notification}\n\n⚡ *Быстрые действия:*",
+                reply_markup=reply_markup,
+                parse_mode=ParseMode.MARKDOWN
+            )
 
     def format_order_confirmation(self, order_id: int, order_data: dict) -> str:
         """Форматирование подтверждения заказа"""
@@ -722,20 +702,87 @@ class CoffeeShopBot:
 
         await self.show_admin_orders(query)
 
+    async def reconcile_loyalty(self, context: ContextTypes.DEFAULT_TYPE):
+        """Периодическая сверка балансов баллов"""
+        try:
+            result = await self.loyalty.reconcile_balances()
+            logger.info(f"Сверка балансов завершена, расхождений: {len(result['drift'])}")
+        except Exception as e:
+            metrics.error('handler', 'reconcile_loyalty')
+            logger.error(f"Ошибка сверки балансов: {e}")
+
     async def run(self):
         """Запуск бота"""
         logger.info("🚀 Бот запускается...")
         logger.info(f"👥 Админы: {settings.ADMIN_IDS}")
         logger.info(f"🏪 Магазин: {settings.SHOP_NAME}")
 
-        await self.application.initialize()
-        await self.application.start()
-        await self.application.updater.start_polling()
+        # Прогреваем пул соединений до приема первых апдейтов
+        await self.db.open()
 
-        logger.info("✅ Бот успешно запущен!")
+        try:
+            await self.application.initialize()
+            await self.setup_menu_button()
+
+            # Периодическая синхронизация меню с внешним API, если включена
+            if settings.SYNC_ENABLED and settings.EXTERNAL_MENU_API:
+                self.menu_sync.start()
+
+            # Ежедневная сверка балансов баллов с леджером
+            if settings.LOYALTY_ENABLED and settings.LOYALTY_RECONCILE_HOURS > 0:
+                self.application.job_queue.run_repeating(
+                    self.reconcile_loyalty,
+                    interval=timedelta(hours=settings.LOYALTY_RECONCILE_HOURS),
+                    first=timedelta(minutes=1)
+                )
 
-        # Бесконечный цикл
-        await asyncio.Event().wait()
+            await self.application.start()
+            self.activity.start()
+
+            # Фоновая отправка событий во внешнюю систему
+            if self.db.outbox_enabled:
+                self.outbox.start()
+
+            # API для Mini App на том же пуле соединений и кэше меню; в режиме webhook
+            # тот же сервер принимает апдейты Telegram
+            if settings.API_ENABLED or self.webhook_mode:
+                app = create_app(self.db, self.loyalty, pricing=self.pricing,
+                                 application=self.application if self.webhook_mode else None,
+                                 metrics=metrics if metrics.enabled else None)
+                self.api_server = create_server(app)
+                self.api_task = asyncio.create_task(self.api_server.serve())
+
+            if self.webhook_mode:
+                await self.application.bot.set_webhook(
+                    url=f"{settings.WEBHOOK_URL.rstrip('/')}{settings.WEBHOOK_PATH}",
+                    secret_token=settings.WEBHOOK_SECRET,
+                    allowed_updates=Update.ALL_TYPES,
+                    max_connections=min(100, settings.UPDATES_MAX_CONCURRENT)
+                )
+                logger.info(f"🔗 Webhook: {settings.WEBHOOK_URL.rstrip('/')}{settings.WEBHOOK_PATH}")
+            else:
+                await self.application.updater.start_polling()
+
+            logger.info("✅ Бот успешно запущен!")
+
+            # Бесконечный цикл
+            await asyncio.Event().wait()
+        finally:
+            # Досылаем уведомления, поставленные до остановки
+            await self.notifier.drain()
+            if self.application.updater is not None and self.application.updater.running:
+                await self.application.updater.stop()
+            if self.application.running:
+                await self.application.stop()
+            await self.application.shutdown()
+            if self.api_task is not None:
+                self.api_server.should_exit = True
+                await self.api_task
+            await self.outbox.stop()
+            await self.menu_sync.stop()
+            await self.activity.stop()
+            await self.http.close()
+            await self.db.close()
 
 
 def main():
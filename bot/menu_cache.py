@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Awaitable, Callable, Dict, Iterable, Mapping, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class MenuSnapshot:
+    """Неизменяемый снимок меню одной версии"""
+    version: int
+    categories: Tuple[str, ...]
+    items: Tuple[Mapping, ...]
+    by_category: Mapping[str, Tuple[Mapping, ...]]
+    by_id: Mapping[int, Mapping]
+    emojis: Mapping[str, str]
+
+    @classmethod
+    def build(cls, version: int, categories: Iterable[Dict], items: Iterable[Dict]) -> 'MenuSnapshot':
+        """Сборка снимка из строк categories и menu_items"""
+        categories = list(categories)
+        frozen_items = tuple(MappingProxyType(dict(item)) for item in items)
+
+        by_category: Dict[str, list] = {category['name']: [] for category in categories}
+        for item in frozen_items:
+            by_category.setdefault(item['category_name'], []).append(item)
+
+        return cls(
+            version=version,
+            categories=tuple(category['name'] for category in categories),
+            items=frozen_items,
+            by_category=MappingProxyType({name: tuple(rows) for name, rows in by_category.items()}),
+            by_id=MappingProxyType({item['id']: item for item in frozen_items}),
+            emojis=MappingProxyType({category['name']: category['emoji'] for category in categories})
+        )
+
+
+class MenuCache:
+    """Кэш меню в памяти процесса
+
+    Снимок строится один раз и отдается всем читателям. invalidate() меняет
+    версию: следующий запрос пересоберет снимок, а сборка, начатая до
+    инвалидации, не будет сохранена.
+    """
+
+    def __init__(self, loader: Callable[[int], Awaitable[MenuSnapshot]], enabled: bool = True):
+        self._loader = loader
+        self.enabled = enabled
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._snapshot = None
+        self._lock = asyncio.Lock()
+
+    def _fresh(self):
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == self.version:
+            return snapshot
+        return None
+
+    async def get(self) -> MenuSnapshot:
+        """Текущий снимок меню"""
+        snapshot = self._fresh() if self.enabled else None
+        if snapshot is not None:
+            self.hits += 1
+            return snapshot
+
+        self.misses += 1
+        if not self.enabled:
+            return await self._loader(self.version)
+
+        # Одна пересборка на всех одновременно ожидающих
+        async with self._lock:
+            snapshot = self._fresh()
+            if snapshot is not None:
+                return snapshot
+
+            version = self.version
+            snapshot = await self._loader(version)
+            if version == self.version:
+                self._snapshot = snapshot
+            return snapshot
+
+    def invalidate(self):
+        """Сброс снимка после изменения меню"""
+        self.version += 1
+        logger.info(f"Кэш меню сброшен, версия {self.version}")
+
+    def stats(self) -> Dict:
+        return {
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'enabled': self.enabled
+        }
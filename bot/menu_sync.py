@@ -0,0 +1,277 @@
+import asyncio
+import codecs
+import hashlib
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# Поля позиции, которые приходят из внешнего меню: name, description, price, available, category
+ItemFields = Tuple[str, str, float, int, str]
+
+_WHITESPACE = ' \t\n\r'
+_NUMBER_TAIL = '0123456789.eE+-'
+
+
+def normalize_item(item: Mapping) -> Optional[Tuple[str, ItemFields]]:
+    """(external_id, поля) позиции из выгрузки или None, если позиция некорректна"""
+    if not isinstance(item, Mapping):
+        return None
+    external_id = item.get('external_id')
+    name = item.get('name')
+    price = item.get('price')
+    if not external_id or not name or isinstance(price, bool) or not isinstance(price, (int, float)) or price < 0:
+        return None
+    return str(external_id), (
+        str(name),
+        str(item.get('description') or ''),
+        float(price),
+        1 if item.get('available', 1) else 0,
+        str(item.get('category') or 'other')
+    )
+
+
+def content_hash(fields: ItemFields) -> str:
+    # Хеш не хранится в базе, только сравнивается в рамках одной синхронизации
+    return hashlib.sha1(repr(fields).encode()).hexdigest()
+
+
+@dataclass
+class MenuSyncPlan:
+    """Изменения одной пачки позиций для menu_items"""
+    inserts: List[Tuple[str, ItemFields]] = field(default_factory=list)
+    updates: List[Tuple[int, ItemFields]] = field(default_factory=list)
+    seen: List[str] = field(default_factory=list)
+    unchanged: int = 0
+    skipped: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.inserts or self.updates)
+
+
+def diff_menu(current: Mapping[str, Tuple[int, str]], items: Iterable[Mapping]) -> MenuSyncPlan:
+    """Сравнение пачки позиций выгрузки с базой по хешу содержимого
+
+    current - external_id -> (id, хеш полей) для позиций пачки, которые уже
+    есть в базе. При повторе external_id в пачке берется последняя позиция.
+    Некорректные позиции пропускаются, но их external_id попадает в seen:
+    позиция в выгрузке есть, и выключать ее как пропавшую нельзя.
+    """
+    plan = MenuSyncPlan()
+    incoming: Dict[str, ItemFields] = {}
+    rejected: List[str] = []
+    for item in items:
+        normalized = normalize_item(item)
+        if normalized is None:
+            plan.skipped += 1
+            if isinstance(item, Mapping) and item.get('external_id'):
+                rejected.append(str(item['external_id']))
+            continue
+        external_id, fields = normalized
+        incoming[external_id] = fields
+
+    for external_id, fields in incoming.items():
+        existing = current.get(external_id)
+        if existing is None:
+            plan.inserts.append((external_id, fields))
+        elif existing[1] != content_hash(fields):
+            plan.updates.append((existing[0], fields))
+        else:
+            plan.unchanged += 1
+    plan.seen = list(incoming) + rejected
+    return plan
+
+
+async def sync_menu_items(db, items: AsyncIterable[Mapping], batch_size: int = 500) -> Dict[str, int]:
+    """Синхронизация потока позиций пачками по batch_size
+
+    Каждая пачка сравнивается и записывается отдельной транзакцией
+    (Database.apply_menu_batch), так что в памяти одновременно только
+    пачка и множество увиденных external_id. Позиции, которых не было
+    в выгрузке, выключаются (available = 0) только после того, как поток
+    дочитан до конца: оборванная выгрузка ничего не выключает, пустая тоже.
+    """
+    result = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0, 'skipped': 0}
+    seen: Set[str] = set()
+    changed = False
+    batch: List[Mapping] = []
+
+    async def apply():
+        nonlocal changed
+        plan = await db.apply_menu_batch(batch)
+        result['added'] += len(plan.inserts)
+        result['updated'] += len(plan.updates)
+        result['unchanged'] += plan.unchanged
+        result['skipped'] += plan.skipped
+        seen.update(plan.seen)
+        changed = changed or plan.changed
+        batch.clear()
+
+    try:
+        async for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                await apply()
+        if batch:
+            await apply()
+
+        if seen:
+            result['removed'] = await db.disable_missing_menu_items(seen)
+            changed = changed or result['removed'] > 0
+    finally:
+        # Уже записанные пачки должны стать видны даже при оборванной выгрузке
+        if changed:
+            db.invalidate_menu()
+    return result
+
+
+async def iterate(items: Iterable[Mapping]) -> AsyncIterator[Mapping]:
+    for item in items:
+        yield item
+
+
+class JsonArrayParser:
+    """Инкрементальный разбор JSON-массива верхнего уровня
+
+    feed() принимает очередной кусок текста и возвращает элементы массива,
+    которые в нем завершились; незавершенный хвост остается в буфере.
+    Элемент больше max_item_size символов считается ошибкой выгрузки.
+    """
+
+    def __init__(self, max_item_size: int = 4 * 1024 * 1024):
+        self.max_item_size = max_item_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._state = 'start'  # start -> item | next -> done
+
+    def feed(self, text: str, final: bool = False) -> List[Any]:
+        buffer = self._buffer + text
+        position = 0
+        items = []
+
+        while True:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position == len(buffer):
+                break
+
+            char = buffer[position]
+            if self._state == 'start':
+                if char != '[':
+                    raise ValueError("Выгрузка меню должна быть JSON-массивом")
+                position += 1
+                self._state = 'first'
+            elif self._state == 'next':
+                if char == ',':
+                    self._state = 'item'
+                elif char == ']':
+                    self._state = 'done'
+                else:
+                    raise ValueError(f"Ожидалась ',' или ']' в выгрузке меню, получено {char!r}")
+                position += 1
+            elif self._state == 'first' and char == ']':
+                self._state = 'done'
+                position += 1
+            elif self._state in ('first', 'item'):
+                try:
+                    item, end = self._decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if final:
+                        raise
+                    break
+                # Число в конце куска может продолжиться в следующем: "12" + "3", "2." + "5"
+                if not final and isinstance(item, (int, float)) and not isinstance(item, bool) \
+                        and not buffer[end:].strip(_NUMBER_TAIL):
+                    break
+                items.append(item)
+                position = end
+                self._state = 'next'
+            else:
+                raise ValueError("Лишние данные после JSON-массива")
+
+        self._buffer = buffer[position:]
+        if len(self._buffer) > self.max_item_size:
+            raise ValueError(f"Позиция выгрузки больше {self.max_item_size} символов")
+        if final and self._state != 'done':
+            raise ValueError("Выгрузка меню оборвана")
+        return items
+
+
+async def iter_json_array(chunks: AsyncIterable[bytes]) -> AsyncIterator[Any]:
+    """Элементы JSON-массива из потока байтов по мере их получения"""
+    parser = JsonArrayParser()
+    text = codecs.getincrementaldecoder('utf-8')()
+    async for chunk in chunks:
+        for item in parser.feed(text.decode(chunk)):
+            yield item
+    for item in parser.feed(text.decode(b'', final=True), final=True):
+        yield item
+
+
+class MenuSyncWorker:
+    """Периодическая синхронизация меню с внешним API
+
+    Выгрузка забирается раз в interval секунд и разбирается потоково:
+    позиции уходят в базу пачками, не дожидаясь конца ответа, поэтому
+    память не растет с размером выгрузки.
+    """
+
+    def __init__(self, db, http, url: str, interval: float = 300, batch_size: int = 500,
+                 chunk_size: int = 64 * 1024):
+        self.db = db
+        self.http = http
+        self.url = url
+        self.interval = interval
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self._task: Optional[asyncio.Task] = None
+
+        self.runs = 0
+        self.failures = 0
+        self.last_result: Dict[str, int] = {}
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def sync_once(self) -> Optional[Dict[str, int]]:
+        """Одна синхронизация; None, если выгрузку получить не удалось"""
+        # Большая выгрузка читается дольше общего таймаута клиента - ограничиваем паузы между кусками
+        timeout = aiohttp.ClientTimeout(total=None, sock_read=self.http.timeout)
+        async with self.http.session.get(self.url, timeout=timeout) as response:
+            if response.status != 200:
+                logger.warning(f"Синхронизация меню: внешний API ответил {response.status}")
+                return None
+            items = iter_json_array(response.content.iter_chunked(self.chunk_size))
+            result = await sync_menu_items(self.db, items, self.batch_size)
+
+        self.runs += 1
+        self.last_result = result
+        logger.info(f"Меню синхронизировано с внешним API: {result}")
+        return result
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync_once()
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Ошибка синхронизации меню: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> Dict:
+        return {'runs': self.runs, 'failures': self.failures, **self.last_result}
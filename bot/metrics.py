@@ -0,0 +1,240 @@
+import functools
+import inspect
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import aiohttp
+from telegram.request import HTTPXRequest
+
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин задержек, секунды
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Histogram:
+    """Гистограмма одного набора меток: корзины, сумма и количество"""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+
+class Family:
+    """Метрика с метками; дочерние значения создаются при первом обращении"""
+
+    def __init__(self, name: str, documentation: str, kind: str, labelnames: Sequence[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            child = Histogram(self.buckets) if self.kind == 'histogram' else Counter()
+            self._children[values] = child
+        return child
+
+    def render(self, lines: List[str]):
+        lines.append(f"# HELP {self.name} {self.documentation}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        for values, child in sorted(self._children.items()):
+            if self.kind == 'counter':
+                lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {child.value}")
+                continue
+            if not child.count:
+                continue
+
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+                cumulative += count
+                le = 'le="%s"' % ('+Inf' if bound == float('inf') else repr(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {child.sum:.6f}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+
+
+class MetricsRegistry:
+    """Счетчики и гистограммы задержек горячих путей в формате Prometheus
+
+    Замер - два вызова perf_counter и bisect по корзинам; дочерняя
+    гистограмма выбирается при обертке метода, а не на каждом вызове.
+    Гистограммы накопительные: окно считает Prometheus (rate/histogram_quantile).
+    stats() компонентов отдаются как gauge при каждом сборе.
+    """
+
+    def __init__(self, namespace: str = 'coffee', enabled: bool = True):
+        self.namespace = namespace
+        self.enabled = enabled
+        self._families: Dict[str, Family] = {}
+        self._collectors: Dict[str, Callable[[], Dict]] = {}
+
+        self.db = self.histogram('db_call_seconds', "Время методов Database", ('method',))
+        self.handlers = self.histogram('handler_seconds', "Время обработчиков бота", ('handler',))
+        self.telegram = self.histogram('telegram_request_seconds', "Запросы к Bot API", ('method', 'status'))
+        self.external = self.histogram('external_seconds', "Внешние синхронизации и HTTP", ('operation',))
+        self.errors = self.counter('errors_total', "Исключения по компонентам", ('component', 'operation'))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Family:
+        return self._family(name, documentation, 'histogram', labelnames, buckets)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Family:
+        return self._family(name, documentation, 'counter', labelnames)
+
+    def _family(self, name: str, documentation: str, kind: str, labelnames, buckets=LATENCY_BUCKETS) -> Family:
+        name = f"{self.namespace}_{name}"
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = Family(name, documentation, kind, labelnames, buckets)
+        return family
+
+    def collector(self, name: str, stats: Callable[[], Dict]):
+        """Источник gauge: числовые значения stats() как {namespace}_{name}_{ключ}"""
+        self._collectors[name] = stats
+
+    def error(self, component: str, operation: str):
+        self.errors.labels(component, operation).inc()
+
+    def timed(self, family: Family, component: str, label: str):
+        """Декоратор корутины: время в family[label], исключения в errors_total{component, label}"""
+        histogram = family.labels(label)
+        errors = self.errors.labels(component, label)
+
+        def decorator(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                except Exception:
+                    errors.inc()
+                    raise
+                finally:
+                    histogram.observe(time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    def instrument(self, obj, family: Family, component: str, names: Optional[Iterable[str]] = None,
+                   exclude: Iterable[str] = ()) -> int:
+        """Обернуть async-методы объекта (по умолчанию все публичные); возвращает их количество"""
+        if not self.enabled:
+            return 0
+
+        exclude = set(exclude)
+        if names is None:
+            names = [name for name, _ in inspect.getmembers(type(obj), inspect.iscoroutinefunction)
+                     if not name.startswith('_')]
+
+        count = 0
+        for name in names:
+            if name in exclude:
+                continue
+            method = getattr(obj, name)
+            setattr(obj, name, self.timed(family, component, name)(method))
+            count += 1
+        return count
+
+    def http_trace(self) -> aiohttp.TraceConfig:
+        """Трассировка запросов aiohttp: время по хосту, ошибки соединения"""
+        trace = aiohttp.TraceConfig()
+
+        async def on_start(session, context, params):
+            context.started = time.perf_counter()
+
+        async def on_end(session, context, params):
+            self.external.labels(f"http:{params.url.host}").observe(time.perf_counter() - context.started)
+
+        async def on_exception(session, context, params):
+            self.external.labels(f"http:{params.url.host}").observe(time.perf_counter() - context.started)
+            self.error('http', params.url.host or '')
+
+        trace.on_request_start.append(on_start)
+        trace.on_request_end.append(on_end)
+        trace.on_request_exception.append(on_exception)
+        return trace
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus 0.0.4"""
+        lines: List[str] = []
+        for family in self._families.values():
+            family.render(lines)
+
+        for name, stats in self._collectors.items():
+            try:
+                values = stats()
+            except Exception as e:
+                logger.warning(f"Метрики {name} не собраны: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                metric = f"{self.namespace}_{name}_{key}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+
+        lines.append('')
+        return '\n'.join(lines)
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest с замером каждого вызова Bot API"""
+
+    def __init__(self, registry: MetricsRegistry, **kwargs):
+        super().__init__(**kwargs)
+        self.registry = registry
+
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> Tuple[int, bytes]:
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+            status = str(code)
+            return code, payload
+        finally:
+            self.registry.telegram.labels(api_method, status).observe(time.perf_counter() - started)
+
+
+metrics = MetricsRegistry(enabled=settings.METRICS_ENABLED)
@@ -0,0 +1,292 @@
+import logging
+import sqlite3
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Tuple
+
+from bot.daily_stats import BACKFILL as DAILY_STATS_BACKFILL
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    statements: Tuple[str, ...]
+
+
+MIGRATIONS: Tuple[Migration, ...] = (
+    Migration(1, "initial schema", (
+        # Пользователи
+        '''CREATE TABLE IF NOT EXISTS users
+           (
+               id           INTEGER PRIMARY KEY AUTOINCREMENT,
+               telegram_id  INTEGER UNIQUE NOT NULL,
+               username     TEXT,
+               first_name   TEXT NOT NULL,
+               last_name    TEXT,
+               phone        TEXT,
+               email        TEXT,
+               balance      REAL      DEFAULT 0,
+               total_orders INTEGER   DEFAULT 0,
+               total_spent  REAL      DEFAULT 0,
+               created_at   TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               last_active  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )''',
+        # Программа лояльности
+        '''CREATE TABLE IF NOT EXISTS loyalty_points
+           (
+               id         INTEGER PRIMARY KEY AUTOINCREMENT,
+               user_id    INTEGER NOT NULL,
+               points     INTEGER NOT NULL,
+               reason     TEXT,
+               order_id   INTEGER,
+               created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               FOREIGN KEY (user_id) REFERENCES users (id)
+           )''',
+        '''CREATE TABLE IF NOT EXISTS loyalty_levels
+           (
+               id         INTEGER PRIMARY KEY AUTOINCREMENT,
+               name       TEXT    NOT NULL,
+               min_points INTEGER NOT NULL,
+               discount   INTEGER NOT NULL,
+               color      TEXT DEFAULT '#3498db'
+           )''',
+        # Категории меню
+        '''CREATE TABLE IF NOT EXISTS categories
+           (
+               id       INTEGER PRIMARY KEY AUTOINCREMENT,
+               name     TEXT NOT NULL UNIQUE,
+               emoji    TEXT,
+               position INTEGER DEFAULT 0
+           )''',
+        # Меню
+        '''CREATE TABLE IF NOT EXISTS menu_items
+           (
+               id           INTEGER PRIMARY KEY AUTOINCREMENT,
+               category_id  INTEGER,
+               name         TEXT NOT NULL,
+               description  TEXT,
+               price        REAL NOT NULL,
+               image_url    TEXT,
+               available    BOOLEAN   DEFAULT 1,
+               position     INTEGER   DEFAULT 0,
+               external_id  TEXT UNIQUE,
+               sync_enabled BOOLEAN   DEFAULT 0,
+               created_at   TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               updated_at   TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               FOREIGN KEY (category_id) REFERENCES categories (id)
+           )''',
+        # Заказы
+        '''CREATE TABLE IF NOT EXISTS orders
+           (
+               id             INTEGER PRIMARY KEY AUTOINCREMENT,
+               user_id        INTEGER NOT NULL,
+               total_amount   REAL    NOT NULL,
+               status         TEXT      DEFAULT 'pending',
+               payment_method TEXT      DEFAULT 'cash',
+               delivery_type  TEXT      DEFAULT 'pickup',
+               address        TEXT,
+               phone          TEXT,
+               notes          TEXT,
+               scheduled_time TIMESTAMP,
+               created_at     TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               updated_at     TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               external_sync  BOOLEAN   DEFAULT 0,
+               FOREIGN KEY (user_id) REFERENCES users (id)
+           )''',
+        # Позиции заказа
+        '''CREATE TABLE IF NOT EXISTS order_items
+           (
+               id           INTEGER PRIMARY KEY AUTOINCREMENT,
+               order_id     INTEGER NOT NULL,
+               menu_item_id INTEGER NOT NULL,
+               quantity     INTEGER NOT NULL,
+               price        REAL    NOT NULL,
+               notes        TEXT,
+               FOREIGN KEY (order_id) REFERENCES orders (id),
+               FOREIGN KEY (menu_item_id) REFERENCES menu_items (id)
+           )''',
+        # Настройки
+        '''CREATE TABLE IF NOT EXISTS settings
+           (
+               key        TEXT PRIMARY KEY,
+               value      TEXT,
+               updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+           )''',
+        # Внешние интеграции
+        '''CREATE TABLE IF NOT EXISTS external_sync
+           (
+               id          INTEGER PRIMARY KEY AUTOINCREMENT,
+               entity_type TEXT    NOT NULL,
+               entity_id   INTEGER NOT NULL,
+               external_id TEXT,
+               sync_status TEXT DEFAULT 'pending',
+               last_sync   TIMESTAMP,
+               UNIQUE (entity_type, entity_id)
+           )''',
+    )),
+    Migration(2, "indexes for hot queries", (
+        # История заказов пользователя и агрегаты в get_user_data
+        '''CREATE INDEX IF NOT EXISTS idx_orders_user_created
+               ON orders (user_id, created_at, total_amount)''',
+        # Статистика за день и активные пользователи
+        '''CREATE INDEX IF NOT EXISTS idx_orders_created
+               ON orders (created_at, status, total_amount, user_id)''',
+        # Списки заказов по статусу в админке
+        '''CREATE INDEX IF NOT EXISTS idx_orders_status_created
+               ON orders (status, created_at)''',
+        '''CREATE INDEX IF NOT EXISTS idx_order_items_order
+               ON order_items (order_id, menu_item_id, quantity, price)''',
+        # Баланс и история баллов
+        '''CREATE INDEX IF NOT EXISTS idx_loyalty_points_user_created
+               ON loyalty_points (user_id, created_at, points)''',
+        '''CREATE INDEX IF NOT EXISTS idx_loyalty_levels_min_points
+               ON loyalty_levels (min_points)''',
+        '''CREATE INDEX IF NOT EXISTS idx_users_created
+               ON users (created_at)''',
+        '''CREATE INDEX IF NOT EXISTS idx_menu_items_category
+               ON menu_items (category_id, available, position)''',
+        '''CREATE INDEX IF NOT EXISTS idx_menu_items_available_price
+               ON menu_items (available, price)''',
+    )),
+    Migration(3, "materialized loyalty balances", (
+        # Текущий баланс баллов: обновляется вместе с каждой записью в loyalty_points
+        '''CREATE TABLE IF NOT EXISTS loyalty_balances
+           (
+               user_id    INTEGER PRIMARY KEY,
+               points     INTEGER NOT NULL DEFAULT 0,
+               earned     INTEGER NOT NULL DEFAULT 0,
+               spent      INTEGER NOT NULL DEFAULT 0,
+               updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+               FOREIGN KEY (user_id) REFERENCES users (id)
+           )''',
+        '''INSERT OR REPLACE INTO loyalty_balances (user_id, points, earned, spent)
+           SELECT user_id,
+                  SUM(points),
+                  SUM(CASE WHEN points > 0 THEN points ELSE 0 END),
+                  SUM(CASE WHEN points < 0 THEN -points ELSE 0 END)
+           FROM loyalty_points
+           GROUP BY user_id''',
+    )),
+    Migration(4, "external sync outbox", (
+        # external_sync становится outbox: событие с данными и расписанием повторов
+        "ALTER TABLE external_sync ADD COLUMN payload TEXT",
+        "ALTER TABLE external_sync ADD COLUMN attempts INTEGER DEFAULT 0",
+        "ALTER TABLE external_sync ADD COLUMN next_attempt_at TIMESTAMP",
+        "ALTER TABLE external_sync ADD COLUMN last_error TEXT",
+        "ALTER TABLE external_sync ADD COLUMN created_at TIMESTAMP",
+        '''CREATE INDEX IF NOT EXISTS idx_external_sync_pending
+               ON external_sync (sync_status, next_attempt_at)''',
+    )),
+    Migration(5, "order idempotency keys", (
+        # Ключ генерирует Mini App; повтор отправки не создает второй заказ
+        "ALTER TABLE orders ADD COLUMN idempotency_key TEXT",
+        '''CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_idempotency
+               ON orders (user_id, idempotency_key)
+               WHERE idempotency_key IS NOT NULL''',
+    )),
+    Migration(6, "menu external id index", (
+        # Синхронизация меню ищет позиции выгрузки пачками по external_id
+        '''CREATE INDEX IF NOT EXISTS idx_menu_items_external
+               ON menu_items (external_id)
+               WHERE external_id IS NOT NULL''',
+    )),
+    Migration(7, "daily stats rollup", (
+        # Свод по дням для статистики админа, обновляется вместе с заказами и пользователями
+        '''CREATE TABLE IF NOT EXISTS daily_stats
+           (
+               day               TEXT PRIMARY KEY,
+               total_orders      INTEGER NOT NULL DEFAULT 0,
+               new_orders        INTEGER NOT NULL DEFAULT 0,
+               processing_orders INTEGER NOT NULL DEFAULT 0,
+               completed_orders  INTEGER NOT NULL DEFAULT 0,
+               cancelled_orders  INTEGER NOT NULL DEFAULT 0,
+               revenue           REAL    NOT NULL DEFAULT 0,
+               new_users         INTEGER NOT NULL DEFAULT 0,
+               active_users      INTEGER NOT NULL DEFAULT 0,
+               last_active_users INTEGER NOT NULL DEFAULT 0
+           )''',
+        # День последнего заказа пользователя (для уникальных заказавших за период)
+        '''CREATE TABLE IF NOT EXISTS user_last_order
+           (
+               user_id INTEGER PRIMARY KEY,
+               day     TEXT NOT NULL
+           )''',
+        *DAILY_STATS_BACKFILL,
+    )),
+    Migration(8, "loyalty levels version", (
+        # Любая запись в loyalty_levels (бот, админка, ручной SQL) увеличивает версию;
+        # LoyaltySystem.get_levels() перечитывает уровни при ее смене
+        "INSERT OR IGNORE INTO settings (key, value) VALUES ('loyalty_levels_version', '0')",
+        '''CREATE TRIGGER IF NOT EXISTS loyalty_levels_version_insert
+               AFTER INSERT ON loyalty_levels
+           BEGIN
+               UPDATE settings
+               SET value      = CAST(value AS INTEGER) + 1,
+                   updated_at = CURRENT_TIMESTAMP
+               WHERE key = 'loyalty_levels_version';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS loyalty_levels_version_update
+               AFTER UPDATE ON loyalty_levels
+           BEGIN
+               UPDATE settings
+               SET value      = CAST(value AS INTEGER) + 1,
+                   updated_at = CURRENT_TIMESTAMP
+               WHERE key = 'loyalty_levels_version';
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS loyalty_levels_version_delete
+               AFTER DELETE ON loyalty_levels
+           BEGIN
+               UPDATE settings
+               SET value      = CAST(value AS INTEGER) + 1,
+                   updated_at = CURRENT_TIMESTAMP
+               WHERE key = 'loyalty_levels_version';
+           END''',
+    )),
+)
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """Текущая версия схемы (0 для пустой базы)"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_migrations
+                    (
+                        version    INTEGER PRIMARY KEY,
+                        name       TEXT NOT NULL,
+                        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )''')
+    row = conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations").fetchone()
+    return row[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Применение недостающих миграций, каждая в своей транзакции
+
+    Соединение должно быть открыто с isolation_level=None.
+    Возвращает итоговую версию схемы.
+    """
+    version = current_version(conn)
+
+    for migration in MIGRATIONS:
+        if migration.version <= version:
+            continue
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in migration.statements:
+                conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                (migration.version, migration.name, datetime.now())
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            logger.error(f"Ошибка миграции схемы до версии {migration.version}")
+            raise
+
+        version = migration.version
+        logger.info(f"Схема обновлена до версии {version}: {migration.name}")
+
+    return version
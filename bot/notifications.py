@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Set, Union
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Равномерный лимит: не чаще rate событий в секунду
+
+    Каждый вызов acquire() резервирует следующий свободный слот, поэтому
+    одновременные отправки выстраиваются в очередь без общей блокировки.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+
+    def reserve(self) -> float:
+        """Резервирует слот и возвращает, сколько до него ждать"""
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        return slot - now
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class NotificationDispatcher:
+    """Фоновая отправка сообщений с учетом лимитов Telegram
+
+    Сообщения отправляются параллельно, но не чаще global_rate в секунду
+    на бота и chat_rate в секунду на чат. Временные ошибки повторяются
+    с экспоненциальной задержкой, RetryAfter - через указанное Telegram время.
+    bot - любой объект с корутиной send_message (в тестах - фейковый бот).
+    """
+
+    def __init__(self, bot, global_rate: float = 25, chat_rate: float = 1,
+                 max_retries: int = 3, backoff: float = 1.0):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self._global = RateLimiter(global_rate)
+        self._chats: Dict[Union[int, str], RateLimiter] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.sent = 0
+        self.failed = 0
+
+    def submit(self, chat_id: Union[int, str], text: str, **kwargs) -> asyncio.Task:
+        """Поставить сообщение в отправку, не дожидаясь ее"""
+        task = asyncio.create_task(self.send(chat_id, text, **kwargs))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def send(self, chat_id: Union[int, str], text: str, **kwargs) -> bool:
+        """Отправка с лимитами и повторами; True при успехе"""
+        chat_limiter = self._chats.setdefault(chat_id, RateLimiter(self.chat_rate))
+
+        for attempt in range(self.max_retries + 1):
+            await chat_limiter.acquire()
+            await self._global.acquire()
+
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                self.sent += 1
+                return True
+            except RetryAfter as e:
+                delay = float(e.retry_after)
+            except (BadRequest, Forbidden) as e:
+                # Повтор не исправит (BadRequest - подкласс NetworkError, ловим раньше)
+                logger.error(f"Сообщение в {chat_id} не отправлено: {e}")
+                self.failed += 1
+                return False
+            except (NetworkError, TelegramError) as e:
+                # TimedOut тоже NetworkError
+                delay = self.backoff * 2 ** attempt
+                logger.warning(f"Ошибка при отправке в {chat_id}, попытка {attempt + 1}: {e}")
+            except Exception:
+                # Ошибка в самом сообщении (разметка, клавиатура): задачу submit() никто не ждет,
+                # поэтому исключение не должно из нее выходить
+                logger.exception(f"Сообщение в {chat_id} не отправлено")
+                self.failed += 1
+                return False
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(delay)
+
+        self.failed += 1
+        logger.error(f"Сообщение в {chat_id} не отправлено после {self.max_retries + 1} попыток")
+        return False
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    def stats(self) -> Dict:
+        return {'sent': self.sent, 'failed': self.failed, 'pending': self.pending}
+
+    async def drain(self):
+        """Дождаться отправки всех поставленных сообщений"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from bot.database import Database
+from bot.http_client import HttpClient
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxWorker:
+    """Фоновая отправка событий из external_sync во внешнюю систему
+
+    События пишутся в outbox в одной транзакции с заказом или начислением
+    баллов, а этот воркер отправляет их пачками. При ошибке пачка
+    откладывается с экспоненциальной задержкой, после max_attempts событие
+    помечается как failed. Доставка "хотя бы один раз": получатель
+    отбрасывает дубли по event_id. Баллы приходят только событиями 'points'
+    (по записи леджера, с order_id для заказов), событие 'order' их не несет.
+    """
+
+    def __init__(self, db: Database, http: HttpClient, url: str, batch_size: int = 50,
+                 interval: float = 5, max_attempts: int = 10, backoff: float = 2, max_backoff: float = 600):
+        self.db = db
+        self.http = http
+        self.url = url
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+        self.sent = 0
+        self.failed_batches = 0
+
+    def stats(self) -> Dict:
+        return {'sent': self.sent, 'failed_batches': self.failed_batches}
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Разбудить воркер, не дожидаясь интервала (после новой записи в outbox)"""
+        self._wake.set()
+
+    async def _run(self):
+        while True:
+            try:
+                sent = await self.drain_once()
+            except Exception as e:
+                logger.error(f"Ошибка обработки outbox: {e}")
+                sent = 0
+
+            # Полная пачка - скорее всего, есть еще события
+            if sent >= self.batch_size:
+                continue
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def fetch_batch(self) -> List[Dict]:
+        """Готовые к отправке события"""
+        async with self.db.connect() as db:
+            cursor = await db.execute('''
+                                      SELECT id, entity_type, entity_id, payload, attempts
+                                      FROM external_sync
+                                      WHERE sync_status = 'pending'
+                                        AND next_attempt_at <= ?
+                                      ORDER BY next_attempt_at LIMIT ?
+                                      ''', (datetime.now(), self.batch_size))
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def drain_once(self) -> int:
+        """Отправка одной пачки; возвращает количество отправленных событий"""
+        batch = await self.fetch_batch()
+        if not batch:
+            return 0
+
+        events = [
+            {
+                'event_id': f"{row['entity_type']}:{row['entity_id']}",
+                'type': row['entity_type'],
+                'data': json.loads(row['payload']) if row['payload'] else None
+            }
+            for row in batch
+        ]
+
+        try:
+            async with self.http.session.post(self.url, json={'events': events}) as response:
+                if response.status >= 300:
+                    raise RuntimeError(f"HTTP {response.status}")
+        except Exception as e:
+            self.failed_batches += 1
+            error = str(e) or type(e).__name__
+            await self._mark_failed(batch, error)
+            logger.warning(f"Outbox: пачка из {len(batch)} событий не отправлена: {error}")
+            return 0
+
+        await self._mark_synced(batch)
+        self.sent += len(batch)
+        return len(batch)
+
+    async def _mark_synced(self, batch: List[Dict]):
+        now = datetime.now()
+        async with self.db.transaction() as db:
+            await db.executemany('''
+                                 UPDATE external_sync
+                                 SET sync_status = 'synced',
+                                     last_sync   = ?,
+                                     attempts    = attempts + 1,
+                                     last_error  = NULL
+                                 WHERE id = ?
+                                 ''', [(now, row['id']) for row in batch])
+
+    async def _mark_failed(self, batch: List[Dict], error: str):
+        now = datetime.now()
+        updates = []
+        for row in batch:
+            attempts = row['attempts'] + 1
+            delay = min(self.max_backoff, self.backoff * 2 ** (attempts - 1))
+            status = 'failed' if attempts >= self.max_attempts else 'pending'
+            updates.append((status, attempts, now + timedelta(seconds=delay), error, row['id']))
+
+        async with self.db.transaction() as db:
+            await db.executemany('''
+                                 UPDATE external_sync
+                                 SET sync_status     = ?,
+                                     attempts        = ?,
+                                     next_attempt_at = ?,
+                                     last_error      = ?
+                                 WHERE id = ?
+                                 ''', updates)
@@ -0,0 +1,258 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+
+def _resolve(future: asyncio.Future, result: Any = None, exc: Optional[BaseException] = None):
+    """Завершение future, если ожидающая сторона еще не отменила его"""
+    if future.done():
+        return
+    if exc is not None:
+        future.set_exception(exc)
+    else:
+        future.set_result(result)
+
+
+class _WriteJob:
+    """Одна транзакция в очереди записи"""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        # writer -> вызывающий: соединение выдано
+        self.granted = loop.create_future()
+        # вызывающий -> writer: тело блока завершено (None или исключение)
+        self.finished = loop.create_future()
+        # writer -> вызывающий: изменения зафиксированы или откатаны
+        self.done = loop.create_future()
+
+
+class ConnectionPool:
+    """Пул долгоживущих соединений SQLite: одно соединение на запись и N на чтение
+
+    Все записи проходят через одну задачу-писателя. Транзакции, накопившиеся
+    в очереди, пока выполнялась предыдущая, объединяются в один COMMIT
+    (group commit); каждая выполняется в своем SAVEPOINT, поэтому ошибка
+    в одной не откатывает остальные.
+    """
+
+    def __init__(self, db_path: str, readers: int = 4, pragmas: Optional[Dict[str, Any]] = None,
+                 max_batch: int = 64):
+        self.db_path = db_path
+        self.readers_count = max(1, readers)
+        self.pragmas = pragmas or {}
+        self.max_batch = max(1, max_batch)
+
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._write_task: Optional[asyncio.Task] = None
+        self._readers: List[aiosqlite.Connection] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._open_lock = asyncio.Lock()
+        self._closed = True
+
+        # Статистика group commit
+        self.commits = 0
+        self.transactions = 0
+
+    @property
+    def is_open(self) -> bool:
+        return not self._closed
+
+    def stats(self) -> Dict:
+        return {
+            'readers': self.readers_count,
+            'readers_idle': self._idle.qsize() if self._idle is not None else 0,
+            'write_queue': self._write_queue.qsize() if self._write_queue is not None else 0,
+            'commits': self.commits,
+            'transactions': self.transactions
+        }
+
+    async def _create_connection(self, writer: bool = False) -> aiosqlite.Connection:
+        """Открытие и настройка одного соединения"""
+        # Писатель управляет транзакциями сам (BEGIN/SAVEPOINT/COMMIT)
+        conn = await aiosqlite.connect(self.db_path, isolation_level=None if writer else "")
+        conn.row_factory = aiosqlite.Row
+
+        for name, value in self.pragmas.items():
+            # journal_mode хранится в файле базы, его достаточно выставить писателю
+            if name == 'journal_mode' and not writer:
+                continue
+            await conn.execute(f"PRAGMA {name} = {value}")
+
+        if not writer:
+            await conn.execute("PRAGMA query_only = ON")
+
+        return conn
+
+    async def open(self):
+        """Прогрев пула: открываем все соединения заранее"""
+        async with self._open_lock:
+            if not self._closed:
+                return
+
+            self._writer = await self._create_connection(writer=True)
+            self._write_queue = asyncio.Queue()
+            self._write_task = asyncio.create_task(self._write_loop())
+
+            self._idle = asyncio.Queue()
+            for _ in range(self.readers_count):
+                conn = await self._create_connection()
+                self._readers.append(conn)
+                self._idle.put_nowait(conn)
+
+            self._closed = False
+            logger.info(f"Пул соединений открыт: 1 writer, {self.readers_count} readers")
+
+    async def close(self):
+        """Закрытие всех соединений пула"""
+        async with self._open_lock:
+            if self._closed:
+                return
+
+            self._closed = True
+
+            # Дожидаемся записи всего, что уже стоит в очереди
+            self._write_queue.put_nowait(None)
+            await self._write_task
+            self._write_task = None
+            await self._writer.close()
+            self._writer = None
+
+            for conn in self._readers:
+                await conn.close()
+            self._readers.clear()
+            self._idle = None
+
+            logger.info(
+                f"Пул соединений закрыт: {self.transactions} транзакций, {self.commits} коммитов"
+            )
+
+    @asynccontextmanager
+    async def reader(self):
+        """Соединение для чтения из пула"""
+        if self._closed:
+            await self.open()
+
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            # Не оставляем открытых транзакций на общем соединении
+            if conn.in_transaction:
+                await conn.rollback()
+            self._idle.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self):
+        """Транзакция на запись: фиксируется при выходе из блока, откатывается при ошибке"""
+        if self._closed:
+            await self.open()
+
+        job = _WriteJob(asyncio.get_running_loop())
+        self._write_queue.put_nowait(job)
+
+        try:
+            conn = await job.granted
+        except BaseException as e:
+            _resolve(job.finished, e)
+            raise
+
+        try:
+            yield conn
+        except BaseException as e:
+            _resolve(job.finished, e)
+            await asyncio.shield(job.done)
+            raise
+        else:
+            _resolve(job.finished)
+            await asyncio.shield(job.done)
+
+    async def _write_loop(self):
+        """Задача-писатель: последовательно выполняет транзакции пачками"""
+        while True:
+            job = await self._write_queue.get()
+            if job is None:
+                break
+            if not await self._run_batch(job):
+                break
+
+    async def _run_batch(self, job: _WriteJob) -> bool:
+        """Выполнение транзакций под одним COMMIT
+
+        В пачку попадают все транзакции, пришедшие в очередь, пока выполнялись
+        предыдущие. Возвращает False, если в очереди встретился сигнал остановки.
+        """
+        conn = self._writer
+        queue = self._write_queue
+        applied = []
+        keep_running = True
+
+        try:
+            await conn.execute("BEGIN IMMEDIATE")
+        except Exception as e:
+            logger.error(f"Не удалось начать транзакцию записи: {e}")
+            _resolve(job.granted, exc=e)
+            _resolve(job.done)
+            return True
+
+        processed = 0
+        while job is not None:
+            processed += 1
+            if await self._run_job(conn, job):
+                applied.append(job)
+
+            if processed >= self.max_batch or queue.empty():
+                job = None
+            else:
+                job = queue.get_nowait()
+                if job is None:
+                    keep_running = False
+
+        try:
+            await conn.execute("COMMIT")
+        except Exception as e:
+            logger.error(f"Ошибка фиксации пачки из {len(applied)} транзакций: {e}")
+            if conn.in_transaction:
+                await conn.execute("ROLLBACK")
+            for job in applied:
+                _resolve(job.done, exc=e)
+            return keep_running
+
+        self.commits += 1
+        self.transactions += len(applied)
+        for job in applied:
+            _resolve(job.done)
+
+        return keep_running
+
+    async def _run_job(self, conn: aiosqlite.Connection, job: _WriteJob) -> bool:
+        """Выполнение одной транзакции в SAVEPOINT; True, если она ждет COMMIT"""
+        if job.granted.done():
+            # Вызывающий отменился, не дождавшись соединения
+            return False
+
+        try:
+            await conn.execute("SAVEPOINT write_job")
+        except Exception as e:
+            _resolve(job.granted, exc=e)
+            _resolve(job.done)
+            return False
+
+        job.granted.set_result(conn)
+        error = await job.finished
+
+        try:
+            if error is None:
+                await conn.execute("RELEASE SAVEPOINT write_job")
+                return True
+
+            await conn.execute("ROLLBACK TO SAVEPOINT write_job")
+            await conn.execute("RELEASE SAVEPOINT write_job")
+            _resolve(job.done)
+        except Exception as e:
+            _resolve(job.done, exc=e)
+        return False
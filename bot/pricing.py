@@ -0,0 +1,198 @@
+import logging
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from bot.database import Database
+from bot.loyalty import LevelTable, LoyaltySystem
+from bot.menu_cache import MenuSnapshot
+from config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Ограничения корзины от случайных и намеренно огромных заказов
+MAX_LINES = 50
+MAX_QUANTITY = 50
+
+
+@dataclass(frozen=True)
+class QuoteLine:
+    id: int
+    name: str
+    price: float
+    quantity: int
+    notes: Optional[str] = None
+
+    @property
+    def amount(self) -> float:
+        return self.price * self.quantity
+
+
+@dataclass(frozen=True)
+class Quote:
+    """Расчет заказа по ценам сервера
+
+    Цены берутся из снимка меню, скидка уровня - из таблицы уровней.
+    Клиентские price и total не используются. problems - причины, по
+    которым заказ оформить нельзя (пустой список - можно).
+    """
+    menu_version: int
+    delivery_type: str
+    lines: Tuple[QuoteLine, ...]
+    subtotal: float
+    delivery_fee: float
+    level: str
+    level_discount_percent: int
+    level_discount: float
+    points_used: int
+    points_discount: float
+    total: float
+    points_earned: int
+    problems: Tuple[str, ...] = ()
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+    def to_dict(self) -> Dict:
+        data = asdict(self)
+        data['ok'] = self.ok
+        for line, source in zip(data['lines'], self.lines):
+            line['amount'] = source.amount
+        return data
+
+    def apply(self, order_data: Dict) -> Dict:
+        """Данные заказа с позициями и суммами из расчета (для сообщений и create_order)"""
+        return {
+            **order_data,
+            'deliveryType': self.delivery_type,
+            'items': [asdict(line) for line in self.lines],
+            'subtotal': self.subtotal,
+            'deliveryFee': self.delivery_fee,
+            'discount': self.level_discount + self.points_discount,
+            'pointsUsed': self.points_used,
+            'total': self.total
+        }
+
+
+def _money(value: float) -> float:
+    return round(value, 2)
+
+
+def price_cart(snapshot: MenuSnapshot, levels: LevelTable, items: Iterable[Dict],
+               delivery_type: str = 'pickup', balance: int = 0, points_to_use: int = 0) -> Quote:
+    """Расчет корзины без обращений к базе
+
+    items - позиции вида {'id', 'quantity', 'notes'}; остальные поля
+    (в том числе price) игнорируются.
+    """
+    problems = []
+    lines = []
+
+    for item in list(items)[:MAX_LINES + 1]:
+        if len(lines) >= MAX_LINES:
+            problems.append(f"Не больше {MAX_LINES} позиций в заказе")
+            break
+
+        try:
+            item_id = int(item['id'])
+            quantity = int(item.get('quantity', 1))
+        except (KeyError, TypeError, ValueError):
+            problems.append("Некорректная позиция в корзине")
+            continue
+
+        menu_item = snapshot.by_id.get(item_id)
+        if menu_item is None:
+            problems.append(f"Позиция {item.get('name') or item_id} недоступна")
+            continue
+        if not 1 <= quantity <= MAX_QUANTITY:
+            problems.append(f"Количество «{menu_item['name']}» должно быть от 1 до {MAX_QUANTITY}")
+            continue
+
+        lines.append(QuoteLine(
+            id=item_id,
+            name=menu_item['name'],
+            price=menu_item['price'],
+            quantity=quantity,
+            notes=item.get('notes')
+        ))
+
+    if not lines and not problems:
+        problems.append("Корзина пуста")
+
+    subtotal = _money(sum(line.amount for line in lines))
+
+    delivery_type = 'delivery' if delivery_type == 'delivery' else 'pickup'
+    delivery_fee = 0
+    if delivery_type == 'delivery':
+        if subtotal < settings.MIN_ORDER:
+            problems.append(f"Минимальная сумма заказа на доставку {settings.MIN_ORDER}₽")
+        if subtotal < settings.FREE_DELIVERY_FROM:
+            delivery_fee = settings.DELIVERY_FEE
+
+    level = levels.level_info(balance)
+    level_discount = _money(subtotal * level['discount'] / 100)
+
+    # Баллами можно оплатить остаток после скидки уровня, но не больше баланса
+    points_to_use = max(0, min(int(points_to_use or 0), balance))
+    payable = subtotal - level_discount
+    points_used = min(points_to_use, int(payable * settings.POINTS_REDEEM_RATE))
+    points_used -= points_used % settings.POINTS_REDEEM_RATE
+    points_discount = _money(points_used / settings.POINTS_REDEEM_RATE)
+
+    total = _money(subtotal - level_discount - points_discount + delivery_fee)
+    points_earned = int(total * settings.POINTS_PER_RUBLE) if settings.LOYALTY_ENABLED else 0
+
+    return Quote(
+        menu_version=snapshot.version,
+        delivery_type=delivery_type,
+        lines=tuple(lines),
+        subtotal=subtotal,
+        delivery_fee=delivery_fee,
+        level=level['name'],
+        level_discount_percent=level['discount'],
+        level_discount=level_discount,
+        points_used=points_used,
+        points_discount=points_discount,
+        total=total,
+        points_earned=points_earned,
+        problems=tuple(problems)
+    )
+
+
+class PricingEngine:
+    """Расчет заказов: снимок меню и уровни из кэша, один запрос баланса"""
+
+    def __init__(self, db: Database, loyalty: LoyaltySystem):
+        self.db = db
+        self.loyalty = loyalty
+        self._no_levels = LevelTable(())
+
+    async def quote(self, items: Iterable[Dict], delivery_type: str = 'pickup', points_to_use: int = 0,
+                    telegram_id: Optional[int] = None, user_id: Optional[int] = None) -> Quote:
+        """Расчет корзины пользователя (по telegram_id или users.id)"""
+        snapshot = await self.db.get_menu()
+
+        if settings.LOYALTY_ENABLED:
+            levels = await self.loyalty.get_levels()
+            if user_id is not None:
+                balance = await self.loyalty.get_points_by_user_id(user_id)
+            elif telegram_id is not None:
+                balance = await self.loyalty.get_user_points(telegram_id)
+            else:
+                balance = 0
+        else:
+            levels, balance, points_to_use = self._no_levels, 0, 0
+
+        return price_cart(snapshot, levels, items, delivery_type, balance, points_to_use)
+
+    async def quote_order(self, telegram_id: int, order_data: Dict) -> Quote:
+        """Расчет заказа из данных Web App"""
+        delivery = order_data.get('delivery') or {}
+        loyalty = order_data.get('loyalty') or {}
+
+        return await self.quote(
+            order_data.get('items') or [],
+            delivery_type=order_data.get('deliveryType') or delivery.get('type', 'pickup'),
+            points_to_use=loyalty.get('pointsUsed', 0) if loyalty.get('usePoints') else 0,
+            telegram_id=telegram_id
+        )
@@ -0,0 +1,125 @@
+import asyncio
+import inspect
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Deque, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def update_key(update: object) -> Optional[int]:
+    """Ключ упорядочивания: пользователь, иначе чат; None - порядок не важен"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+
+class UpdateScheduler(BaseUpdateProcessor):
+    """Планировщик апдейтов: разные пользователи параллельно, один - по порядку
+
+    У каждого пользователя своя очередь; апдейт, ожидающий предыдущих
+    апдейтов того же пользователя, не занимает обработчик. Одновременно
+    выполняется не больше workers апдейтов, принято к обработке - не
+    больше max_queued (дальше PTB придерживает апдейты сам).
+    """
+
+    def __init__(self, workers: int, max_queued: int = 10000, wait_warning: float = 5.0):
+        super().__init__(max_queued)
+        self.workers = workers
+        self.wait_warning = wait_warning
+        self._slots = asyncio.Semaphore(workers)
+        self._queues: Dict[Hashable, Deque[asyncio.Future]] = {}
+
+        self.accepted = 0
+        self.running = 0
+        self.processed = 0
+        self.peak_waiting = 0
+        self._wait_times: Deque[float] = deque(maxlen=1000)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        queued_at = time.perf_counter()
+        self.accepted += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            key = update_key(update)
+            if key is None:
+                await self._execute(coroutine, queued_at)
+            else:
+                await self._execute_in_turn(key, coroutine, queued_at)
+        finally:
+            self.accepted -= 1
+            # Апдейт отменили до запуска обработчика
+            if inspect.iscoroutine(coroutine) and inspect.getcoroutinestate(coroutine) == inspect.CORO_CREATED:
+                coroutine.close()
+
+    async def _execute_in_turn(self, key: Hashable, coroutine: Awaitable[Any], queued_at: float):
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+
+        turn = asyncio.get_running_loop().create_future()
+        if not queue:
+            turn.set_result(None)
+        queue.append(turn)
+
+        try:
+            await turn
+            await self._execute(coroutine, queued_at)
+        finally:
+            if queue[0] is turn:
+                queue.popleft()
+                # Передаем очередь следующему апдейту пользователя
+                if queue:
+                    if not queue[0].done():
+                        queue[0].set_result(None)
+                else:
+                    del self._queues[key]
+            else:
+                queue.remove(turn)
+
+    async def _execute(self, coroutine: Awaitable[Any], queued_at: float):
+        async with self._slots:
+            waited = time.perf_counter() - queued_at
+            self._wait_times.append(waited)
+            if waited > self.wait_warning:
+                logger.warning(f"Апдейт ждал обработки {waited:.1f}s, в очереди {self.waiting}")
+
+            self.running += 1
+            try:
+                await coroutine
+            finally:
+                self.running -= 1
+                self.processed += 1
+
+    @property
+    def waiting(self) -> int:
+        """Апдейты, принятые, но еще не запущенные"""
+        return self.accepted - self.running
+
+    def stats(self) -> Dict:
+        waits = sorted(self._wait_times)
+        return {
+            'workers': self.workers,
+            'running': self.running,
+            'waiting': self.waiting,
+            'peak_waiting': self.peak_waiting,
+            'users_queued': len(self._queues),
+            'max_user_depth': max((len(queue) for queue in self._queues.values()), default=0),
+            'processed': self.processed,
+            'wait_p50': waits[len(waits) // 2] if waits else 0.0,
+            'wait_p99': waits[int(len(waits) * 0.99)] if waits else 0.0
+        }
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
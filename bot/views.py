@@ -0,0 +1,192 @@
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
+
+from bot.menu_cache import MenuSnapshot
+from config.settings import settings
+
+DEFAULT_LOCALE = 'ru'
+DEFAULT_EMOJI = '📋'
+CATEGORY_PREVIEW = 5
+
+# Тексты экранов по локалям; недостающая локаль берется из DEFAULT_LOCALE
+TEXTS: Dict[str, Dict[str, str]] = {
+    'ru': {
+        'welcome_title': "\n🎉 *Добро пожаловать в {shop}!* ☕\n\n",
+        'welcome_greeting': "*Мы рады видеть вас, {name}!*\n",
+        'welcome_body': (
+            "\n✨ *Наши преимущества:*\n"
+            "• 🚀 Быстрое приготовление\n"
+            "• 🌱 Свежие ингредиенты\n"
+            "• 💫 Авторские рецепты\n"
+            "• 🎁 Программа лояльности\n"
+            "\n📱 *Используйте кнопку \"🛒 Заказать\" или команды ниже:*\n"
+        ),
+        'view_menu': "📋 Посмотреть меню",
+        'open_app': "🛒 Открыть Mini App",
+        'profile': "👤 Мой профиль",
+        'balance': "💎 Баланс баллов",
+        'my_orders': "📦 Мои заказы",
+        'favorites': "⭐ Избранное",
+        'promotions': "🏆 Акции",
+        'contacts': "📍 Контакты",
+        'menu_title': "☕ *Наше меню*\n\nВыберите категорию:",
+        'menu_app': "🛒 Открыть полное меню в Mini App",
+        'menu_app_short': "🛒 Открыть полное меню",
+        'category_item': "• *{name}* - {price}₽\n",
+        'category_more': "\n...и еще {count} позиций",
+        'category_app': "🛒 Открыть в Mini App",
+        'back': "⬅️ Назад"
+    }
+}
+
+
+def resolve_locale(language_code: Optional[str]) -> str:
+    """Локаль экранов по языку пользователя Telegram"""
+    if language_code:
+        language = language_code.split('-', 1)[0].lower()
+        if language in TEXTS:
+            return language
+    return DEFAULT_LOCALE
+
+
+@dataclass(frozen=True)
+class Screen:
+    """Готовое сообщение: текст и клавиатура"""
+    text: str
+    reply_markup: InlineKeyboardMarkup
+
+
+class ScreenCache:
+    """Экраны бота, собранные один раз на версию меню и локаль
+
+    Обработчики получают готовые текст и клавиатуру вместо сборки
+    на каждый вызов. Экраны меню сбрасываются при смене снимка меню
+    (invalidate кэша меню или загрузка без кэша), остальные от меню
+    не зависят и живут до перезапуска.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._snapshot: Optional[MenuSnapshot] = None
+        self._menu_screens: Dict[Hashable, Screen] = {}
+        self._static: Dict[Hashable, object] = {}
+
+        self.hits = 0
+        self.builds = 0
+
+    async def _current(self) -> MenuSnapshot:
+        snapshot = await self.db.get_menu()
+        if snapshot is not self._snapshot:
+            self._menu_screens = {}
+            self._snapshot = snapshot
+        return snapshot
+
+    def _cached(self, key: Hashable, build) -> Screen:
+        screen = self._menu_screens.get(key)
+        if screen is None:
+            screen = self._menu_screens[key] = build()
+            self.builds += 1
+        else:
+            self.hits += 1
+        return screen
+
+    def welcome(self, first_name: str, locale: str = DEFAULT_LOCALE) -> Screen:
+        """Приветствие /start: имя подставляется в готовый текст"""
+        key = ('welcome', locale)
+        parts = self._static.get(key)
+        if parts is None:
+            parts = self._static[key] = self._build_welcome(TEXTS[locale])
+            self.builds += 1
+        else:
+            self.hits += 1
+
+        head, greeting, tail, reply_markup = parts
+        return Screen(head + greeting.format(name=first_name) + tail, reply_markup)
+
+    async def menu(self, locale: str = DEFAULT_LOCALE, inline: bool = False) -> Screen:
+        """Категории меню; inline - вариант для редактирования сообщения из callback"""
+        snapshot = await self._current()
+        return self._cached(
+            ('menu', locale, inline),
+            lambda: self._build_menu(snapshot, TEXTS[locale], inline)
+        )
+
+    async def category(self, category: str, locale: str = DEFAULT_LOCALE) -> Screen:
+        """Первые позиции категории"""
+        snapshot = await self._current()
+        if category not in snapshot.by_category:
+            # callback_data приходит от клиента: неизвестные категории не кэшируем
+            return self._build_category(snapshot, TEXTS[locale], category)
+        return self._cached(
+            ('category', locale, category),
+            lambda: self._build_category(snapshot, TEXTS[locale], category)
+        )
+
+    @staticmethod
+    def _build_welcome(texts: Dict[str, str]):
+        reply_markup = InlineKeyboardMarkup([
+            [
+                InlineKeyboardButton(texts['view_menu'], callback_data="view_menu"),
+                InlineKeyboardButton(texts['open_app'], web_app=WebAppInfo(url=settings.WEBAPP_URL))
+            ],
+            [
+                InlineKeyboardButton(texts['profile'], callback_data="profile"),
+                InlineKeyboardButton(texts['balance'], callback_data="balance")
+            ],
+            [
+                InlineKeyboardButton(texts['my_orders'], callback_data="my_orders"),
+                InlineKeyboardButton(texts['favorites'], callback_data="favorites")
+            ],
+            [
+                InlineKeyboardButton(texts['promotions'], callback_data="promotions"),
+                InlineKeyboardButton(texts['contacts'], callback_data="contacts")
+            ]
+        ])
+        head = texts['welcome_title'].format(shop=settings.SHOP_NAME)
+        return head, texts['welcome_greeting'], texts['welcome_body'], reply_markup
+
+    @staticmethod
+    def _build_menu(snapshot: MenuSnapshot, texts: Dict[str, str], inline: bool) -> Screen:
+        keyboard = [
+            [InlineKeyboardButton(
+                f"{snapshot.emojis.get(category) or DEFAULT_EMOJI} {category.capitalize()}",
+                callback_data=f"category_{category}"
+            )]
+            for category in snapshot.categories
+        ]
+        keyboard.append([InlineKeyboardButton(
+            texts['menu_app_short' if inline else 'menu_app'],
+            web_app=WebAppInfo(url=settings.WEBAPP_URL)
+        )])
+        return Screen(texts['menu_title'], InlineKeyboardMarkup(keyboard))
+
+    @staticmethod
+    def _build_category(snapshot: MenuSnapshot, texts: Dict[str, str], category: str) -> Screen:
+        items = snapshot.by_category.get(category, ())
+        emoji = snapshot.emojis.get(category) or DEFAULT_EMOJI
+
+        text = f"{emoji} *{category.capitalize()}*\n\n"
+        text += "".join(
+            texts['category_item'].format(name=item['name'], price=item['price'])
+            for item in items[:CATEGORY_PREVIEW]
+        )
+        if len(items) > CATEGORY_PREVIEW:
+            text += texts['category_more'].format(count=len(items) - CATEGORY_PREVIEW)
+
+        reply_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton(texts['category_app'], web_app=WebAppInfo(
+                url=f"{settings.WEBAPP_URL}/?category={category}"
+            ))],
+            [InlineKeyboardButton(texts['back'], callback_data="view_menu")]
+        ])
+        return Screen(text, reply_markup)
+
+    def stats(self) -> Dict:
+        return {
+            'menu_version': self._snapshot.version if self._snapshot is not None else None,
+            'menu_screens': len(self._menu_screens),
+            'hits': self.hits,
+            'builds': self.builds
+        }
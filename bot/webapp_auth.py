@@ -0,0 +1,191 @@
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl
+
+
+class InitDataError(ValueError):
+    """Некорректные или поддельные initData из Telegram Mini App"""
+
+
+def derive_secret_key(bot_token: str) -> bytes:
+    """Ключ проверки initData: HMAC_SHA256("WebAppData", bot_token)"""
+    return hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+
+
+def _check_signature(init_data: str, secret_key: bytes) -> Tuple[Dict, str]:
+    """Проверка подписи; возвращает поля initData без hash и сам hash"""
+    if not init_data:
+        raise InitDataError("initData отсутствует")
+
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received_hash = fields.pop('hash', None)
+    if not received_hash:
+        raise InitDataError("В initData нет hash")
+
+    data_check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+    expected_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+
+    if not hmac.compare_digest(expected_hash, received_hash):
+        raise InitDataError("Неверная подпись initData")
+
+    if 'user' in fields:
+        try:
+            fields['user'] = json.loads(fields['user'])
+        except ValueError:
+            raise InitDataError("Некорректное поле user в initData")
+
+    return fields, received_hash
+
+
+def verify_init_data(init_data: str, bot_token: str) -> Dict:
+    """Проверка подписи initData по алгоритму Telegram
+
+    Возвращает поля initData, поле user - уже разобранный JSON.
+    """
+    fields, _ = _check_signature(init_data, derive_secret_key(bot_token))
+    return fields
+
+
+@dataclass
+class WebAppUser:
+    """Пользователь Mini App из проверенных initData"""
+    telegram_id: int
+    auth_date: int
+    data: Dict = field(repr=False)
+    # users.id - определяется один раз за сессию Mini App
+    user_id: Optional[int] = None
+
+
+class InitDataVerifier:
+    """Проверка initData с кешем успешных проверок
+
+    Ключ бота превращается в секрет один раз. Проверенная строка initData
+    кешируется по hash на ttl секунд (но не дольше срока жизни auth_date),
+    поэтому повторные запросы открытой Mini App не считают HMAC заново.
+    Неудачные проверки не кешируются.
+    """
+
+    def __init__(self, bot_token: str, max_age: int = 86400, ttl: int = 300, max_entries: int = 10000):
+        self._secret_key = derive_secret_key(bot_token)
+        self.max_age = max_age
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # hash -> (строка initData, пользователь, когда истекает)
+        self._cache: "OrderedDict[str, Tuple[str, WebAppUser, float]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def verify(self, init_data: Optional[str]) -> WebAppUser:
+        now = time.time()
+        received_hash = self._extract_hash(init_data)
+
+        cached = self._cache.get(received_hash) if received_hash else None
+        if cached is not None:
+            cached_init_data, user, expires_at = cached
+            # Сравниваем всю строку: совпадение одного hash ничего не доказывает
+            if cached_init_data == init_data and now < expires_at:
+                self._cache.move_to_end(received_hash)
+                self.hits += 1
+                return user
+            del self._cache[received_hash]
+
+        self.misses += 1
+        fields, received_hash = _check_signature(init_data, self._secret_key)
+
+        try:
+            auth_date = int(fields.get('auth_date', ''))
+        except ValueError:
+            raise InitDataError("В initData нет auth_date")
+        if self.max_age and now - auth_date > self.max_age:
+            raise InitDataError("initData устарели")
+
+        user_data = fields.get('user')
+        if not isinstance(user_data, dict) or 'id' not in user_data:
+            raise InitDataError("В initData нет пользователя")
+
+        user = WebAppUser(telegram_id=int(user_data['id']), auth_date=auth_date, data=user_data)
+
+        expires_at = now + self.ttl
+        if self.max_age:
+            expires_at = min(expires_at, auth_date + self.max_age)
+        self._cache[received_hash] = (init_data, user, expires_at)
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+        return user
+
+    @staticmethod
+    def _extract_hash(init_data: Optional[str]) -> Optional[str]:
+        """hash из строки initData без полного разбора"""
+        if not init_data:
+            return None
+        start = init_data.find('hash=')
+        while start > 0 and init_data[start - 1] != '&':
+            start = init_data.find('hash=', start + 1)
+        if start < 0:
+            return None
+        end = init_data.find('&', start)
+        return init_data[start + 5:end if end >= 0 else None]
+
+    def stats(self) -> Dict:
+        return {'entries': len(self._cache), 'hits': self.hits, 'misses': self.misses}
+
+
+class LinkTokenError(ValueError):
+    """Неизвестный, устаревший или чужой токен ссылки"""
+
+
+class LinkTokens:
+    """Короткоживущие токены для адресов, куда нельзя передать заголовок
+
+    EventSource и ссылки на скачивание не отправляют X-Telegram-Init-Data,
+    а initData в строке запроса оседает в журналах доступа и истории
+    браузера. Токен выдается по запросу с заголовком, привязан к
+    пользователю и назначению (purpose) и живет ttl секунд; single_use
+    гасится при первом предъявлении.
+    """
+
+    def __init__(self, ttl: int = 60, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # токен -> (назначение, пользователь, когда истекает, одноразовый)
+        self._tokens: "OrderedDict[str, Tuple[str, WebAppUser, float, bool]]" = OrderedDict()
+
+        self.issued = 0
+        self.rejected = 0
+
+    def issue(self, user: WebAppUser, purpose: str, single_use: bool = False) -> str:
+        now = time.time()
+        # Срок у всех токенов одинаковый, так что истекшие - в начале словаря
+        while self._tokens and next(iter(self._tokens.values()))[2] <= now:
+            self._tokens.popitem(last=False)
+
+        token = secrets.token_urlsafe(24)
+        self._tokens[token] = (purpose, user, now + self.ttl, single_use)
+        if len(self._tokens) > self.max_entries:
+            self._tokens.popitem(last=False)
+        self.issued += 1
+        return token
+
+    def redeem(self, token: Optional[str], purpose: str) -> WebAppUser:
+        """Пользователь токена; LinkTokenError, если токен не подходит для purpose"""
+        entry = self._tokens.get(token) if token else None
+        if entry is None or entry[0] != purpose or entry[2] <= time.time():
+            self.rejected += 1
+            raise LinkTokenError("Ссылка недействительна или устарела")
+
+        if entry[3]:
+            del self._tokens[token]
+        return entry[1]
+
+    def stats(self) -> Dict:
+        return {'entries': len(self._tokens), 'issued': self.issued, 'rejected': self.rejected}
@@ -1,6 +1,7 @@
 import os
 import json
-from dataclasses import dataclass
+import re
+from dataclasses import dataclass, field
 from typing import Optional
 from dotenv import load_dotenv
 
@@ -11,29 +12,66 @@ load_dotenv()
 class Settings:
     # Бот
     BOT_TOKEN: str = os.getenv("BOT_TOKEN", "")
-    ADMIN_IDS: list = json.loads(os.getenv("ADMIN_IDS", "[]"))
+    ADMIN_IDS: list = field(default_factory=lambda: json.loads(os.getenv("ADMIN_IDS", "[]")))
     ORDER_CHAT_ID: str = os.getenv("ORDER_CHAT_ID", "")
+    NOTIFY_GLOBAL_RATE: float = float(os.getenv("NOTIFY_GLOBAL_RATE", "25"))  # сообщений в секунду на бота
+    NOTIFY_CHAT_RATE: float = float(os.getenv("NOTIFY_CHAT_RATE", "1"))  # сообщений в секунду на чат
+    NOTIFY_MAX_RETRIES: int = int(os.getenv("NOTIFY_MAX_RETRIES", "3"))
 
     # Web App
     WEBAPP_URL: str = os.getenv("WEBAPP_URL", "http://localhost:8080")
     ADMIN_PANEL_URL: str = os.getenv("ADMIN_PANEL_URL", f"{WEBAPP_URL}/admin")
+    API_ENABLED: bool = os.getenv("API_ENABLED", "true").lower() == "true"
+    API_HOST: str = os.getenv("API_HOST", "0.0.0.0")
+    API_PORT: int = int(os.getenv("API_PORT", "8080"))
+    WEBAPP_AUTH_MAX_AGE: int = int(os.getenv("WEBAPP_AUTH_MAX_AGE", "86400"))  # секунды с auth_date
+    WEBAPP_AUTH_CACHE_TTL: int = int(os.getenv("WEBAPP_AUTH_CACHE_TTL", "300"))
+    WEBAPP_AUTH_CACHE_SIZE: int = int(os.getenv("WEBAPP_AUTH_CACHE_SIZE", "10000"))
+    SSE_KEEPALIVE: float = float(os.getenv("SSE_KEEPALIVE", "15"))  # секунды между keepalive
+    LINK_TOKEN_TTL: int = int(os.getenv("LINK_TOKEN_TTL", "60"))  # секунд жизни токена в адресе (SSE, выгрузки)
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"  # /metrics и замеры
+    METRICS_TOKEN: Optional[str] = os.getenv("METRICS_TOKEN")  # Bearer-токен для /metrics, без него не публикуется
+
+    # Получение апдейтов: polling или webhook (через тот же сервер, что и API)
+    BOT_MODE: str = os.getenv("BOT_MODE", "polling")
+    WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", WEBAPP_URL)
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+    WEBHOOK_SECRET: Optional[str] = os.getenv("WEBHOOK_SECRET")  # обязателен в режиме webhook
+    UPDATES_MAX_CONCURRENT: int = int(os.getenv("UPDATES_MAX_CONCURRENT", "64"))  # обработчиков одновременно
+    UPDATES_MAX_QUEUED: int = int(os.getenv("UPDATES_MAX_QUEUED", "10000"))
+    UPDATES_WAIT_WARNING: float = float(os.getenv("UPDATES_WAIT_WARNING", "5"))  # секунды ожидания
 
     # Внешние интеграции (можно отключить)
     EXTERNAL_MENU_API: Optional[str] = os.getenv("EXTERNAL_MENU_API")
     EXTERNAL_LOYALTY_API: Optional[str] = os.getenv("EXTERNAL_LOYALTY_API")
     SYNC_ENABLED: bool = os.getenv("SYNC_ENABLED", "false").lower() == "true"
+    MENU_SYNC_INTERVAL: float = float(os.getenv("MENU_SYNC_INTERVAL", "300"))  # секунд
+    MENU_SYNC_BATCH: int = int(os.getenv("MENU_SYNC_BATCH", "500"))  # позиций выгрузки на транзакцию
+    EXPORT_PAGE_SIZE: int = int(os.getenv("EXPORT_PAGE_SIZE", "5000"))  # строк на страницу выгрузки
+    LOYALTY_LEVELS_CHECK_INTERVAL: float = float(os.getenv("LOYALTY_LEVELS_CHECK_INTERVAL", "1"))  # секунд
+    OUTBOX_BATCH: int = int(os.getenv("OUTBOX_BATCH", "50"))
+    OUTBOX_INTERVAL: float = float(os.getenv("OUTBOX_INTERVAL", "5"))  # секунд
+    OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+
+    # Отложенная запись last_active и профиля пользователей
+    ACTIVITY_FLUSH_INTERVAL: float = float(os.getenv("ACTIVITY_FLUSH_INTERVAL", "5"))  # секунд
+    ACTIVITY_MAX_PENDING: int = int(os.getenv("ACTIVITY_MAX_PENDING", "5000"))
 
     # Программа лояльности
     LOYALTY_ENABLED: bool = os.getenv("LOYALTY_ENABLED", "true").lower() == "true"
     POINTS_PER_RUBLE: float = float(os.getenv("POINTS_PER_RUBLE", "1"))
     RUBLES_PER_POINT: float = float(os.getenv("RUBLES_PER_POINT", "100"))
+    POINTS_REDEEM_RATE: int = int(os.getenv("POINTS_REDEEM_RATE", "100"))  # баллов за 1₽ скидки
+    LOYALTY_RECONCILE_HOURS: float = float(os.getenv("LOYALTY_RECONCILE_HOURS", "24"))
 
     # Кофейня
     SHOP_NAME: str = os.getenv("SHOP_NAME", "Coffee Bliss")
     SHOP_ADDRESS: str = os.getenv("SHOP_ADDRESS", "ул. Кофейная, 15")
     SHOP_PHONE: str = os.getenv("SHOP_PHONE", "+7 (999) 123-45-67")
     DELIVERY_FEE: int = int(os.getenv("DELIVERY_FEE", "150"))
-    MIN_ORDER: int = int(os.getenv("MIN_ORDER", "300"))
+    MIN_ORDER: int = int(os.getenv("MIN_ORDER", "300"))  # минимальная сумма доставки
+    FREE_DELIVERY_FROM: int = int(os.getenv("FREE_DELIVERY_FROM", "500"))
+    ORDER_DEDUP_TTL: int = int(os.getenv("ORDER_DEDUP_TTL", "600"))  # секунды
 
     # Время работы
     OPENING_TIME: str = os.getenv("OPENING_TIME", "08:00")
@@ -41,10 +79,24 @@ class Settings:
 
     # База данных
     DATABASE_PATH: str = os.getenv("DATABASE_PATH", "coffee_shop.db")
+    DB_POOL_READERS: int = int(os.getenv("DB_POOL_READERS", "4"))
+    DB_JOURNAL_MODE: str = os.getenv("DB_JOURNAL_MODE", "WAL")
+    DB_SYNCHRONOUS: str = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+    DB_MMAP_SIZE: int = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+    DB_CACHE_SIZE: int = int(os.getenv("DB_CACHE_SIZE", "-65536"))  # отрицательное значение - в KiB
+    DB_BUSY_TIMEOUT: int = int(os.getenv("DB_BUSY_TIMEOUT", "5000"))  # мс
+    DB_WRITE_BATCH: int = int(os.getenv("DB_WRITE_BATCH", "64"))
+    MENU_CACHE_ENABLED: bool = os.getenv("MENU_CACHE_ENABLED", "true").lower() == "true"
 
     def validate(self):
         if not self.BOT_TOKEN:
             raise ValueError("BOT_TOKEN не установлен")
+        if self.BOT_MODE == 'webhook':
+            # Без секрета любой, кто знает адрес, может прислать поддельный апдейт
+            if not self.WEBHOOK_SECRET:
+                raise ValueError("WEBHOOK_SECRET обязателен в режиме webhook")
+            if not re.fullmatch(r'[A-Za-z0-9_-]{1,256}', self.WEBHOOK_SECRET):
+                raise ValueError("WEBHOOK_SECRET: 1-256 символов A-Z, a-z, 0-9, _ и -")
         return self
 
 
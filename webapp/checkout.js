@@ -21,11 +21,21 @@ let orderData = {
         pointsUsed: 0,
         discount: 0
     },
-    notes: ''
+    notes: '',
+    // Один ключ на оформление: повторная отправка не создаст второй заказ
+    idempotencyKey: newOrderKey()
 };
 let loyaltyPoints = 0;
 let loyaltyLevel = null;
 
+// Ключ идемпотентности заказа
+function newOrderKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+}
+
 // Инициализация при загрузке
 document.addEventListener('DOMContentLoaded', async function() {
     // Загружаем данные пользователя из Telegram
@@ -319,6 +329,49 @@ function calculateTotals() {
     // Обновляем цену доставки в выборе
     document.getElementById('delivery-price').textContent =
         subtotal >= 500 ? 'Бесплатно' : '150₽';
+
+    // Итоговые суммы считает сервер
+    requestQuote();
+}
+
+// Расчет заказа на сервере: цены меню, доставка, скидка уровня и баллы
+let quoteRequestId = 0;
+async function requestQuote() {
+    const requestId = ++quoteRequestId;
+
+    try {
+        const response = await fetch('/api/cart/quote', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-Telegram-Init-Data': tg.initData
+            },
+            body: JSON.stringify({
+                items: cart.map(item => ({ id: item.id, quantity: item.quantity })),
+                delivery_type: orderData.delivery.type,
+                points_to_use: orderData.loyalty.usePoints ? orderData.loyalty.pointsUsed : 0
+            })
+        });
+
+        // Пока ждали ответ, корзину могли изменить
+        if (!response.ok || requestId !== quoteRequestId) return;
+
+        const quote = await response.json();
+        const discount = quote.level_discount + quote.points_discount;
+
+        document.getElementById('summary-subtotal').textContent = quote.subtotal + '₽';
+        document.getElementById('summary-delivery').textContent =
+            quote.delivery_fee === 0 ? 'Бесплатно' : quote.delivery_fee + '₽';
+        document.getElementById('summary-total').textContent = quote.total + '₽';
+
+        const discountRow = document.getElementById('discount-row');
+        discountRow.style.display = discount > 0 ? 'flex' : 'none';
+        document.getElementById('summary-discount').textContent = `-${discount}₽`;
+
+        orderData.quote = quote;
+    } catch (error) {
+        console.error('Ошибка расчета заказа:', error);
+    }
 }
 
 // Обновление сводки заказа
@@ -567,6 +620,7 @@ async function submitOrder() {
         },
         loyalty: orderData.loyalty,
         notes: orderData.notes,
+        idempotencyKey: orderData.idempotencyKey,
         items: cart.map(item => ({
             id: item.id,
             name: item.name,